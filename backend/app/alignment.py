@@ -0,0 +1,264 @@
+"""
+Measure alignment between the MusicXML score and the MIDI timeline
+
+Practice sections are given in measures and beats of the MIDI timeline,
+while singers read measure numbers off the score, which may have a pickup,
+repeats and gaps in its numbering. The alignment index relates the two and
+is stored as songs/<id>/alignment.json next to config.json:
+
+- bars: start tick, beats and ticks per beat of every MIDI measure, so
+  measure/beat positions resolve with a list lookup
+- score: every measure of the score in performance order (repeats unfolded
+  when that matches the MIDI length better) with its number, its tick
+  range and the pass through a repeat, plus a cross-check of the score's
+  bar lines against the MIDI bar lines
+
+The index is keyed by the hashes of both files. Re-uploading one of them
+rebuilds it from the other file's cached data: the score side comes from
+the processed score's measure table and the MIDI side from the analysis
+sidecar, so neither file is parsed again.
+"""
+import json
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from fractions import Fraction
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.score_processing import load_score_manifest
+from app.storage.locking import atomic_write_text
+from app.timeline import Timeline, load_timeline
+
+ALIGNMENT_FILENAME = "alignment.json"
+ALIGNMENT_VERSION = 1
+
+# Upper bound for unfolded repeats relative to the notated length
+MAX_UNFOLD_FACTOR = 8
+
+
+def unfold_repeats(table: List[Dict[str, Any]]) -> List[Tuple[int, int]]:
+    """
+    Performance order of a measure table as (measure index, pass) pairs,
+    following repeat barlines and volta endings
+    """
+    order: List[Tuple[int, int]] = []
+    repeats_done: Dict[int, int] = {}
+    section_start = 0
+    passno = 1
+    i = 0
+    while i < len(table) and len(order) < MAX_UNFOLD_FACTOR * len(table):
+        measure = table[i]
+        if measure["repeat_forward"] and passno == 1:
+            section_start = i
+        if measure["endings"] and passno not in measure["endings"]:
+            i += 1
+            continue
+
+        order.append((i, passno))
+        times = measure["repeat_backward"]
+        if times and repeats_done.get(i, 0) < times - 1:
+            repeats_done[i] = repeats_done.get(i, 0) + 1
+            passno += 1
+            i = section_start
+            continue
+        last_of_ending = measure["endings"] and (
+            i + 1 == len(table) or table[i + 1]["endings"] != measure["endings"]
+        )
+        if times or last_of_ending:
+            passno = 1
+            section_start = i + 1
+        i += 1
+    return order
+
+
+def _bars(timeline: Timeline) -> List[List[int]]:
+    bars = []
+    for measure in range(1, timeline.measure_count + 1):
+        segment = timeline.meter_at_measure(measure)
+        bars.append([timeline.measure_beat_to_tick(measure), segment.numerator, segment.ticks_per_beat])
+    return bars
+
+
+def _align_score(timeline: Timeline, bars: List[List[int]], table: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Map score measures onto ticks and cross-check them with the MIDI bar lines"""
+    def length_ticks(order: List[Tuple[int, int]]) -> Fraction:
+        return sum((Fraction(table[i]["quarters"]) for i, _ in order), Fraction(0)) * timeline.ticks_per_beat
+
+    folded = [(i, 1) for i in range(len(table))]
+    unfolded = unfold_repeats(table)
+    order = folded
+    if len(unfolded) != len(folded) and (
+        abs(length_ticks(unfolded) - timeline.length_ticks) < abs(length_ticks(folded) - timeline.length_ticks)
+    ):
+        order = unfolded
+
+    measures = []
+    tick = Fraction(0)
+    for i, passno in order:
+        end = tick + Fraction(table[i]["quarters"]) * timeline.ticks_per_beat
+        measures.append({
+            "number": table[i]["number"],
+            "position": i + 1,
+            "pass": passno,
+            "start_tick": round(tick),
+            "end_tick": round(end),
+            "implicit": table[i]["implicit"]
+        })
+        tick = end
+
+    bar_ticks = {bar[0] for bar in bars}
+    mismatched = sum(
+        1 for measure in measures
+        if measure["start_tick"] < timeline.length_ticks and measure["start_tick"] not in bar_ticks
+    )
+    difference = round(tick) - timeline.length_ticks
+    last_bar_ticks = bars[-1][1] * bars[-1][2] if bars else 0
+    return {
+        "unfolded": order is unfolded,
+        "length_ticks": round(tick),
+        "length_difference_ticks": difference,
+        "mismatched_bar_lines": mismatched,
+        "aligned": mismatched == 0 and abs(difference) <= last_bar_ticks,
+        "measures": measures
+    }
+
+
+def build_alignment(
+    timeline: Timeline,
+    midi_sha256: Optional[str],
+    manifest: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Alignment document for a MIDI timeline and (optionally) a processed score"""
+    bars = _bars(timeline)
+    return {
+        "version": ALIGNMENT_VERSION,
+        "midi_sha256": midi_sha256,
+        "score_sha256": manifest["source_sha256"] if manifest else None,
+        "ticks_per_beat": timeline.ticks_per_beat,
+        "length_ticks": timeline.length_ticks,
+        "bars": bars,
+        "score": _align_score(timeline, bars, manifest["measures"]) if manifest and manifest.get("measures") else None
+    }
+
+
+class AlignmentIndex:
+    """Lookups on an alignment document"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.bars: List[List[int]] = data["bars"]
+        score = data.get("score") or {}
+        self.score_measures: List[Dict[str, Any]] = score.get("measures", [])
+        self._score_starts = [measure["start_tick"] for measure in self.score_measures]
+        last = self.bars[-1] if self.bars else [0, 0, 0]
+        self.end_tick = last[0] + last[1] * last[2]
+
+    @property
+    def measure_count(self) -> int:
+        return len(self.bars)
+
+    def position_tick(self, measure: int, beat: int = 1) -> Optional[int]:
+        """Tick of a measure/beat position, None if the song has no such position"""
+        if measure == len(self.bars) + 1 and beat == 1:
+            return self.end_tick  # End of the last measure
+        if not 1 <= measure <= len(self.bars):
+            return None
+        tick, beats, ticks_per_beat = self.bars[measure - 1]
+        if not 1 <= beat <= beats:
+            return None
+        return tick + (beat - 1) * ticks_per_beat
+
+    def score_measure_at(self, tick: int) -> Optional[Dict[str, Any]]:
+        """Score measure sounding at a tick (binary search)"""
+        i = bisect_right(self._score_starts, tick) - 1
+        if i < 0:
+            return None
+        measure = self.score_measures[i]
+        return measure if tick < measure["end_tick"] else None
+
+    def check_range(self, start_measure: int, start_beat: int, end_measure: int, end_beat: int) -> Optional[str]:
+        """Error message for invalid section bounds, None if they are valid"""
+        start = self.position_tick(start_measure, start_beat)
+        if start is None:
+            return self._position_error("Start", start_measure, start_beat)
+        end = self.position_tick(end_measure, end_beat)
+        if end is None:
+            return self._position_error("End", end_measure, end_beat)
+        if end <= start:
+            return "Section end must be after its start"
+        return None
+
+    def _position_error(self, which: str, measure: int, beat: int) -> str:
+        if measure == len(self.bars) + 1:
+            return f"{which} measure {measure} is the end of the song; only beat 1 is valid"
+        if not 1 <= measure <= len(self.bars):
+            return f"{which} measure {measure} is outside the song ({len(self.bars)} measures)"
+        return f"{which} beat {beat} does not exist in measure {measure} ({self.bars[measure - 1][1]} beats)"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON representation for the alignment endpoint (without the bar table)"""
+        return {
+            "midi_sha256": self.data["midi_sha256"],
+            "score_sha256": self.data["score_sha256"],
+            "ticks_per_beat": self.data["ticks_per_beat"],
+            "length_ticks": self.data["length_ticks"],
+            "measure_count": self.measure_count,
+            "score": self.data["score"]
+        }
+
+
+_indexes: "OrderedDict[Tuple[Optional[str], Optional[str]], AlignmentIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+_INDEX_CACHE_SIZE = 64
+
+
+def load_alignment(
+    song_dir: Path,
+    midi_sha256: Optional[str],
+    score_file: Optional[str] = None,
+    score_sha256: Optional[str] = None
+) -> Optional[AlignmentIndex]:
+    """
+    Return the (cached) alignment index of a song, rebuilding it when
+    alignment.json is missing or was built from other files. None if the
+    song has no MIDI file.
+    """
+    score_sha256 = score_sha256 if score_file else None
+    key = (midi_sha256, score_sha256)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    path = song_dir / ALIGNMENT_FILENAME
+    data = None
+    try:
+        data = json.loads(path.read_text())
+        if (data.get("version") != ALIGNMENT_VERSION or data.get("midi_sha256") != midi_sha256
+                or data.get("score_sha256") != score_sha256 or midi_sha256 is None):
+            data = None
+    except (FileNotFoundError, ValueError):
+        pass
+
+    if data is None:
+        timeline = load_timeline(song_dir, midi_sha256)
+        if timeline is None:
+            return None
+        manifest = None
+        if score_file:
+            try:
+                manifest = load_score_manifest(song_dir, score_file, score_sha256)
+            except ValueError as e:
+                print(f"[Alignment] Score of {song_dir.name} cannot be aligned: {e}")
+        data = build_alignment(timeline, midi_sha256, manifest)
+        atomic_write_text(path, json.dumps(data))
+
+    index = AlignmentIndex(data)
+    if midi_sha256:
+        with _indexes_lock:
+            _indexes[key] = index
+            while len(_indexes) > _INDEX_CACHE_SIZE:
+                _indexes.popitem(last=False)
+    return index
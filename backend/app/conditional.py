@@ -0,0 +1,122 @@
+"""
+Helpers for conditional requests (ETag / If-Match / If-None-Match)
+
+Uploaded files get strong ETags from their SHA-256 and song documents get
+weak ETags from their updated_at version. Both are revalidated on every use
+(Cache-Control: no-cache), which is cheap because a matching
+If-None-Match / If-Modified-Since is answered with 304 before any file or
+song document is read.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request, Response, status
+
+from app.storage import VersionConflictError
+
+# Clients may store responses but must revalidate them before reuse
+FILE_CACHE_CONTROL = "no-cache"
+SONG_CACHE_CONTROL = "private, no-cache"
+
+
+def format_etag(version: str, weak: bool = False) -> str:
+    """Format a version tag as an ETag header value"""
+    return f'{"W/" if weak else ""}"{version}"'
+
+
+def song_etag(version: str) -> str:
+    """Weak ETag of a song document (derived from updated_at)"""
+    return format_etag(version, weak=True)
+
+
+def http_date(value: datetime) -> str:
+    """Format a timestamp for Last-Modified (naive values are UTC)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == opaque:
+            return True
+    return False
+
+
+def not_modified_since(header: Optional[str], last_modified: datetime) -> bool:
+    """True if If-Modified-Since is at or after last_modified (second precision)"""
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> Dict[str, str]:
+    """Validator and caching headers shared by 200 and 304 responses"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Evaluate If-None-Match / If-Modified-Since for a GET request.
+
+    If-Modified-Since is only considered when If-None-Match is absent
+    (RFC 9110, section 13.2.2).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if last_modified is None:
+        return False
+    return not_modified_since(request.headers.get("if-modified-since"), last_modified)
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    """Empty 304 response carrying the current validators"""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def parse_if_match(header: Optional[str]) -> Optional[str]:
+    """
+    Extract the expected version from an If-Match header.
+
+    Returns None when the header is absent or "*" (no precondition on the
+    version). Only the first entity tag of a list is used.
+    """
+    if not header:
+        return None
+    tag = header.split(",")[0].strip()
+    if tag == "*":
+        return None
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    return tag.strip('"')
+
+
+def precondition_failed(error: VersionConflictError) -> HTTPException:
+    """412 response for a write based on an outdated version"""
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Song was modified by another request. Reload and try again.",
+        headers={"ETag": song_etag(error.current_version)}
+    )
@@ -0,0 +1,76 @@
+"""
+Runtime configuration for the ChoirLoop backend
+
+Values come from environment variables (optionally loaded from a .env file)
+and fall back to defaults that work both in Docker and for local development.
+"""
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# In Docker, data is mounted at /app/data
+# Locally (outside Docker), it's in ../data
+DATA_DIR = Path(os.getenv("DATA_DIR") or ("/app/data" if Path("/app/data").exists() else "../data"))
+
+# Storage backend: "json" (file-per-song config.json) or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+
+# Database file used by the sqlite backend
+SQLITE_PATH = Path(os.getenv("SQLITE_PATH") or DATA_DIR / "choirloop.db")
+
+# Write config.json and index.json indented instead of compact (for hand editing)
+STORAGE_PRETTY_JSON = os.getenv("STORAGE_PRETTY_JSON", "false").lower() in ("1", "true", "yes")
+
+# Memory budget of serialized song documents kept between requests
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Maximum number of threads doing blocking storage I/O
+STORAGE_THREADS = int(os.getenv("STORAGE_THREADS", "8"))
+
+# Number of worker processes for MIDI analysis
+MIDI_WORKERS = int(os.getenv("MIDI_WORKERS", "2"))
+
+# Upload size limits in bytes (larger uploads are rejected with 413)
+MAX_MIDI_UPLOAD_BYTES = int(os.getenv("MAX_MIDI_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_SCORE_UPLOAD_BYTES = int(os.getenv("MAX_SCORE_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+# Size limit of library archives sent to POST /api/import
+MAX_IMPORT_BYTES = int(os.getenv("MAX_IMPORT_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Number of worker processes rendering practice audio (separate from MIDI_WORKERS
+# so long renders never hold up uploads)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+
+# Streaming renders (stream-audio while the render job runs) synthesized at once;
+# listeners of the same settings share one
+STREAM_RENDERS = int(os.getenv("STREAM_RENDERS", str(RENDER_WORKERS)))
+
+# Generated practice audio
+MP3_CACHE_DIR = Path(os.getenv("MP3_CACHE_DIR") or DATA_DIR / "mp3_cache")
+
+# Render engine: "builtin" (NumPy synthesizer, WAV output, no system packages)
+# or "fluidsynth" (fluidsynth + ffmpeg, MP3 output)
+RENDER_ENGINE = os.getenv("RENDER_ENGINE", "builtin").lower()
+
+# SoundFont used by fluidsynth to render MIDI to WAV
+SOUNDFONT_PATH = os.getenv("SOUNDFONT_PATH", "/usr/share/sounds/sf2/FluidR3_GM.sf2")
+
+# Disk budget of the render cache in bytes and its eviction policy ("lru" or "lfu")
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+RENDER_CACHE_POLICY = os.getenv("RENDER_CACHE_POLICY", "lru").lower()
+
+# Disk budget per song and cache for ad-hoc measure ranges (MIDI slices, score
+# ranges); least recently used ranges are removed beyond it
+RANGE_CACHE_MAX_BYTES = int(os.getenv("RANGE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Background pre-rendering of practice packs (section x highlighted voice x tempo)
+PRERENDER_ENABLED = os.getenv("PRERENDER_ENABLED", "true").lower() in ("1", "true", "yes")
+PRERENDER_TEMPOS = [int(t) for t in os.getenv("PRERENDER_TEMPOS", "70,85,100").split(",") if t.strip()]
+# CPU budget: render workers that pre-renders may occupy at once
+PRERENDER_WORKERS = int(os.getenv("PRERENDER_WORKERS", str(max(1, RENDER_WORKERS // 2))))
+
+# Request timing and internal metrics on /api/metrics (Prometheus text format)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
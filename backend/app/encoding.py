@@ -0,0 +1,88 @@
+"""
+Precompressed file variants and Accept-Encoding negotiation
+
+Files that are served often and change rarely (e.g. processed scores) are
+written once next to a gzip (.gz) and, when the optional brotli package is
+installed, a brotli (.br) variant, so requests never compress on the fly.
+"""
+import gzip
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.storage.locking import atomic_write_bytes
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip variants are written
+    brotli = None
+
+# Encodings in order of preference when the client weighs them equally
+ENCODING_SUFFIXES: Dict[str, str] = {"br": ".br", "gzip": ".gz"}
+
+# Don't bother compressing tiny files
+MIN_COMPRESS_BYTES = 512
+
+
+def available_encodings() -> List[str]:
+    """Encodings this installation can produce"""
+    return [encoding for encoding in ENCODING_SUFFIXES if encoding != "br" or brotli is not None]
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the output (and its ETag) stable across rebuilds
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def variant_path(path: Path, encoding: Optional[str]) -> Path:
+    """Path of the variant of a file in an encoding (None: the file itself)"""
+    return path.with_name(path.name + ENCODING_SUFFIXES[encoding]) if encoding else path
+
+
+def write_precompressed(path: Path, data: bytes):
+    """Write a file and its precompressed variants atomically"""
+    atomic_write_bytes(path, data)
+    for encoding in available_encodings():
+        variant = variant_path(path, encoding)
+        if len(data) < MIN_COMPRESS_BYTES:
+            variant.unlink(missing_ok=True)
+            continue
+        atomic_write_bytes(variant, _compress(data, encoding))
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Codings of an Accept-Encoding header with their q-values"""
+    codings: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[name] = q
+    return codings
+
+
+def negotiate_variant(path: Path, accept_encoding: Optional[str]) -> Tuple[Path, Optional[str]]:
+    """
+    Pick the stored variant of path the client prefers.
+
+    Returns the path to serve and its Content-Encoding (None for the
+    uncompressed file).
+    """
+    codings = parse_accept_encoding(accept_encoding)
+    wildcard = codings.get("*", 0.0)
+    best: Tuple[float, Optional[str]] = (0.0, None)
+    for encoding in ENCODING_SUFFIXES:
+        q = codings.get(encoding, wildcard)
+        if q > best[0] and variant_path(path, encoding).exists():
+            best = (q, encoding)
+    return variant_path(path, best[1]), best[1]
@@ -0,0 +1,138 @@
+"""
+JSON Patch (RFC 6902) for song documents
+
+Operations are applied in order to a copy of the document; if any of them
+fails, the original is left untouched. Paths are JSON Pointers (RFC 6901),
+e.g. /title, /voices/0/names or /practice_sections/- (append).
+"""
+import copy
+from typing import Any, List, Tuple
+
+PATCH_OPERATIONS = ("add", "remove", "replace", "move", "copy", "test")
+
+
+class JsonPatchError(ValueError):
+    """Raised for malformed operations and paths that do not exist"""
+
+
+class JsonPatchTestFailed(JsonPatchError):
+    """Raised when a test operation does not match the document"""
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Split a JSON Pointer into unescaped reference tokens"""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON Pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _index(container: list, token: str, pointer: str, append: bool = False) -> int:
+    """List index of a token ('-' is the end of the list when appending)"""
+    if append and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise JsonPatchError(f"Invalid array index in {pointer!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not append):
+        raise JsonPatchError(f"Array index out of range in {pointer!r}")
+    return index
+
+
+def _resolve(document: Any, pointer: str) -> Tuple[Any, str]:
+    """Parent container and last token of a pointer (the parent must exist)"""
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        raise JsonPatchError("Operations on the whole document are not supported")
+    parent = document
+    for token in tokens[:-1]:
+        parent = _get(parent, token, pointer)
+    if not isinstance(parent, (dict, list)):
+        raise JsonPatchError(f"Path not found: {pointer!r}")
+    return parent, tokens[-1]
+
+
+def _get(container: Any, token: str, pointer: str) -> Any:
+    if isinstance(container, dict):
+        if token not in container:
+            raise JsonPatchError(f"Path not found: {pointer!r}")
+        return container[token]
+    if isinstance(container, list):
+        return container[_index(container, token, pointer)]
+    raise JsonPatchError(f"Path not found: {pointer!r}")
+
+
+def get_value(document: Any, pointer: str) -> Any:
+    """Value a pointer refers to"""
+    value = document
+    for token in parse_pointer(pointer):
+        value = _get(value, token, pointer)
+    return value
+
+
+def _add(document: Any, pointer: str, value: Any):
+    parent, token = _resolve(document, pointer)
+    if isinstance(parent, list):
+        parent.insert(_index(parent, token, pointer, append=True), value)
+    else:
+        parent[token] = value
+
+
+def _remove(document: Any, pointer: str) -> Any:
+    parent, token = _resolve(document, pointer)
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, token, pointer))
+    if token not in parent:
+        raise JsonPatchError(f"Path not found: {pointer!r}")
+    return parent.pop(token)
+
+
+def apply_patch(document: Any, operations: List[dict]) -> Any:
+    """
+    Apply JSON Patch operations and return the patched copy.
+
+    Each operation is a dict with "op", "path" and, depending on the op,
+    "value" or "from". Raises JsonPatchTestFailed for a failing test and
+    JsonPatchError for everything else that cannot be applied.
+    """
+    document = copy.deepcopy(document)
+    for number, operation in enumerate(operations):
+        op, path = operation.get("op"), operation.get("path")
+        if op not in PATCH_OPERATIONS or not isinstance(path, str):
+            raise JsonPatchError(f"Operation {number}: needs an op ({', '.join(PATCH_OPERATIONS)}) and a path")
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise JsonPatchError(f"Operation {number}: {op} needs a value")
+        if op in ("move", "copy") and not isinstance(operation.get("from"), str):
+            raise JsonPatchError(f"Operation {number}: {op} needs a from pointer")
+
+        if op == "add":
+            _add(document, path, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            _remove(document, path)
+        elif op == "replace":
+            _remove(document, path)
+            _add(document, path, copy.deepcopy(operation["value"]))
+        elif op == "move":
+            source = operation["from"]
+            if path != source and path.startswith(source + "/"):
+                raise JsonPatchError(f"Operation {number}: cannot move a value into itself")
+            _add(document, path, _remove(document, source))
+        elif op == "copy":
+            _add(document, path, copy.deepcopy(get_value(document, operation["from"])))
+        elif get_value(document, path) != operation["value"]:
+            raise JsonPatchTestFailed(f"Operation {number}: test failed for {path!r}")
+    return document
+
+
+def touched_fields(operations: List[dict]) -> set:
+    """Top-level document fields the operations write to (test is read-only)"""
+    fields = set()
+    for operation in operations:
+        if operation.get("op") == "test":
+            continue
+        for pointer in (operation.get("path"), operation.get("from") if operation.get("op") == "move" else None):
+            if isinstance(pointer, str):
+                tokens = parse_pointer(pointer)
+                fields.add(tokens[0] if tokens else "")
+    return fields
@@ -0,0 +1,594 @@
+"""
+Streaming export and import of song libraries
+
+An archive (zip or tar) holds one directory per song with the song
+document, its MIDI and score files and the analysis sidecars, followed by
+a manifest with the size and SHA-256 of every file:
+
+    choirloop-library/<song id>/song.json
+    choirloop-library/<song id>/song.mid
+    choirloop-library/<song id>/score.mxl
+    choirloop-library/<song id>/song.analysis
+    choirloop-library/<song id>/alignment.json
+    choirloop-library/manifest.json
+
+Exports are produced chunk by chunk while the response is sent (zip
+entries with data descriptors, or a plain tar stream), so the archive is
+never staged in memory or on disk; hashes are computed on the way and the
+manifest comes last.
+
+Imports run as background jobs: the uploaded archive is unpacked into a
+staging directory while every file is hashed, checked against the
+manifest, MIDI files without a matching sidecar are analyzed in the
+worker process pool, and the songs are moved into place and saved with a
+single index update.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import tarfile
+import time
+import zipfile
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from app.alignment import ALIGNMENT_FILENAME
+from app.config import DATA_DIR, MAX_MIDI_UPLOAD_BYTES, MAX_SCORE_UPLOAD_BYTES
+from app.midi_analysis import ANALYSIS_FILENAME, analyze_to_sidecar, read_sidecar
+from app.models import Song
+from app.prerender import prerender_scheduler
+from app.render_cache import render_cache
+from app.serialization import response_cache
+from app.storage import StorageService, blob_store
+from app.workers import run_in_process, run_in_thread
+
+ARCHIVE_VERSION = 1
+ARCHIVE_ROOT = "choirloop-library"
+MANIFEST_FILENAME = "manifest.json"
+SONG_FILENAME = "song.json"
+SIDECAR_FILENAMES = (ANALYSIS_FILENAME, ALIGNMENT_FILENAME)
+
+EXPORT_MEDIA_TYPES = {"zip": "application/zip", "tar": "application/x-tar"}
+CHUNK_SIZE = 1024 * 1024
+
+# Staging area of imports (same filesystem as the songs, so installing is a rename)
+IMPORT_DIR = DATA_DIR / "imports"
+
+# Largest accepted size per file name (decompressed), also a guard against archive bombs
+_MAX_FILE_BYTES = {
+    MANIFEST_FILENAME: 64 * 1024 * 1024,
+    SONG_FILENAME: 4 * 1024 * 1024,
+    "song.mid": MAX_MIDI_UPLOAD_BYTES,
+    ANALYSIS_FILENAME: 16 * MAX_MIDI_UPLOAD_BYTES,
+    ALIGNMENT_FILENAME: 64 * 1024 * 1024
+}
+_SCORE_NAME = re.compile(r"^score\.(xml|mxl|musicxml)$")
+
+# Finished import jobs kept around for status lookups
+FINISHED_JOBS_KEPT = 20
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _max_file_bytes(name: str) -> Optional[int]:
+    """Size limit of an archive member, None if the name is not expected"""
+    if _SCORE_NAME.match(name):
+        return MAX_SCORE_UPLOAD_BYTES
+    return _MAX_FILE_BYTES.get(name)
+
+
+def _read_chunks(source: BinaryIO, digest: "hashlib._Hash") -> Iterator[bytes]:
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        digest.update(chunk)
+        yield chunk
+
+
+# --- Export -----------------------------------------------------------------
+
+
+class _Sink:
+    """Unseekable write target of an archive writer; drain() takes out what was written"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _ZipWriter:
+    """Zip stream (entries use data descriptors, since the output cannot seek)"""
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def add(self, name: str, chunks: Iterable[bytes], size: int, mtime: float) -> Iterator[bytes]:
+        info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+        info.file_size = size
+        info.external_attr = 0o644 << 16
+        # Compressed MusicXML gains nothing from another deflate pass
+        info.compress_type = zipfile.ZIP_STORED if name.endswith(".mxl") else zipfile.ZIP_DEFLATED
+        with self._zip.open(info, "w") as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+                yield self._sink.drain()
+        yield self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+
+class _TarWriter:
+    """POSIX (pax) tar stream, written block by block"""
+
+    def __init__(self):
+        self._offset = 0
+
+    def add(self, name: str, chunks: Iterable[bytes], size: int, mtime: float) -> Iterator[bytes]:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        header = info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        self._offset += len(header)
+        yield header
+
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            if written > size:
+                raise ValueError(f"{name} grew while it was exported")
+            yield chunk
+        if written != size:
+            raise ValueError(f"{name} shrank while it was exported")
+        padding = -size % tarfile.BLOCKSIZE
+        self._offset += size + padding
+        yield tarfile.NUL * padding
+
+    def close(self) -> bytes:
+        # Two empty blocks, then padding to a full record (like tarfile)
+        end = self._offset + 2 * tarfile.BLOCKSIZE
+        return tarfile.NUL * (2 * tarfile.BLOCKSIZE + (-end % tarfile.RECORDSIZE))
+
+
+def export_archive(song_ids: List[UUID], archive_format: str = "zip") -> Iterator[bytes]:
+    """
+    Generate an archive of songs chunk by chunk (blocking; iterate it in a thread).
+
+    Songs deleted while the export runs are left out. Each file is read
+    once, through an open handle, so a file replaced meanwhile is exported
+    consistently in its old or new version.
+    """
+    writer = _ZipWriter() if archive_format == "zip" else _TarWriter()
+    manifest: Dict[str, Any] = {
+        "version": ARCHIVE_VERSION,
+        "exported_at": datetime.utcnow().isoformat(),
+        "songs": []
+    }
+    now = time.time()
+
+    for song_id in song_ids:
+        song = StorageService.load_song(song_id)
+        if not song:
+            continue
+        prefix = f"{ARCHIVE_ROOT}/{song.id}"
+        files: Dict[str, Dict[str, Any]] = {}
+
+        document = song.model_dump_json(indent=2).encode()
+        files[SONG_FILENAME] = {"size": len(document), "sha256": hashlib.sha256(document).hexdigest()}
+        yield from writer.add(f"{prefix}/{SONG_FILENAME}", [document], len(document), now)
+
+        song_dir = StorageService.get_song_dir(song.id)
+        for name in (song.midi_file, song.score_file, *SIDECAR_FILENAMES):
+            if not name:
+                continue
+            try:
+                source = open(song_dir / name, "rb")
+            except FileNotFoundError:
+                continue
+            with source:
+                stat = os.fstat(source.fileno())
+                digest = hashlib.sha256()
+                for chunk in writer.add(f"{prefix}/{name}", _read_chunks(source, digest), stat.st_size, stat.st_mtime):
+                    if chunk:
+                        yield chunk
+            files[name] = {"size": stat.st_size, "sha256": digest.hexdigest()}
+
+        manifest["songs"].append({"id": str(song.id), "title": song.title, "files": files})
+
+    data = json.dumps(manifest, indent=2).encode()
+    yield from writer.add(f"{ARCHIVE_ROOT}/{MANIFEST_FILENAME}", [data], len(data), now)
+    yield writer.close()
+
+
+# --- Import -----------------------------------------------------------------
+
+
+@dataclass
+class ImportJob:
+    """Progress and outcome of one library import"""
+    id: str
+    on_conflict: str
+    status: str = QUEUED
+    phase: str = "queued"
+    bytes_received: int = 0
+    files_unpacked: int = 0
+    songs_total: int = 0
+    songs_analyzed: int = 0
+    songs_imported: int = 0
+    songs_skipped: int = 0
+    errors: List[str] = field(default_factory=list)
+    imported: List[str] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status representation for the API"""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "phase": self.phase,
+            "on_conflict": self.on_conflict,
+            "bytes_received": self.bytes_received,
+            "files_unpacked": self.files_unpacked,
+            "songs_total": self.songs_total,
+            "songs_analyzed": self.songs_analyzed,
+            "songs_imported": self.songs_imported,
+            "songs_skipped": self.songs_skipped,
+            "imported": self.imported,
+            "errors": self.errors,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+@dataclass
+class _StagedSong:
+    """A song unpacked into the staging directory"""
+    id: UUID
+    directory: Path
+    files: Dict[str, Tuple[int, str]] = field(default_factory=dict)
+    song: Optional[Song] = None
+
+
+def _archive_members(path: Path) -> Iterator[Tuple[str, int, BinaryIO]]:
+    """(name, declared size, reader) of the regular files of a zip or tar archive"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as reader:
+                        yield info.filename, info.file_size, reader
+        return
+    try:
+        archive = tarfile.open(path, "r:*")
+    except tarfile.TarError as e:
+        raise ValueError("Not a zip or tar archive") from e
+    with archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, member.size, archive.extractfile(member)
+
+
+def _member_target(name: str) -> Optional[Tuple[Optional[UUID], str]]:
+    """(song ID, file name) of an archive entry, (None, manifest) for the manifest, None if unexpected"""
+    parts = [part for part in name.split("/") if part and part != "."]
+    if parts and parts[0] == ARCHIVE_ROOT:
+        parts = parts[1:]
+    if parts == [MANIFEST_FILENAME]:
+        return None, MANIFEST_FILENAME
+    if len(parts) != 2 or _max_file_bytes(parts[1]) is None or parts[1] == MANIFEST_FILENAME:
+        return None
+    try:
+        return UUID(parts[0]), parts[1]
+    except ValueError:
+        return None
+
+
+def _unpack(job: ImportJob, archive_path: Path, staging: Path) -> Tuple[Dict[str, Any], Dict[UUID, _StagedSong]]:
+    """Copy the expected files of an archive into staging, hashing them; returns the manifest"""
+    manifest: Optional[Dict[str, Any]] = None
+    songs: Dict[UUID, _StagedSong] = {}
+
+    for name, declared_size, reader in _archive_members(archive_path):
+        target = _member_target(name)
+        if target is None:
+            job.errors.append(f"Ignored unexpected archive entry {name}")
+            continue
+        song_id, filename = target
+        limit = _max_file_bytes(filename)
+        if declared_size > limit:
+            raise ValueError(f"{name} is larger than {limit} bytes")
+
+        if song_id is None:
+            data = reader.read(limit + 1)
+            if len(data) > limit:
+                raise ValueError(f"{name} is larger than {limit} bytes")
+            manifest = json.loads(data)
+            continue
+
+        staged = songs.get(song_id)
+        if staged is None:
+            staged = songs[song_id] = _StagedSong(id=song_id, directory=staging / str(song_id))
+            staged.directory.mkdir(parents=True)
+        digest = hashlib.sha256()
+        size = 0
+        with open(staged.directory / filename, "wb") as destination:
+            for chunk in _read_chunks(reader, digest):
+                size += len(chunk)
+                if size > limit:
+                    raise ValueError(f"{name} is larger than {limit} bytes")
+                destination.write(chunk)
+        staged.files[filename] = (size, digest.hexdigest())
+        job.files_unpacked += 1
+
+    if manifest is None:
+        raise ValueError(f"Archive has no {MANIFEST_FILENAME}")
+    if manifest.get("version") != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported archive version: {manifest.get('version')}")
+    return manifest, songs
+
+
+def _verify(job: ImportJob, manifest: Dict[str, Any], staged: Dict[UUID, _StagedSong]) -> List[_StagedSong]:
+    """Songs whose files all match the manifest and whose document is valid"""
+    verified = []
+    listed = set()
+    for entry in manifest.get("songs", []):
+        try:
+            song_id = UUID(entry["id"])
+        except (KeyError, TypeError, ValueError):
+            job.errors.append(f"Invalid manifest entry: {entry!r}")
+            continue
+        listed.add(song_id)
+        song = staged.get(song_id)
+        expected = entry.get("files") or {}
+        problems = []
+        for name, meta in expected.items():
+            received = song.files.get(name) if song else None
+            if received is None:
+                problems.append(f"{name} is missing")
+            elif received != (meta.get("size"), meta.get("sha256")):
+                problems.append(f"{name} does not match its checksum")
+        if song:
+            problems += [f"{name} is not in the manifest" for name in song.files if name not in expected]
+        if not song or SONG_FILENAME not in expected:
+            problems.append(f"{SONG_FILENAME} is missing")
+        if problems:
+            job.errors.append(f"Song {song_id}: {'; '.join(dict.fromkeys(problems))}")
+            continue
+
+        try:
+            document = Song.model_validate_json((song.directory / SONG_FILENAME).read_bytes())
+        except ValueError as e:
+            job.errors.append(f"Song {song_id}: invalid {SONG_FILENAME}: {e}")
+            continue
+        uploads = [(document.midi_file, "midi_sha256"), (document.score_file, "score_sha256")]
+        missing = [name for name, _ in uploads if name and name not in song.files]
+        if document.id != song_id or missing:
+            job.errors.append(f"Song {song_id}: {SONG_FILENAME} does not match the archived files")
+            continue
+        # The verified file content is authoritative for the upload hashes
+        for name, hash_field in uploads:
+            if name:
+                setattr(document, hash_field, song.files[name][1])
+        song.song = document
+        verified.append(song)
+
+    for song_id in staged.keys() - listed:
+        job.errors.append(f"Song {song_id} is not in the manifest and was skipped")
+    return verified
+
+
+def _sidecar_matches(path: Path, sha256: str) -> bool:
+    try:
+        return read_sidecar(path).source_sha256 == sha256
+    except (ValueError, OSError):
+        return False
+
+
+def _has_current_sidecar(song: _StagedSong) -> bool:
+    """True if the archived sidecar, or the one stored with the same MIDI blob, belongs to the archived MIDI file"""
+    sidecar = song.directory / ANALYSIS_FILENAME
+    sha256 = song.song.midi_sha256
+    if ANALYSIS_FILENAME in song.files and _sidecar_matches(sidecar, sha256):
+        return True
+    return blob_store.fetch(sha256, ANALYSIS_FILENAME, sidecar) and _sidecar_matches(sidecar, sha256)
+
+
+def _install(songs: List[_StagedSong], replace: bool) -> Tuple[List[Song], List[UUID]]:
+    """Move staged song directories into place and save all songs with one index update"""
+    installed = []
+    replaced = []
+    released = []
+    now = datetime.utcnow()
+    for staged in songs:
+        (staged.directory / SONG_FILENAME).unlink()
+        target = StorageService.get_song_dir(staged.id)
+        if target.exists():
+            if not replace:
+                continue
+            old = StorageService.song_files(staged.id)
+            if old:
+                released += [old.midi_sha256, old.score_sha256]
+            shutil.rmtree(target)
+            replaced.append(staged.id)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged.directory, target)
+
+        # Share uploads (and the MIDI analysis) with identical files of other songs
+        song = staged.song
+        for name, sha256 in ((song.midi_file, song.midi_sha256), (song.score_file, song.score_sha256)):
+            if name:
+                blob_store.store(target / name, sha256, target / name)
+        if song.midi_file:
+            blob_store.keep(song.midi_sha256, ANALYSIS_FILENAME, target / ANALYSIS_FILENAME)
+
+        # An import is a write: new version, so caches and clients see the change
+        song.updated_at = now
+        installed.append(song)
+    StorageService.save_songs(installed)
+    StorageService.release_blobs(*released)
+    return installed, replaced
+
+
+class LibraryImporter:
+    """Runs import jobs one at a time and keeps their progress for polling"""
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self._lock: Optional[asyncio.Lock] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def create(self, on_conflict: str = "skip") -> ImportJob:
+        """Register a new job (its archive is still being received)"""
+        job = ImportJob(id=str(uuid4()), on_conflict=on_conflict)
+        job.phase = "receiving"
+        self._jobs[job.id] = job
+        finished = [key for key, old in self._jobs.items() if old.finished]
+        for key in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self._jobs[key]
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        """Look up a job by ID"""
+        return self._jobs.get(job_id)
+
+    def archive_path(self, job: ImportJob) -> Path:
+        """Where the uploaded archive of a job is spooled"""
+        IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+        return IMPORT_DIR / f"{job.id}.archive"
+
+    def fail(self, job: ImportJob, error: str):
+        """Mark a job as failed and remove its files"""
+        job.status = FAILED
+        job.errors.append(error)
+        job.finished_at = datetime.utcnow()
+        job.done.set()
+        self.archive_path(job).unlink(missing_ok=True)
+
+    def start(self, job: ImportJob):
+        """Process the received archive in the background"""
+        task = asyncio.create_task(self._run(job), name=f"import-{job.id}")
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+
+    async def wait(self, job: ImportJob, timeout: Optional[float] = None) -> ImportJob:
+        """Wait until a job has finished or the timeout has passed"""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    async def stop(self):
+        """Cancel running imports (their staging files are removed)"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def sweep(self):
+        """Remove archives and staging directories left behind by a crash"""
+        shutil.rmtree(IMPORT_DIR, ignore_errors=True)
+
+    async def _run(self, job: ImportJob):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        job.phase = "queued"
+        archive_path = self.archive_path(job)
+        staging = IMPORT_DIR / job.id
+        try:
+            async with self._lock:
+                job.status = RUNNING
+                await self._import(job, archive_path, staging)
+            job.status = DONE
+            job.phase = "done"
+        except Exception as e:
+            print(f"[Import] Job {job.id} failed: {e}")
+            job.status = FAILED
+            job.errors.append(str(e))
+        finally:
+            job.finished_at = datetime.utcnow()
+            job.done.set()
+            archive_path.unlink(missing_ok=True)
+            await run_in_thread(shutil.rmtree, staging, True)
+
+    async def _import(self, job: ImportJob, archive_path: Path, staging: Path):
+        job.phase = "unpacking"
+        staging.mkdir(parents=True)
+        manifest, staged = await run_in_thread(_unpack, job, archive_path, staging)
+        archive_path.unlink(missing_ok=True)
+
+        job.phase = "verifying"
+        songs = await run_in_thread(_verify, job, manifest, staged)
+        existing = await run_in_thread(StorageService.song_ids)
+        if job.on_conflict == "skip":
+            job.songs_skipped = sum(1 for song in songs if str(song.id) in existing)
+            songs = [song for song in songs if str(song.id) not in existing]
+        job.songs_total = len(songs)
+
+        job.phase = "analyzing"
+        songs = [song for song in await asyncio.gather(*(self._analyze(job, song) for song in songs)) if song]
+
+        job.phase = "writing"
+        installed, replaced = await run_in_thread(_install, songs, job.on_conflict == "replace")
+        job.songs_imported = len(installed)
+        job.imported = [str(song.id) for song in installed]
+
+        # Replaced songs lose their rendered audio; everything gets pre-rendered anew
+        for song_id in replaced:
+            prerender_scheduler.cancel(song_id)
+            await run_in_thread(render_cache.invalidate_song, song_id)
+        for song in installed:
+            response_cache.discard(song.id)
+            prerender_scheduler.schedule(song.id)
+        print(f"[Import] Job {job.id}: imported {len(installed)} songs, skipped {job.songs_skipped}")
+
+    async def _analyze(self, job: ImportJob, song: _StagedSong) -> Optional[_StagedSong]:
+        """Reuse a matching sidecar or analyze the MIDI file in the worker pool"""
+        if song.song.midi_file and not await run_in_thread(_has_current_sidecar, song):
+            try:
+                voices = await run_in_process(
+                    analyze_to_sidecar,
+                    str(song.directory / song.song.midi_file),
+                    str(song.directory / ANALYSIS_FILENAME),
+                    song.song.midi_sha256
+                )
+            except Exception as e:
+                job.errors.append(f"Song {song.id}: invalid MIDI file: {e}")
+                return None
+            if not song.song.voices:
+                song.song.voices = voices
+        job.songs_analyzed += 1
+        return song
+
+
+library_importer = LibraryImporter()
@@ -2,18 +2,48 @@
 ChoirLoop FastAPI Backend
 Main application entry point
 """
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pathlib import Path
 
-from app.routes import songs, health, files, sections  # , mp3
+from app.config import METRICS_ENABLED
+from app.metrics import MetricsMiddleware
+from app.routes import songs, health, files, scores, sections, slices, timeline, mp3, library
+from app.storage import StorageService
+from app import workers
+from app.render_cache import render_cache
+from app.render_queue import render_queue
+from app.prerender import prerender_scheduler
+from app.library_archive import library_importer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reconcile the render cache index and sweep leftovers of crashed renders
+    await workers.run_in_thread(render_cache.load)
+    # Remove archives and staging directories of imports interrupted by a restart
+    await workers.run_in_thread(library_importer.sweep)
+    # Move files uploaded before the blob store existed into it and drop unreferenced blobs
+    await workers.run_in_thread(StorageService.sync_blobs)
+    render_queue.start()
+    prerender_scheduler.start()
+    yield
+    # Stop imports, pre-rendering, render dispatchers, storage threads and worker processes
+    await library_importer.stop()
+    await prerender_scheduler.stop()
+    await render_queue.stop()
+    render_cache.flush(force=True)
+    workers.shutdown()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="ChoirLoop API",
     description="API for choir practice with MIDI file support",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -29,23 +59,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request timing (outermost, so it also covers CORS preflights)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(health.router, prefix="/api", tags=["health"])
 app.include_router(songs.router, prefix="/api/songs", tags=["songs"])
 app.include_router(files.router, prefix="/api/songs", tags=["files"])
+app.include_router(scores.router, prefix="/api/songs", tags=["scores"])
 app.include_router(sections.router, prefix="/api/songs", tags=["sections"])
-# app.include_router(mp3.router, prefix="/api/songs", tags=["mp3"])
-
-# Ensure data directory exists
-# Use absolute path that works in Docker (/app/data) and fallback to relative for local dev
-DATA_DIR = Path("/app/data") if Path("/app/data").exists() or Path("/app").exists() else Path("../data")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-(DATA_DIR / "songs").mkdir(parents=True, exist_ok=True)
-
-# Create index.json if it doesn't exist
-index_file = DATA_DIR / "index.json"
-if not index_file.exists():
-    index_file.write_text("[]")
+app.include_router(timeline.router, prefix="/api/songs", tags=["timeline"])
+app.include_router(slices.router, prefix="/api/songs", tags=["slices"])
+app.include_router(mp3.router, prefix="/api/songs", tags=["mp3"])
+app.include_router(library.router, prefix="/api", tags=["library"])
+
+# Ensure data directory (and index.json / database) exists
+StorageService.ensure_directories()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,273 @@
+"""
+Request timing and internal metrics in the Prometheus text format
+
+A small in-process registry of counters, gauges and fixed-bucket
+histograms, exposed on GET /api/metrics:
+
+- MetricsMiddleware records latency, response size and status of every
+  request, labelled with the route template (e.g. /api/songs/{id}) so the
+  number of series stays bounded, plus the number of requests in flight
+- span() times internal operations (storage load/save, MIDI parse,
+  render jobs) into one histogram labelled by span name
+- cache and render queue figures that are already counted elsewhere are
+  copied into the registry when it is scraped, so they cost nothing per
+  request
+
+Values are per process. With METRICS_ENABLED=false the middleware is not
+installed, span() only yields and the endpoint answers 404.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from app.config import METRICS_ENABLED
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the histogram buckets (+Inf is implicit)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (128, 1024, 8192, 65536, 524288, 4194304, 33554432)
+
+# Route label of requests that did not match any route (keeps 404 scans from adding series)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic count per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, value: float, *labels: str):
+        """Copy a count that is kept elsewhere (e.g. a cache's own hit counter)"""
+        with self._lock:
+            self._values[labels] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    """Value that goes up and down per label set"""
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets, with their sum and count"""
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (last one is +Inf) and the sum
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[i] += 1
+            counts[-1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        lines = []
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = 'le="{}"'.format(_format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """All metrics of the process, in registration order"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labels))
+
+    def histogram(
+        self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(METRICS_ENABLED)
+
+REQUEST_DURATION = metrics.histogram(
+    "choirloop_http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response",
+    ("method", "route", "status")
+)
+RESPONSE_SIZE = metrics.histogram(
+    "choirloop_http_response_size_bytes",
+    "Response body size",
+    ("method", "route"),
+    SIZE_BUCKETS
+)
+REQUESTS_IN_FLIGHT = metrics.gauge(
+    "choirloop_http_requests_in_flight",
+    "Requests currently being handled"
+)
+SPAN_DURATION = metrics.histogram(
+    "choirloop_span_duration_seconds",
+    "Duration of internal operations (storage, MIDI parsing, rendering)",
+    ("span",)
+)
+CACHE_REQUESTS = metrics.counter(
+    "choirloop_cache_requests_total",
+    "Cache lookups by cache and result",
+    ("cache", "result")
+)
+CACHE_SIZE = metrics.gauge(
+    "choirloop_cache_size_bytes",
+    "Disk space used by a cache",
+    ("cache",)
+)
+RENDER_QUEUE_JOBS = metrics.gauge(
+    "choirloop_render_queue_jobs",
+    "Render jobs known to the queue by status",
+    ("status",)
+)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block as an internal span"""
+    if not metrics.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_DURATION.observe(time.perf_counter() - start, name)
+
+
+def record_cache(cache: str, hit: bool):
+    """Count one lookup of a cache that has no counters of its own"""
+    if metrics.enabled:
+        CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+def route_label(scope) -> str:
+    """
+    Route template of a routed request (e.g. /api/songs/{id}), rebuilt from
+    the path and its path parameters since routers that include other
+    routers only know their own part of the template
+    """
+    if "endpoint" not in scope:
+        return UNMATCHED_ROUTE
+    path = scope["path"]
+    params = scope.get("path_params")
+    if not params:
+        return path
+    names = {str(value): name for name, value in params.items()}
+    return "/".join("{" + names[part] + "}" if part in names else part for part in path.split("/"))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, response size and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = route_label(scope)
+            method = scope["method"]
+            REQUEST_DURATION.observe(time.perf_counter() - start, method, route, str(status_code))
+            RESPONSE_SIZE.observe(size, method, route)
@@ -0,0 +1,313 @@
+"""
+MIDI analysis for ChoirLoop
+
+A MIDI file is walked once per track to collect everything later stages
+need: track names, programs and channels, the tempo map, time signatures
+and every note as (onset tick, duration, pitch, velocity). The result is
+stored as a compact binary sidecar next to song.mid so voice info, section
+timing and rendering never have to re-parse the MIDI file.
+
+Functions used from the worker process pool must stay top-level and only
+take/return picklable values.
+"""
+import hashlib
+import json
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+import mido
+
+from app.metrics import record_cache, span
+from app.models import Voice
+from app.storage.locking import atomic_write_bytes
+
+ANALYSIS_FILENAME = "song.analysis"
+
+# Sidecar layout: magic, format version, header length, JSON header, then
+# per track the onset, duration (uint32) and pitch, velocity (uint8) arrays,
+# all little-endian.
+SIDECAR_MAGIC = b"CLMA"
+SIDECAR_VERSION = 1
+_PREFIX = struct.Struct("<4sHI")
+
+# 500000 microseconds per beat = 120 BPM, the MIDI default
+DEFAULT_TEMPO = 500000
+
+
+@dataclass
+class TrackAnalysis:
+    """Metadata and notes of one MIDI track"""
+    track_number: int
+    name: Optional[str] = None
+    channel: Optional[int] = None
+    program: Optional[int] = None
+    onsets: array = field(default_factory=lambda: array("I"))
+    durations: array = field(default_factory=lambda: array("I"))
+    pitches: array = field(default_factory=lambda: array("B"))
+    velocities: array = field(default_factory=lambda: array("B"))
+
+    @property
+    def note_count(self) -> int:
+        return len(self.onsets)
+
+
+@dataclass
+class MidiAnalysis:
+    """Everything extracted from one MIDI file"""
+    source_sha256: str
+    midi_type: int
+    ticks_per_beat: int
+    length_ticks: int
+    tempo_changes: List[Tuple[int, int]]
+    time_signatures: List[Tuple[int, int, int]]
+    tracks: List[TrackAnalysis]
+
+    def voices(self) -> List[Voice]:
+        """Voice entries for every track that contains notes"""
+        return [
+            Voice(
+                track_number=track.track_number,
+                names=[track.name or f"Track {track.track_number + 1}"],
+                channel=track.channel,
+                note_count=track.note_count,
+                track_name=track.name,
+                program=track.program
+            )
+            for track in self.tracks
+            if track.note_count
+        ]
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def analyze_midi(midi_path: Path, sha256: Optional[str] = None) -> MidiAnalysis:
+    """Parse a MIDI file and walk every track exactly once"""
+    mid = mido.MidiFile(str(midi_path))
+    tempo_changes: Dict[int, int] = {}
+    time_signatures: Dict[int, Tuple[int, int]] = {}
+    tracks = []
+    length_ticks = 0
+
+    for track_number, track in enumerate(mid.tracks):
+        analysis = TrackAnalysis(track_number=track_number)
+        # Open notes per (channel, pitch); overlapping notes close first-in, first-out
+        open_notes: Dict[Tuple[int, int], Deque[Tuple[int, int]]] = defaultdict(deque)
+        notes: List[Tuple[int, int, int, int]] = []
+        tick = 0
+
+        for msg in track:
+            tick += msg.time
+            kind = msg.type
+            if kind == "note_on" and msg.velocity > 0:
+                open_notes[(msg.channel, msg.note)].append((tick, msg.velocity))
+                if analysis.channel is None:
+                    analysis.channel = msg.channel
+            elif kind == "note_off" or kind == "note_on":
+                pending = open_notes.get((msg.channel, msg.note))
+                if pending:
+                    onset, velocity = pending.popleft()
+                    notes.append((onset, tick - onset, msg.note, velocity))
+            elif kind == "set_tempo":
+                tempo_changes[tick] = msg.tempo
+            elif kind == "time_signature":
+                time_signatures[tick] = (msg.numerator, msg.denominator)
+            elif kind == "track_name" and analysis.name is None and msg.name.strip():
+                analysis.name = msg.name.strip()
+            elif kind == "program_change" and analysis.program is None:
+                analysis.program = msg.program
+
+        # Notes still sounding at the end of the track last until its end
+        for (_, pitch), pending in open_notes.items():
+            for onset, velocity in pending:
+                notes.append((onset, tick - onset, pitch, velocity))
+
+        notes.sort()
+        for onset, duration, pitch, velocity in notes:
+            analysis.onsets.append(onset)
+            analysis.durations.append(duration)
+            analysis.pitches.append(pitch)
+            analysis.velocities.append(velocity)
+
+        length_ticks = max(length_ticks, tick)
+        tracks.append(analysis)
+
+    if 0 not in tempo_changes:
+        tempo_changes[0] = DEFAULT_TEMPO
+    if 0 not in time_signatures:
+        time_signatures[0] = (4, 4)
+
+    return MidiAnalysis(
+        source_sha256=sha256 or _file_sha256(midi_path),
+        midi_type=mid.type,
+        ticks_per_beat=mid.ticks_per_beat,
+        length_ticks=length_ticks,
+        tempo_changes=sorted(tempo_changes.items()),
+        time_signatures=[(t, num, den) for t, (num, den) in sorted(time_signatures.items())],
+        tracks=tracks
+    )
+
+
+def _le_bytes(values: array) -> bytes:
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le_bytes(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values.byteswap()
+    return values
+
+
+def write_sidecar(analysis: MidiAnalysis, path: Path):
+    """Store an analysis as a binary sidecar file"""
+    header = {
+        "source_sha256": analysis.source_sha256,
+        "midi_type": analysis.midi_type,
+        "ticks_per_beat": analysis.ticks_per_beat,
+        "length_ticks": analysis.length_ticks,
+        "tempo_changes": analysis.tempo_changes,
+        "time_signatures": analysis.time_signatures,
+        "tracks": [
+            {
+                "track_number": track.track_number,
+                "name": track.name,
+                "channel": track.channel,
+                "program": track.program,
+                "note_count": track.note_count
+            }
+            for track in analysis.tracks
+        ]
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    parts = [_PREFIX.pack(SIDECAR_MAGIC, SIDECAR_VERSION, len(header_bytes)), header_bytes]
+    for track in analysis.tracks:
+        parts += [
+            _le_bytes(track.onsets),
+            _le_bytes(track.durations),
+            track.pitches.tobytes(),
+            track.velocities.tobytes()
+        ]
+    atomic_write_bytes(path, b"".join(parts))
+
+
+def read_sidecar(path: Path) -> MidiAnalysis:
+    """Load an analysis sidecar, raising ValueError if it is not one"""
+    data = Path(path).read_bytes()
+    magic, version, header_length = _PREFIX.unpack_from(data)
+    if magic != SIDECAR_MAGIC or version != SIDECAR_VERSION:
+        raise ValueError(f"Unsupported analysis sidecar: {path}")
+
+    offset = _PREFIX.size
+    header = json.loads(data[offset:offset + header_length])
+    offset += header_length
+
+    tracks = []
+    for info in header["tracks"]:
+        count = info.pop("note_count")
+        wide, narrow = 4 * count, count
+        track = TrackAnalysis(**info)
+        track.onsets = _from_le_bytes("I", data[offset:offset + wide])
+        track.durations = _from_le_bytes("I", data[offset + wide:offset + 2 * wide])
+        offset += 2 * wide
+        track.pitches = _from_le_bytes("B", data[offset:offset + narrow])
+        track.velocities = _from_le_bytes("B", data[offset + narrow:offset + 2 * narrow])
+        offset += 2 * narrow
+        tracks.append(track)
+
+    return MidiAnalysis(
+        source_sha256=header["source_sha256"],
+        midi_type=header["midi_type"],
+        ticks_per_beat=header["ticks_per_beat"],
+        length_ticks=header["length_ticks"],
+        tempo_changes=[tuple(change) for change in header["tempo_changes"]],
+        time_signatures=[tuple(signature) for signature in header["time_signatures"]],
+        tracks=tracks
+    )
+
+
+def analyze_to_sidecar(midi_path: str, sidecar_path: str, sha256: str) -> List[Voice]:
+    """
+    Analyze a MIDI file, store the sidecar and return its voices.
+
+    Entry point for the worker process pool on upload.
+    """
+    analysis = analyze_midi(Path(midi_path), sha256)
+    write_sidecar(analysis, Path(sidecar_path))
+    return analysis.voices()
+
+
+class AnalysisCache:
+    """Small in-process LRU of loaded sidecars keyed by path and file state"""
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[int, int, MidiAnalysis]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> Optional[MidiAnalysis]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._entries.move_to_end(key)
+                record_cache("midi_analysis", True)
+                return entry[2]
+
+        record_cache("midi_analysis", False)
+        analysis = read_sidecar(path)
+        with self._lock:
+            self._entries[key] = (stat.st_mtime_ns, stat.st_size, analysis)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return analysis
+
+
+analysis_cache = AnalysisCache()
+
+
+def load_analysis(song_dir: Path, expected_sha256: Optional[str] = None) -> Optional[MidiAnalysis]:
+    """
+    Return the analysis for a song's MIDI file.
+
+    The sidecar is used when it matches expected_sha256 (the song's
+    midi_sha256). Missing or stale sidecars, e.g. for songs uploaded before
+    sidecars existed, are rebuilt from song.mid. Returns None if the song
+    has no MIDI file.
+    """
+    midi_path = song_dir / "song.mid"
+    sidecar_path = song_dir / ANALYSIS_FILENAME
+
+    try:
+        analysis = analysis_cache.get(sidecar_path)
+    except (ValueError, OSError, KeyError, struct.error):
+        analysis = None
+    if analysis and (expected_sha256 is None or analysis.source_sha256 == expected_sha256):
+        return analysis
+
+    if not midi_path.exists():
+        return None
+    with span("midi_parse"):
+        analysis = analyze_midi(midi_path, expected_sha256)
+    write_sidecar(analysis, sidecar_path)
+    return analysis
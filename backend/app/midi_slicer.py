@@ -0,0 +1,174 @@
+"""
+Per-section MIDI slices
+
+A slice is a small type-1 MIDI file with only the notes that start inside a
+tick range. The tempo and time signature in effect at the start of the
+range are carried in at tick 0, later changes inside the range are kept,
+and each note track keeps its name and program. Slices are built from the
+analysis sidecar, so the source MIDI is never re-parsed.
+
+Slices are cached under songs/<id>/slices/ with a key derived from the
+source MIDI hash and the slice parameters. The file name starts with the
+section ID (or "range" for ad-hoc ranges) so that a section's slices can
+be evicted when it changes. Ad-hoc ranges are kept within
+RANGE_CACHE_MAX_BYTES per song, least recently used first out (see
+app.range_cache).
+"""
+import hashlib
+import io
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import mido
+
+from app.midi_analysis import MidiAnalysis
+from app.range_cache import touch_range, trim_ranges
+from app.storage.locking import atomic_write_bytes
+
+SLICES_DIRNAME = "slices"
+
+# Bump when the slice output changes so old cache entries are not reused
+SLICE_FORMAT_VERSION = 1
+
+
+def _state_at(changes: List[Tuple], tick: int) -> Tuple:
+    """Last change at or before tick"""
+    state = changes[0]
+    for change in changes:
+        if change[0] > tick:
+            break
+        state = change
+    return state
+
+
+def _to_track(events: List[Tuple[int, int, mido.Message]]) -> mido.MidiTrack:
+    """Turn (absolute tick, order, message) tuples into a delta-timed track"""
+    track = mido.MidiTrack()
+    last = 0
+    for tick, _, msg in sorted(events, key=lambda event: (event[0], event[1])):
+        track.append(msg.copy(time=tick - last))
+        last = tick
+    track.append(mido.MetaMessage("end_of_track", time=0))
+    return track
+
+
+def build_slice(
+    analysis: MidiAnalysis,
+    start_tick: int,
+    end_tick: int,
+    tracks: Optional[Iterable[int]] = None,
+    gains: Optional[Dict[int, float]] = None,
+    tempo_scale: float = 1.0
+) -> bytes:
+    """
+    Render the notes starting in [start_tick, end_tick) as MIDI file bytes.
+
+    gains scales the velocities of individual tracks (notes scaled to
+    velocity 0 are dropped) and tempo_scale multiplies every tempo, e.g.
+    0.5 plays at half speed.
+    """
+    wanted = set(tracks) if tracks else None
+    gains = gains or {}
+    mid = mido.MidiFile(type=1, ticks_per_beat=analysis.ticks_per_beat)
+
+    def scaled(tempo: int) -> int:
+        return min(max(round(tempo / tempo_scale), 1), 0xFFFFFF)
+
+    # Conductor track: tempo and meter at the start, then changes inside the range
+    _, tempo = _state_at(analysis.tempo_changes, start_tick)
+    _, numerator, denominator = _state_at(analysis.time_signatures, start_tick)
+    events = [
+        (0, 0, mido.MetaMessage("set_tempo", tempo=scaled(tempo))),
+        (0, 1, mido.MetaMessage("time_signature", numerator=numerator, denominator=denominator)),
+    ]
+    for tick, tempo in analysis.tempo_changes:
+        if start_tick < tick < end_tick:
+            events.append((tick - start_tick, 0, mido.MetaMessage("set_tempo", tempo=scaled(tempo))))
+    for tick, numerator, denominator in analysis.time_signatures:
+        if start_tick < tick < end_tick:
+            events.append((tick - start_tick, 1, mido.MetaMessage(
+                "time_signature", numerator=numerator, denominator=denominator
+            )))
+    mid.tracks.append(_to_track(events))
+
+    for track in analysis.tracks:
+        if not track.note_count or (wanted is not None and track.track_number not in wanted):
+            continue
+
+        channel = track.channel or 0
+        gain = gains.get(track.track_number, 1.0)
+        events = []
+        if track.name:
+            events.append((0, 0, mido.MetaMessage("track_name", name=track.name)))
+        if track.program is not None:
+            events.append((0, 1, mido.Message("program_change", program=track.program, channel=channel)))
+
+        for onset, duration, pitch, velocity in zip(track.onsets, track.durations, track.pitches, track.velocities):
+            if onset < start_tick:
+                continue
+            if onset >= end_tick:
+                break
+            if gain != 1.0:
+                velocity = min(round(velocity * gain), 127)
+                if velocity <= 0:
+                    continue
+            off = min(onset + duration, end_tick) - start_tick
+            # note_off sorts before note_on at the same tick so repeated notes retrigger
+            events.append((onset - start_tick, 3, mido.Message("note_on", note=pitch, velocity=velocity, channel=channel)))
+            events.append((off, 2, mido.Message("note_off", note=pitch, velocity=0, channel=channel)))
+
+        mid.tracks.append(_to_track(events))
+
+    buffer = io.BytesIO()
+    mid.save(file=buffer)
+    return buffer.getvalue()
+
+
+def slice_key(midi_sha256: str, start_tick: int, end_tick: int, tracks: Optional[Iterable[int]]) -> str:
+    """Content-addressed cache key of a slice"""
+    params = {
+        "version": SLICE_FORMAT_VERSION,
+        "midi": midi_sha256,
+        "start": start_tick,
+        "end": end_tick,
+        "tracks": sorted(tracks) if tracks else None
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def get_or_create_slice(
+    song_dir: Path,
+    analysis: MidiAnalysis,
+    start_tick: int,
+    end_tick: int,
+    tracks: Optional[Iterable[int]] = None,
+    section_id: Optional[UUID] = None
+) -> Path:
+    """Return the cached slice file, building it on a miss"""
+    tracks = sorted(tracks) if tracks else None
+    key = slice_key(analysis.source_sha256, start_tick, end_tick, tracks)
+    path = song_dir / SLICES_DIRNAME / f"{section_id or 'range'}-{key}.mid"
+    if path.exists():
+        if section_id is None:
+            touch_range(path)
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_bytes(path, build_slice(analysis, start_tick, end_tick, tracks))
+    if section_id is None:
+        trim_ranges(path.parent, "range-*.mid", keep=path)
+    return path
+
+
+def invalidate_song_slices(song_dir: Path):
+    """Drop every cached slice of a song (e.g. after a MIDI re-upload)"""
+    shutil.rmtree(song_dir / SLICES_DIRNAME, ignore_errors=True)
+
+
+def invalidate_section_slices(song_dir: Path, section_id: UUID):
+    """Drop the cached slices of one section"""
+    for path in (song_dir / SLICES_DIRNAME).glob(f"{section_id}-*.mid"):
+        path.unlink(missing_ok=True)
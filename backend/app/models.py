@@ -1,8 +1,8 @@
 """
 Pydantic models for ChoirLoop API
 """
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, Any, List, Literal, Optional, Union
 from datetime import datetime
 from uuid import UUID, uuid4
 
@@ -13,6 +13,8 @@ class Voice(BaseModel):
     names: List[str] = Field(default_factory=list, description="Voice names assigned to this track (e.g., ['Soprano', 'Alto'])")
     channel: Optional[int] = Field(None, description="MIDI channel")
     note_count: int = Field(..., description="Number of notes in track")
+    track_name: Optional[str] = Field(None, description="Track name stored in the MIDI file")
+    program: Optional[int] = Field(None, description="First MIDI program (instrument) of the track")
 
 
 class PracticeSection(BaseModel):
@@ -27,6 +29,14 @@ class PracticeSection(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class TimedPracticeSection(PracticeSection):
+    """Practice section with its boundaries resolved against the MIDI timeline"""
+    start_time: Optional[float] = Field(None, description="Section start in seconds (original tempo)")
+    end_time: Optional[float] = Field(None, description="Section end in seconds (original tempo)")
+    start_score_measure: Optional[str] = Field(None, description="Score measure number the section starts in")
+    end_score_measure: Optional[str] = Field(None, description="Score measure number the section ends in")
+
+
 class SongBase(BaseModel):
     """Base song model for creation/update"""
     title: str = Field(..., min_length=1, max_length=255)
@@ -49,7 +59,9 @@ class Song(SongBase):
     """Complete song model"""
     id: UUID
     midi_file: Optional[str] = None
+    midi_sha256: Optional[str] = Field(None, description="SHA-256 of the uploaded MIDI file")
     score_file: Optional[str] = None
+    score_sha256: Optional[str] = Field(None, description="SHA-256 of the uploaded score file")
     voices: List[Voice] = Field(default_factory=list)
     practice_sections: List[PracticeSection] = Field(default_factory=list)
     created_at: datetime
@@ -84,6 +96,9 @@ class SongSummary(BaseModel):
     title: str
     description: str
     updated_at: datetime
+    voice_count: int = 0
+    section_count: int = 0
+    voice_names: List[str] = Field(default_factory=list, description="Names of the song's voices (for search)")
 
 
 class PracticeSectionCreate(BaseModel):
@@ -104,3 +119,88 @@ class PracticeSectionUpdate(BaseModel):
     end_measure: Optional[int] = Field(None, ge=1)
     end_beat: Optional[int] = Field(None, ge=1)
     relevant_voices: Optional[List[int]] = Field(None, description="Track numbers this section is relevant for")
+
+
+class SectionCreateOperation(BaseModel):
+    """Bulk operation adding a section"""
+    op: Literal["create"]
+    section: PracticeSectionCreate
+
+
+class SectionUpdateOperation(BaseModel):
+    """Bulk operation changing fields of a section (omitted fields stay unchanged)"""
+    op: Literal["update"]
+    id: UUID
+    changes: PracticeSectionUpdate
+
+
+class SectionDeleteOperation(BaseModel):
+    """Bulk operation removing a section"""
+    op: Literal["delete"]
+    id: UUID
+
+
+SectionOperation = Annotated[
+    Union[SectionCreateOperation, SectionUpdateOperation, SectionDeleteOperation],
+    Field(discriminator="op")
+]
+
+
+class SectionBatch(BaseModel):
+    """Section operations applied in order, all or nothing"""
+    operations: List[SectionOperation] = Field(..., min_length=1, max_length=500)
+
+
+class JsonPatchOperation(BaseModel):
+    """One JSON Patch (RFC 6902) operation"""
+    model_config = ConfigDict(populate_by_name=True)
+
+    op: Literal["add", "remove", "replace", "move", "copy", "test"]
+    path: str = Field(..., description="JSON Pointer, e.g. /title or /practice_sections/0/label")
+    value: Any = None
+    from_: Optional[str] = Field(None, alias="from", description="Source pointer of move and copy")
+
+
+class SongResponse(BaseModel):
+    """Response wrapping a single song"""
+    song: Song
+
+
+class SongListResponse(BaseModel):
+    """Response of the unpaginated song list"""
+    songs: List[SongSummary]
+
+
+class SongPageResponse(BaseModel):
+    """One page of a song search"""
+    songs: List[SongSummary]
+    total: int = Field(..., description="Number of songs matching the search")
+    next_cursor: Optional[str] = Field(None, description="Cursor of the next page (null on the last page)")
+
+
+class SectionResponse(BaseModel):
+    """Response wrapping a single practice section"""
+    section: PracticeSection
+
+
+class SectionListResponse(BaseModel):
+    """Practice sections of a song with their resolved timing"""
+    sections: List[TimedPracticeSection]
+
+
+class MessageResponse(BaseModel):
+    """Confirmation message"""
+    message: str
+
+
+class SectionBatchResponse(BaseModel):
+    """Outcome of a bulk section change"""
+    created: List[PracticeSection]
+    updated: List[PracticeSection]
+    deleted: List[UUID]
+    version: str = Field(..., description="New version of the song (also sent as ETag)")
+
+
+class SongPatchResponse(SongResponse):
+    """Patched song and its new version"""
+    version: str = Field(..., description="New version of the song (also sent as ETag)")
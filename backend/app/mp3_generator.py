@@ -1,206 +1,537 @@
 """
-MP3 Generation Service for ChoirLoop - TEMPORARILY DISABLED
-This module is currently commented out as MP3/ffmpeg functionality has been disabled.
+MP3 Generation Service for ChoirLoop
+Converts MIDI files to MP3 with specific voice mix and tempo settings
+
+Renders never run in a request handler. MP3GeneratorService.request_mp3
+resolves the settings, returns a cached file if there is one and otherwise
+enqueues a render on the render queue (app.render_queue), which runs it in
+a worker process. Finished files are registered with the render cache
+(app.render_cache), which bounds its size.
+
+Two engines are available (RENDER_ENGINE):
+- builtin: the NumPy synthesizer (app.synth) renders the analysis arrays
+  straight to WAV; no system packages needed. One stem per voice track is
+  cached for each range and tempo, so a change of volumes or enabled
+  tracks is only a new mix of cached stems and a tempo change re-renders
+  (re-times) the stems once.
+- fluidsynth: trimmed/remixed MIDI from the analysis sidecar -> WAV
+  (fluidsynth) -> MP3 (ffmpeg)
+
+While a builtin render is queued or running, stream_wav plays the same
+settings measure by measure in the API process, so playback can start
+long before the file is finished. Every listener of a render shares one
+WavBroadcast, and at most STREAM_RENDERS of them synthesize at once.
 """
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+import numpy as np
+
+from app.config import MP3_CACHE_DIR, RENDER_ENGINE, SOUNDFONT_PATH, STREAM_RENDERS
+from app.midi_analysis import TrackAnalysis, load_analysis
+from app.midi_slicer import build_slice
+from app.render_cache import render_cache
+from app.render_queue import PRIORITY_INTERACTIVE, RenderJob, render_queue
+from app.storage import AsyncStorageService, StorageService
+from app.synth import (
+    SAMPLE_RATE, SYNTH_VERSION, pcm16, render_stem, synthesize, synthesize_chunks, wav_stream_header, write_wav
+)
+from app.timeline import load_timeline
+from app.workers import run_in_thread
+
+# Volume of a track without an explicit setting (matches the player default)
+DEFAULT_TRACK_VOLUME_DB = -10
+
+# Upper bound for one external conversion step
+RENDER_TIMEOUT_SECONDS = 600
+
+# Cached stems are stored as float16 .npy files in the render cache
+STEM_SUFFIX = ".npy"
+
+
+def _run_tool(command: list, step: str):
+    """Run an external converter, turning failures into ValueError"""
+    if shutil.which(command[0]) is None:
+        raise ValueError(f"{step} failed: {command[0]} is not installed")
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=RENDER_TIMEOUT_SECONDS)
+    except subprocess.CalledProcessError as e:
+        print(f"[MP3Generator] {command[0]} error: {e.stderr.decode(errors='replace')}")
+        raise ValueError(f"{step} failed: {e.stderr.decode(errors='replace')}")
+    except subprocess.TimeoutExpired:
+        raise ValueError(f"{step} timed out")
+
+
+def render_mp3(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Render one MP3 and return its path (this engine uses no stems).
+
+    Entry point for the render process pool; settings is the plain dict
+    built by MP3GeneratorService.request_mp3.
+    """
+    settings_hash = settings["settings_hash"]
+    output = render_cache.path_for(settings_hash, ".mp3")
+    midi_path = _temp_path(MP3_CACHE_DIR / f"{settings_hash}.mid")
+    wav_path = _temp_path(MP3_CACHE_DIR / f"{settings_hash}.wav")
+    mp3_path = _temp_path(MP3_CACHE_DIR / f"{settings_hash}.mp3")
+
+    analysis = load_analysis(Path(settings["song_dir"]), settings["midi_sha256"])
+    if analysis is None:
+        raise ValueError("MIDI file not found on disk")
+
+    try:
+        midi_path.write_bytes(build_slice(
+            analysis,
+            settings["start_tick"],
+            settings["end_tick"] if settings["end_tick"] is not None else analysis.length_ticks,
+            tracks=settings["tracks"],
+            gains={int(k): v for k, v in settings["gains"].items()},
+            tempo_scale=settings["tempo"] / 100
+        ))
+
+        # Convert MIDI to WAV using FluidSynth
+        _run_tool([
+            "fluidsynth",
+            "-ni",  # No interactive mode
+            "-F", str(wav_path),
+            "-r", "44100",  # Sample rate
+            SOUNDFONT_PATH,
+            str(midi_path)
+        ], "MIDI to WAV conversion")
+
+        # Convert WAV to MP3 using ffmpeg
+        _run_tool([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-i", str(wav_path),
+            "-codec:a", "libmp3lame", "-b:a", "192k",
+            str(mp3_path)
+        ], "WAV to MP3 conversion")
+
+        os.replace(mp3_path, output)
+    finally:
+        # Cleanup temporary files
+        for path in (midi_path, wav_path, mp3_path):
+            path.unlink(missing_ok=True)
+
+    print(f"[MP3Generator] MP3 generated successfully: {output}")
+    return {"path": str(output), "stems": []}
+
+
+def stem_key(
+    midi_sha256: str,
+    track_number: int,
+    start_tick: int,
+    end_tick: int,
+    tempo: int,
+    sample_rate: int = SAMPLE_RATE
+) -> str:
+    """Render cache key of one track's stem for a range and tempo"""
+    params = {
+        "synth": SYNTH_VERSION,
+        "midi": midi_sha256,
+        "track": track_number,
+        "start": start_tick,
+        "end": end_tick,
+        "tempo": tempo,
+        "sample_rate": sample_rate
+    }
+    return "stem-" + hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def _temp_path(path: Path) -> Path:
+    """Unique temporary file next to path (matches the render cache's temp file sweep)"""
+    return path.with_name(f"{path.stem}-{uuid4().hex}_temp{path.suffix}")
+
+
+def _cached_stem(path: Path, render: Callable[[], np.ndarray]) -> Tuple[np.ndarray, bool]:
+    """
+    Load a stem from the cache or render and store it; returns (stem, rendered).
+
+    Several renders may need the same stem at once (in this process or
+    another worker): each writes its own temporary file and the last
+    os.replace wins, which is harmless since all of them hold the same
+    samples. If storing fails the rendered stem is still used (and counted
+    as rendered); it is just not cached.
+    """
+    try:
+        return np.load(path, mmap_mode="r"), False
+    except (FileNotFoundError, ValueError, OSError):
+        pass
+
+    stem = render()
+    temp_path = _temp_path(path)
+    try:
+        with open(temp_path, "wb") as f:
+            np.save(f, stem.astype(np.float16))
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"[MP3Generator] Could not store stem {path.name}: {e}")
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return stem, True
+
+
+def render_wav(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Render one WAV file with the built-in synthesizer.
+
+    Entry point for the render process pool; settings is the plain dict
+    built by MP3GeneratorService.request_mp3. Stems come from the render
+    cache where possible; the result lists every stem used and whether it
+    had to be rendered, so the API process can register the new ones.
+    """
+    settings_hash = settings["settings_hash"]
+    output = render_cache.path_for(settings_hash, ".wav")
+    wav_path = _temp_path(output)
+
+    analysis = load_analysis(Path(settings["song_dir"]), settings["midi_sha256"])
+    if analysis is None:
+        raise ValueError("MIDI file not found on disk")
+
+    start_tick = settings["start_tick"]
+    end_tick = settings["end_tick"] if settings["end_tick"] is not None else analysis.length_ticks
+    tempo_scale = settings["tempo"] / 100
+    used_stems: List[Dict[str, Any]] = []
+
+    def stems(track: TrackAnalysis) -> np.ndarray:
+        key = stem_key(analysis.source_sha256, track.track_number, start_tick, end_tick, settings["tempo"])
+        path = render_cache.path_for(key, STEM_SUFFIX)
+        stem, rendered = _cached_stem(
+            path, lambda: render_stem(analysis, track, start_tick, end_tick, tempo_scale)
+        )
+        used_stems.append({"key": key, "path": str(path), "rendered": rendered})
+        return stem
+
+    samples = synthesize(
+        analysis,
+        start_tick,
+        end_tick,
+        tracks=settings["tracks"],
+        gains={int(k): v for k, v in settings["gains"].items()},
+        tempo_scale=tempo_scale,
+        count_in=settings["count_in"],
+        stems=stems
+    )
+    try:
+        write_wav(wav_path, samples)
+        os.replace(wav_path, output)
+    finally:
+        wav_path.unlink(missing_ok=True)
+
+    print(f"[MP3Generator] WAV generated successfully: {output}")
+    return {"path": str(output), "stems": used_stems}
+
+
+class StemStats:
+    """How often renders could be built purely from cached stems"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.stem_only_renders = 0
+        self.stems_rendered = 0
+        self.stems_reused = 0
+
+    def record(self, stems: List[Dict[str, Any]]):
+        if not stems:
+            return
+        rendered = sum(1 for stem in stems if stem["rendered"])
+        with self._lock:
+            self.renders += 1
+            self.stems_rendered += rendered
+            self.stems_reused += len(stems) - rendered
+            if not rendered:
+                self.stem_only_renders += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "renders": self.renders,
+                "stem_only_renders": self.stem_only_renders,
+                "stem_only_fraction": round(self.stem_only_renders / self.renders, 4) if self.renders else 0.0,
+                "stems_rendered": self.stems_rendered,
+                "stems_reused": self.stems_reused
+            }
+
+
+stem_stats = StemStats()
+
+
+async def stream_wav(settings: Dict[str, Any]) -> AsyncIterator[bytes]:
+    """
+    Render the settings of a builtin render as a WAV stream, one measure per
+    chunk. Each measure is synthesized in the thread pool right before it
+    is sent; nothing is cached.
+    """
+    started = time.perf_counter()
+    song_dir = Path(settings["song_dir"])
+    analysis = await run_in_thread(load_analysis, song_dir, settings["midi_sha256"])
+    timeline = await run_in_thread(load_timeline, song_dir, settings["midi_sha256"])
+    if analysis is None or timeline is None:
+        return
+
+    start_tick = settings["start_tick"]
+    end_tick = settings["end_tick"] if settings["end_tick"] is not None else analysis.length_ticks
+    chunks = synthesize_chunks(
+        analysis,
+        [start_tick, *timeline.bar_lines(start_tick, end_tick), max(end_tick, start_tick)],
+        tracks=settings["tracks"],
+        gains={int(k): v for k, v in settings["gains"].items()},
+        tempo_scale=settings["tempo"] / 100,
+        count_in=settings["count_in"]
+    )
+
+    yield wav_stream_header(SAMPLE_RATE)
+    first = True
+    while True:
+        samples = await run_in_thread(next, chunks, None)
+        if samples is None:
+            break
+        yield pcm16(samples)
+        if first:
+            first = False
+            print(f"[MP3Generator] Streaming {settings['settings_hash']}: "
+                  f"first chunk after {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+class WavBroadcast:
+    """
+    One streaming synthesis of a render job, shared by all its listeners.
+
+    Chunks are kept in memory so listeners that join late start from the
+    beginning; the synthesis waits for one of STREAM_RENDERS slots, stops
+    when its last listener leaves and is dropped once the job has finished
+    (the render cache serves later requests).
+    """
+
+    def __init__(self, job: RenderJob):
+        self.job = job
+        self.chunks: List[bytes] = []
+        self.finished = False
+        self.stopped = False
+        self.listeners = 0
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._produce())
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _produce(self):
+        try:
+            async with _stream_slots:
+                async for chunk in stream_wav(self.job.args[0]):
+                    self.chunks.append(chunk)
+                    self._notify()
+            self.finished = True
+            self._notify()
+            await self.job.done.wait()
+        finally:
+            self.finished = True
+            self._notify()
+            if _broadcasts.get(self.job.settings_hash) is self:
+                del _broadcasts[self.job.settings_hash]
+
+    async def listen(self) -> AsyncIterator[bytes]:
+        """All chunks from the start, then new ones as they are synthesized"""
+        self.listeners += 1
+        try:
+            position = 0
+            while True:
+                if position < len(self.chunks):
+                    yield self.chunks[position]
+                    position += 1
+                elif self.finished:
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.listeners -= 1
+            if not self.listeners and not self._task.done():
+                self.stopped = True
+                self._task.cancel()
+
+
+_broadcasts: Dict[str, WavBroadcast] = {}
+_stream_slots = asyncio.Semaphore(STREAM_RENDERS)
+
+
+# Render function per engine
+RENDERERS = {
+    "builtin": render_wav,
+    "fluidsynth": render_mp3
+}
+
+
+class MP3GeneratorService:
+    """Handle MP3 generation from MIDI files with custom settings"""
+
+    @staticmethod
+    def ensure_cache_dir():
+        """Ensure MP3 cache directory exists and its index is loaded"""
+        MP3_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        render_cache.ensure_loaded()
+
+    @staticmethod
+    def generate_settings_hash(
+        song_id: UUID,
+        tempo: int,
+        track_volumes: Dict[int, int],
+        enabled_tracks: Dict[int, bool],
+        section_id: Optional[UUID] = None,
+        start_measure: Optional[int] = None,
+        start_beat: Optional[int] = None,
+        end_measure: Optional[int] = None,
+        end_beat: Optional[int] = None,
+        midi_sha256: Optional[str] = None,
+        count_in: int = 0,
+        engine: str = RENDER_ENGINE
+    ) -> str:
+        """Generate unique hash for MP3 settings combination"""
+        settings = {
+            "song_id": str(song_id),
+            "tempo": tempo,
+            "track_volumes": {str(k): v for k, v in track_volumes.items()},
+            "enabled_tracks": {str(k): v for k, v in enabled_tracks.items()},
+            "section_id": str(section_id) if section_id else None,
+            "start_measure": start_measure,
+            "start_beat": start_beat,
+            "end_measure": end_measure,
+            "end_beat": end_beat,
+            "midi_sha256": midi_sha256,
+            "count_in": count_in,
+            "engine": engine
+        }
+
+        settings_json = json.dumps(settings, sort_keys=True)
+        return hashlib.sha256(settings_json.encode()).hexdigest()
+
+    @staticmethod
+    def get_cached_mp3_path(settings_hash: str, record: bool = True, song_id: Optional[UUID] = None) -> Optional[Path]:
+        """
+        Get path to cached MP3 if it exists (record=False: don't count as a
+        cache lookup); with song_id only if it was rendered for that song
+        """
+        return render_cache.get(settings_hash, record=record, song_id=song_id)
+
+    @staticmethod
+    def register_render(settings_hash: str, song_id: UUID, result: Dict[str, Any]):
+        """Add a finished render and its new stems to the render cache"""
+        for stem in result["stems"]:
+            # Stems are keyed by the MIDI content hash and shared by every song using that file
+            if stem["rendered"]:
+                if Path(stem["path"]).exists():  # Missing if storing it failed
+                    render_cache.put(stem["key"], Path(stem["path"]))
+            else:
+                render_cache.get(stem["key"], record=False)
+        render_cache.put(settings_hash, Path(result["path"]), song_id)
+        stem_stats.record(result["stems"])
+
+    @staticmethod
+    def stream_job(job: RenderJob) -> Optional[AsyncIterator[bytes]]:
+        """WAV stream of a queued or running render, None if its engine cannot stream"""
+        if job.func is not render_wav:
+            return None
+        broadcast = _broadcasts.get(job.settings_hash)
+        if broadcast is None or broadcast.job is not job or broadcast.stopped:
+            broadcast = _broadcasts[job.settings_hash] = WavBroadcast(job)
+        return broadcast.listen()
+
+    @staticmethod
+    async def request_mp3(
+        song_id: UUID,
+        tempo: int = 100,
+        track_volumes: Optional[Dict[int, int]] = None,
+        enabled_tracks: Optional[Dict[int, bool]] = None,
+        section_id: Optional[UUID] = None,
+        start_measure: Optional[int] = None,
+        start_beat: Optional[int] = None,
+        end_measure: Optional[int] = None,
+        end_beat: Optional[int] = None,
+        count_in: int = 0,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Tuple[str, Optional[RenderJob]]:
+        """
+        Return the settings hash and the render job for these settings.
+
+        The job is None when the MP3 is already cached. Identical requests
+        that are still queued or running share one job. Raises LookupError
+        if the song, its MIDI file or the section does not exist and
+        ValueError for settings that cannot be rendered.
+        """
+        track_volumes = track_volumes or {}
+        enabled_tracks = enabled_tracks or {}
+        render = RENDERERS.get(RENDER_ENGINE)
+        if render is None:
+            raise ValueError(f"Unknown render engine: {RENDER_ENGINE}")
+
+        song = await AsyncStorageService.load_song(song_id)
+        if not song or not song.midi_file:
+            raise LookupError("Song or MIDI file not found")
+
+        # A section defines the range; the hash covers its current bounds
+        if section_id:
+            section = next((s for s in song.practice_sections if s.id == section_id), None)
+            if not section:
+                raise LookupError("Practice section not found")
+            start_measure, start_beat = section.start_measure, section.start_beat
+            end_measure, end_beat = section.end_measure, section.end_beat
+
+        settings_hash = MP3GeneratorService.generate_settings_hash(
+            song_id, tempo, track_volumes, enabled_tracks,
+            section_id, start_measure, start_beat, end_measure, end_beat,
+            song.midi_sha256, count_in
+        )
+
+        if await run_in_thread(MP3GeneratorService.get_cached_mp3_path, settings_hash, True, song_id):
+            print(f"[MP3Generator] Using cached render: {settings_hash}")
+            return settings_hash, None
+
+        # Join an identical render in flight without resolving the settings again
+        if render_queue.find(settings_hash):
+            return settings_hash, render_queue.submit(settings_hash, song_id, render, priority=priority)
+
+        song_dir = StorageService.get_song_dir(song_id)
+        timeline = await run_in_thread(load_timeline, song_dir, song.midi_sha256)
+        if timeline is None:
+            raise LookupError("MIDI file not found on disk")
+
+        start_tick = timeline.measure_beat_to_tick(start_measure, start_beat or 1) if start_measure else 0
+        end_tick = timeline.measure_beat_to_tick(end_measure, end_beat or 1) if end_measure else None
+
+        voices = [voice.track_number for voice in song.voices]
+        tracks = [track for track in voices if enabled_tracks.get(track, True)]
+        if not tracks:
+            raise ValueError("No enabled tracks to render")
+        gains = {
+            track: max(0.0, min(1.0, 10 ** (track_volumes.get(track, DEFAULT_TRACK_VOLUME_DB) / 20)))
+            for track in tracks
+        }
 
-# """
-# MP3 Generation Service for ChoirLoop
-# Converts MIDI files to MP3 with specific voice mix and tempo settings
-# """
-# import hashlib
-# import json
-# import subprocess
-# from pathlib import Path
-# from typing import Dict, Optional, List
-# from uuid import UUID
-# import mido
-# from pydub import AudioSegment
-
-# from app.storage import StorageService
-
-# MP3_CACHE_DIR = Path("/app/data/mp3_cache") if Path("/app/data").exists() else Path("../data/mp3_cache")
-
-
-# class MP3GeneratorService:
-#     """Handle MP3 generation from MIDI files with custom settings"""
-#     
-#     @staticmethod
-#     def ensure_cache_dir():
-#         """Ensure MP3 cache directory exists"""
-#         MP3_CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    
-#     @staticmethod
-#     def generate_settings_hash(
-#         song_id: UUID,
-#         tempo: int,
-#         track_volumes: Dict[int, int],
-#         enabled_tracks: Dict[int, bool],
-#         section_id: Optional[UUID] = None,
-#         start_measure: Optional[int] = None,
-#         start_beat: Optional[int] = None,
-#         end_measure: Optional[int] = None,
-#         end_beat: Optional[int] = None
-#     ) -> str:
-#         """Generate unique hash for MP3 settings combination"""
-#         settings = {
-#             "song_id": str(song_id),
-#             "tempo": tempo,
-#             "track_volumes": track_volumes,
-#             "enabled_tracks": enabled_tracks,
-#             "section_id": str(section_id) if section_id else None,
-#             "start_measure": start_measure,
-#             "start_beat": start_beat,
-#             "end_measure": end_measure,
-#             "end_beat": end_beat
-#         }
-#         
-#         settings_json = json.dumps(settings, sort_keys=True)
-#         return hashlib.sha256(settings_json.encode()).hexdigest()
-    
-#     @staticmethod
-#     async def generate_mp3(
-#         song_id: UUID,
-#         tempo: int = 100,
-#         track_volumes: Optional[Dict[int, int]] = None,
-#         enabled_tracks: Optional[Dict[int, bool]] = None,
-#         section_id: Optional[UUID] = None,
-#         start_measure: Optional[int] = None,
-#         start_beat: Optional[int] = None,
-#         end_measure: Optional[int] = None,
-#         end_beat: Optional[int] = None
-#     ) -> Path:
-#         """
-#         Generate MP3 file from MIDI with specified settings
-#         Returns path to generated MP3 file
-#         """
-#         MP3GeneratorService.ensure_cache_dir()
-#         
-#         # Generate hash for these settings
-#         settings_hash = MP3GeneratorService.generate_settings_hash(
-#             song_id, tempo, track_volumes or {}, enabled_tracks or {},
-#             section_id, start_measure, start_beat, end_measure, end_beat
-#         )
-#         
-#         # Check if MP3 already exists in cache
-#         cached_mp3 = MP3_CACHE_DIR / f"{settings_hash}.mp3"
-#         if cached_mp3.exists():
-#             print(f"[MP3Generator] Using cached MP3: {settings_hash}")
-#             return cached_mp3
-#         
-#         print(f"[MP3Generator] Generating new MP3: {settings_hash}")
-#         
-#         # Load song and MIDI file
-#         song = StorageService.load_song(song_id)
-#         if not song or not song.midi_file:
-#             raise ValueError("Song or MIDI file not found")
-#         
-#         midi_path = StorageService.get_song_dir(song_id) / song.midi_file
-#         if not midi_path.exists():
-#             raise ValueError("MIDI file not found on disk")
-#         
-#         # Create modified MIDI with volume adjustments and section trimming
-#         modified_midi_path = MP3_CACHE_DIR / f"{settings_hash}_temp.mid"
-#         MP3GeneratorService.create_modified_midi(
-#             midi_path,
-#             modified_midi_path,
-#             tempo,
-#             track_volumes or {},
-#             enabled_tracks or {},
-#             start_measure,
-#             start_beat,
-#             end_measure,
-#             end_beat
-#         )
-#         
-#         # Convert MIDI to WAV using FluidSynth
-#         wav_path = MP3_CACHE_DIR / f"{settings_hash}_temp.wav"
-#         soundfont = "/usr/share/sounds/sf2/FluidR3_GM.sf2"  # Default soundfont
-#         
-#         try:
-#             subprocess.run([
-#                 "fluidsynth",
-#                 "-ni",  # No interactive mode
-#                 soundfont,
-#                 modified_midi_path,
-#                 "-F", str(wav_path),
-#                 "-r", "44100"  # Sample rate
-#             ], check=True, capture_output=True)
-#         except subprocess.CalledProcessError as e:
-#             print(f"[MP3Generator] FluidSynth error: {e.stderr.decode()}")
-#             raise ValueError(f"MIDI to WAV conversion failed: {e.stderr.decode()}")
-#         
-#         # Convert WAV to MP3 using pydub (which uses ffmpeg)
-#         try:
-#             audio = AudioSegment.from_wav(str(wav_path))
-#             audio.export(str(cached_mp3), format="mp3", bitrate="192k")
-#         except Exception as e:
-#             print(f"[MP3Generator] WAV to MP3 conversion error: {e}")
-#             raise ValueError(f"WAV to MP3 conversion failed: {str(e)}")
-#         
-#         # Cleanup temporary files
-#         modified_midi_path.unlink(missing_ok=True)
-#         wav_path.unlink(missing_ok=True)
-#         
-#         print(f"[MP3Generator] MP3 generated successfully: {cached_mp3}")
-#         return cached_mp3
-    
-#     @staticmethod
-#     def create_modified_midi(
-#         source_midi: Path,
-#         dest_midi: Path,
-#         tempo_percent: int,
-#         track_volumes: Dict[int, int],
-#         enabled_tracks: Dict[int, bool],
-#         start_measure: Optional[int] = None,
-#         start_beat: Optional[int] = None,
-#         end_measure: Optional[int] = None,
-#         end_beat: Optional[int] = None
-#     ):
-#         """Create a modified MIDI file with tempo and volume adjustments"""
-#         mid = mido.MidiFile(str(source_midi))
-#         
-#         # Adjust tempo
-#         tempo_multiplier = 100 / tempo_percent
-#         
-#         # Create new MIDI file
-#         new_mid = mido.MidiFile()
-#         new_mid.ticks_per_beat = mid.ticks_per_beat
-#         
-#         for track_idx, track in enumerate(mid.tracks):
-#             new_track = mido.MidiTrack()
-#             
-#             # Check if this track should be included
-#             is_enabled = enabled_tracks.get(track_idx, True)
-#             volume_db = track_volumes.get(track_idx, -10) if is_enabled else -100
-#             
-#             # Convert dB to MIDI velocity multiplier (approximate)
-#             # -60dB = 0, 0dB = 1.0
-#             velocity_multiplier = max(0, min(1, 10 ** (volume_db / 20)))
-#             
-#             for msg in track:
-#                 new_msg = msg.copy()
-#                 
-#                 # Adjust tempo in meta messages
-#                 if msg.type == 'set_tempo':
-#                     new_msg = mido.MetaMessage('set_tempo', 
-#                         tempo=int(msg.tempo * tempo_multiplier),
-#                         time=msg.time
-#                     )
-#                 
-#                 # Adjust note velocity for volume
-#                 elif msg.type == 'note_on' and hasattr(msg, 'velocity'):
-#                     new_velocity = int(msg.velocity * velocity_multiplier)
-#                     new_msg = msg.copy(velocity=new_velocity)
-#                 
-#                 new_track.append(new_msg)
-#             
-#             new_mid.tracks.append(new_track)
-#         
-#         # Save modified MIDI
-#         new_mid.save(str(dest_midi))
-    
-#     @staticmethod
-#     def get_cached_mp3_path(settings_hash: str) -> Optional[Path]:
-#         """Get path to cached MP3 if it exists"""
-#         cached_mp3 = MP3_CACHE_DIR / f"{settings_hash}.mp3"
-#         return cached_mp3 if cached_mp3.exists() else None
+        await run_in_thread(MP3GeneratorService.ensure_cache_dir)
+        print(f"[MP3Generator] Generating new render ({RENDER_ENGINE}): {settings_hash}")
+        settings = {
+            "settings_hash": settings_hash,
+            "song_dir": str(song_dir),
+            "midi_sha256": song.midi_sha256,
+            "start_tick": start_tick,
+            "end_tick": end_tick,
+            "tracks": tracks,
+            "gains": gains,
+            "tempo": tempo,
+            "count_in": count_in
+        }
+        return settings_hash, render_queue.submit(
+            settings_hash, song_id, render, settings,
+            priority=priority,
+            on_done=lambda result: MP3GeneratorService.register_render(settings_hash, song_id, result)
+        )
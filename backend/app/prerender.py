@@ -0,0 +1,204 @@
+"""
+Background pre-rendering of practice packs
+
+Singers keep requesting the same renders: one practice section with their
+own voice highlighted (the guided "focus on own voice" mix) at a slower or
+full tempo. Whenever sections or voices change, the scheduler queues these
+combinations (section x highlighted voice x PRERENDER_TEMPOS) as background
+render jobs, so opening a practice link is usually a cache hit.
+
+The scheduler only keeps PRERENDER_WORKERS of its jobs in the render queue
+at a time; that caps the render workers pre-rendering can take and leaves
+the rest for interactive requests, which run first anyway. Scheduling a
+section again drops its pending combinations and cancels its jobs that
+have not started yet, since they were built for the old bounds.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from app.config import PRERENDER_ENABLED, PRERENDER_TEMPOS, PRERENDER_WORKERS
+from app.mp3_generator import MP3GeneratorService
+from app.render_queue import PRIORITY_BACKGROUND, RenderJob, render_queue
+from app.storage import AsyncStorageService
+
+# Mix of the frontend's guided "focus on own voice" step
+HIGHLIGHT_VOLUME_DB = -5
+BACKGROUND_VOLUME_DB = -30
+
+# (song ID, section ID); a section ID of None stands for all sections of the song
+PackKey = Tuple[UUID, Optional[UUID]]
+
+
+class PrerenderScheduler:
+    """Feeds practice-pack renders into the render queue within a CPU budget"""
+
+    def __init__(self, tempos: List[int], max_jobs: int, enabled: bool = True):
+        self.tempos = tempos
+        self.max_jobs = max(1, max_jobs)
+        self.enabled = enabled
+        # Combinations still to submit; None until built from the song
+        self._pending: "OrderedDict[PackKey, Optional[List[Dict[str, Any]]]]" = OrderedDict()
+        self._jobs: Dict[PackKey, List[RenderJob]] = {}
+        self._running = 0
+        self._trackers: Set[asyncio.Task] = set()
+        # Bumped by every schedule() so stale song reads are noticed
+        self._generation = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.cached = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the scheduler task on the running event loop"""
+        if self._task or not self.enabled:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="prerender-scheduler")
+
+    async def stop(self):
+        """Stop scheduling (jobs already in the render queue are left to it)"""
+        tasks = [self._task, *self._trackers] if self._task else list(self._trackers)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._trackers.clear()
+        self._task = None
+        self._wakeup = None
+
+    def schedule(self, song_id: UUID, section_ids: Optional[List[UUID]] = None):
+        """
+        (Re)build the practice packs of some or all sections of a song.
+
+        Work for these sections that is still pending or queued is stale
+        and cancelled first.
+        """
+        if not self._task:
+            return
+        keys = [(song_id, section_id) for section_id in section_ids] if section_ids else [(song_id, None)]
+        self._generation += 1
+        for key in keys:
+            self.cancel(*key)
+            self._pending[key] = None
+        self._wakeup.set()
+
+    def cancel(self, song_id: UUID, section_id: Optional[UUID] = None):
+        """Drop pending combinations and cancel queued jobs of a section (or a whole song)"""
+        for key in list(self._pending) + list(self._jobs):
+            if key[0] != song_id or (section_id is not None and key[1] != section_id):
+                continue
+            self._pending.pop(key, None)
+            for job in self._jobs.get(key, []):
+                if render_queue.cancel(job):
+                    self.cancelled += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Scheduler statistics for monitoring"""
+        return {
+            "enabled": self.enabled,
+            "tempos": self.tempos,
+            "max_jobs": self.max_jobs,
+            "pending_sections": len(self._pending),
+            "active_jobs": self._running,
+            "submitted": self.submitted,
+            "cached": self.cached,
+            "cancelled": self.cancelled,
+            "failed": self.failed
+        }
+
+    async def _run(self):
+        """Submit pending combinations while the budget allows"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending and self._running < self.max_jobs:
+                key, combinations = next(iter(self._pending.items()))
+                try:
+                    if combinations is None:
+                        await self._expand(key)
+                    elif not combinations:
+                        del self._pending[key]
+                    else:
+                        await self._submit(key, combinations.pop(0))
+                except Exception as e:
+                    print(f"[Prerender] Dropping practice pack of section {key[1]}: {e}")
+                    self.failed += 1
+                    self._pending.pop(key, None)
+
+    async def _expand(self, key: PackKey):
+        """Build the combinations of a pending section from the current song"""
+        song_id, section_id = key
+        generation = self._generation
+        song = await AsyncStorageService.load_song(song_id)
+        if self._pending.get(key, []) is not None or generation != self._generation:
+            return  # Cancelled meanwhile, or rescheduled and read again next round
+        del self._pending[key]
+        if not song or not song.midi_file or not song.voices:
+            return
+
+        if section_id is None:
+            # Whole song: one pack per section
+            for section in song.practice_sections:
+                self.cancel(song_id, section.id)
+                self._pending[(song_id, section.id)] = None
+            return
+
+        if not any(section.id == section_id for section in song.practice_sections):
+            return
+        tracks = [voice.track_number for voice in song.voices]
+        self._pending[key] = [
+            {
+                "tempo": tempo,
+                "track_volumes": {
+                    track: HIGHLIGHT_VOLUME_DB if track == highlighted else BACKGROUND_VOLUME_DB
+                    for track in tracks
+                },
+                "enabled_tracks": {track: True for track in tracks}
+            }
+            for tempo in self.tempos
+            for highlighted in tracks
+        ]
+
+    async def _submit(self, key: PackKey, combination: Dict[str, Any]):
+        song_id, section_id = key
+        try:
+            _, job = await MP3GeneratorService.request_mp3(
+                song_id,
+                section_id=section_id,
+                priority=PRIORITY_BACKGROUND,
+                **combination
+            )
+        except (LookupError, ValueError) as e:
+            # Section or song gone, or nothing to render
+            print(f"[Prerender] Skipping section {section_id}: {e}")
+            self.failed += 1
+            self._pending.pop(key, None)
+            return
+
+        if job is None:
+            self.cached += 1
+            return
+        self.submitted += 1
+        self._running += 1
+        self._jobs.setdefault(key, []).append(job)
+        tracker = asyncio.create_task(self._track(key, job))
+        self._trackers.add(tracker)
+        tracker.add_done_callback(self._trackers.discard)
+
+    async def _track(self, key: PackKey, job: RenderJob):
+        """Release the job's budget slot once it has finished or was cancelled"""
+        await job.done.wait()
+        self._running -= 1
+        jobs = self._jobs.get(key, [])
+        if job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del self._jobs[key]
+        if self._wakeup:
+            self._wakeup.set()
+
+
+prerender_scheduler = PrerenderScheduler(PRERENDER_TEMPOS, PRERENDER_WORKERS, PRERENDER_ENABLED)
@@ -0,0 +1,75 @@
+"""
+Size bound for cached ad-hoc ranges
+
+MIDI slices of measure ranges (app.midi_slicer) and MusicXML range
+documents (app.score_processing) are built on demand for whatever range a
+client asks for, so their cache directories would grow without bound.
+Each cache keeps at most RANGE_CACHE_MAX_BYTES per song: a hit refreshes
+the file's modification time, and after a miss the least recently used
+files are removed until the directory fits its budget again.
+
+Files used within the last RANGE_CACHE_MIN_AGE_SECONDS are never removed,
+so a file cannot disappear between being built and being served.
+"""
+import os
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from app.config import RANGE_CACHE_MAX_BYTES
+
+RANGE_CACHE_MIN_AGE_SECONDS = 60
+
+
+def touch_range(path: Path):
+    """Mark a cached range as used"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def trim_ranges(
+    directory: Path,
+    pattern: str,
+    companions: Iterable[str] = (),
+    max_bytes: int = RANGE_CACHE_MAX_BYTES,
+    keep: Optional[Path] = None
+) -> int:
+    """
+    Remove the least recently used files matching pattern until the rest
+    fit into max_bytes; returns the number removed.
+
+    companions are suffixes of variants stored next to each file (e.g.
+    precompressed ".gz"); they count towards its size and go with it.
+    """
+    companions = list(companions)
+    entries = []
+    total = 0
+    for path in directory.glob(pattern):
+        files: List[Path] = [path, *(path.with_name(path.name + suffix) for suffix in companions)]
+        size = 0
+        try:
+            last_used = path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        for file in files:
+            try:
+                size += file.stat().st_size
+            except FileNotFoundError:
+                pass
+        entries.append((last_used, path, files, size))
+        total += size
+
+    removed = 0
+    cutoff = time.time() - RANGE_CACHE_MIN_AGE_SECONDS
+    for last_used, path, files, size in sorted(entries, key=lambda entry: entry[0]):
+        if total <= max_bytes or last_used >= cutoff:
+            break
+        if path == keep:
+            continue
+        for file in files:
+            file.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
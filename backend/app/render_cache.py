@@ -0,0 +1,336 @@
+"""
+Render cache for generated practice audio
+
+Rendered files live in MP3_CACHE_DIR and are tracked in a metadata index
+(MP3_CACHE_DIR/index.json) with their size, owning song, last access time
+and hit count. The index survives restarts and is reconciled with the
+directory on load: files without an entry are adopted, entries without a
+file are dropped.
+
+When the total size exceeds RENDER_CACHE_MAX_BYTES, entries are evicted
+least recently used first ("lru") or least frequently used first ("lfu"),
+depending on RENDER_CACHE_POLICY. Temporary files left behind by renders
+that crashed are swept on load and whenever the cache is trimmed.
+
+Render workers only write the finished file; the API process registers
+it with put(). Every API process (e.g. each uvicorn worker) keeps its own
+copy of the index, so every write of index.json happens under a file lock
+and first merges the index on disk and the directory into that copy:
+entries and evictions of other processes are kept, and files no index
+knows about (such as stems of a render job that failed later) are adopted
+and count towards the budget.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from app.config import MP3_CACHE_DIR, RENDER_CACHE_MAX_BYTES, RENDER_CACHE_POLICY
+from app.storage.locking import atomic_write_text, file_lock
+
+INDEX_FILENAME = "index.json"
+LOCK_FILENAME = ".index.lock"
+INDEX_VERSION = 1
+
+# Renders write <key>_temp.* files; older ones belong to renders that died
+TEMP_FILE_PATTERN = "*_temp.*"
+TEMP_FILE_MAX_AGE_SECONDS = 3600
+
+# Access times and hit counts are written back at most this often
+FLUSH_INTERVAL_SECONDS = 30
+
+
+@dataclass
+class RenderCacheEntry:
+    """One cached render"""
+    key: str
+    filename: str
+    size: int
+    song_id: Optional[str] = None
+    created_at: float = 0.0
+    last_access: float = 0.0
+    hits: int = 0
+
+
+class RenderCache:
+    """Size-bounded cache of rendered files with a persistent index"""
+
+    def __init__(self, directory: Path, max_bytes: int, policy: str = "lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown render cache policy: {policy}")
+        self.directory = Path(directory)
+        self.index_file = self.directory / INDEX_FILENAME
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._lock = threading.RLock()
+        self._entries: Dict[str, RenderCacheEntry] = {}
+        self._loaded = False
+        self._dirty = False
+        self._last_flush = 0.0
+        # (mtime, size) of index.json when we last read or wrote it
+        self._index_stamp: Optional[Tuple[int, int]] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def load(self):
+        """Read the index, reconcile it with the directory and sweep temp files"""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._entries = {}
+            self._loaded = True
+            self.sweep_temp_files()
+            self.flush(force=True)
+
+    def _index_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.index_file.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_index(self) -> Dict[str, RenderCacheEntry]:
+        entries: Dict[str, RenderCacheEntry] = {}
+        self._index_stamp = self._index_stat()
+        try:
+            data = json.loads(self.index_file.read_text())
+            if data.get("version") == INDEX_VERSION:
+                for item in data.get("entries", []):
+                    entry = RenderCacheEntry(**item)
+                    entries[entry.key] = entry
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as e:
+            print(f"[RenderCache] Ignoring unreadable index: {e}")
+        return entries
+
+    def _merge_index(self):
+        """Merge the index on disk into ours"""
+        for key, stored in self._read_index().items():
+            entry = self._entries.get(key)
+            if entry is None or entry.filename != stored.filename:
+                self._entries[key] = stored
+            else:
+                entry.last_access = max(entry.last_access, stored.last_access)
+                entry.hits = max(entry.hits, stored.hits)
+
+    def _merge(self):
+        """Merge the index on disk into ours and reconcile both with the directory"""
+        self._merge_index()
+
+        now = time.time()
+        on_disk = {
+            path.name: path for path in self.directory.iterdir()
+            if path.is_file() and path.name != INDEX_FILENAME and "_temp." not in path.name
+            and not path.name.startswith(".")
+        }
+        # Drop entries whose file is gone (evicted or invalidated by any process), refresh sizes of the rest
+        for key, entry in list(self._entries.items()):
+            path = on_disk.pop(entry.filename, None)
+            if path is None:
+                del self._entries[key]
+            else:
+                entry.size = path.stat().st_size
+        # Adopt files no index knows: rendered before the index existed, or stems of failed jobs
+        for name, path in on_disk.items():
+            stat = path.stat()
+            self._entries[path.stem] = RenderCacheEntry(
+                key=path.stem,
+                filename=name,
+                size=stat.st_size,
+                created_at=stat.st_mtime,
+                last_access=min(stat.st_atime, now)
+            )
+
+    @contextmanager
+    def _shared(self, keep: Optional[str] = None) -> Iterator[None]:
+        """
+        Change the index with the other processes locked out.
+
+        Merges the shared state in, runs the block, trims the cache to its
+        budget (never evicting keep) and writes the index.
+        """
+        with self._lock, file_lock(self.directory / LOCK_FILENAME):
+            self._merge()
+            yield
+            self._evict(keep=keep)
+            data = {
+                "version": INDEX_VERSION,
+                "entries": [asdict(entry) for entry in self._entries.values()]
+            }
+            atomic_write_text(self.index_file, json.dumps(data))
+            self._index_stamp = self._index_stat()
+            self._dirty = False
+            self._last_flush = time.time()
+
+    def ensure_loaded(self):
+        """Load the index on first use"""
+        if not self._loaded:
+            self.load()
+
+    def path_for(self, key: str, suffix: str = ".mp3") -> Path:
+        """Where the render for a key is (or will be) stored"""
+        return self.directory / f"{key}{suffix}"
+
+    def get(self, key: str, record: bool = True, song_id: Optional[UUID] = None) -> Optional[Path]:
+        """
+        Return the cached file for a key and mark it as used.
+
+        record=False still refreshes the entry's recency but leaves the
+        hit/miss counters alone (e.g. for the download after a lookup).
+        With song_id, only a render registered for that song is returned;
+        renders of other songs (or adopted without a song) count as missing.
+        """
+        with self._lock:
+            self.ensure_loaded()
+            entry = self._entries.get(key)
+            if entry is None and self._index_stat() != self._index_stamp:
+                # Another process wrote the index since we last merged (it is
+                # replaced atomically, so reading needs no lock); only this
+                # entry's file is checked below, the rest at the next write
+                self._merge_index()
+                entry = self._entries.get(key)
+            if entry is not None and song_id is not None and entry.song_id != str(song_id):
+                entry = None
+            path = self.directory / entry.filename if entry else None
+            if path is not None and not path.exists():
+                del self._entries[key]
+                self._dirty = True
+                path = None
+
+            if path is None:
+                if record:
+                    self.misses += 1
+                return None
+
+            entry.last_access = time.time()
+            if record:
+                entry.hits += 1
+                self.hits += 1
+            self._dirty = True
+            self.flush()
+            return path
+
+    def put(self, key: str, path: Path, song_id: Optional[UUID] = None) -> RenderCacheEntry:
+        """Register a finished render and trim the cache to its budget"""
+        path = Path(path)
+        now = time.time()
+        with self._lock:
+            self.ensure_loaded()
+            entry = RenderCacheEntry(
+                key=key,
+                filename=path.name,
+                size=path.stat().st_size,
+                song_id=str(song_id) if song_id else None,
+                created_at=now,
+                last_access=now
+            )
+            with self._shared(keep=key):
+                self._entries[key] = entry
+            self.sweep_temp_files()
+            return entry
+
+    def discard(self, key: str) -> bool:
+        """Remove one entry and its file"""
+        with self._lock:
+            self.ensure_loaded()
+            with self._shared():
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    (self.directory / entry.filename).unlink(missing_ok=True)
+            return entry is not None
+
+    def invalidate_song(self, song_id: UUID) -> int:
+        """Remove every render of a song (e.g. after its MIDI was replaced)"""
+        song_id = str(song_id)
+        with self._lock:
+            self.ensure_loaded()
+            with self._shared():
+                keys = [key for key, entry in self._entries.items() if entry.song_id == song_id]
+                for key in keys:
+                    entry = self._entries.pop(key)
+                    (self.directory / entry.filename).unlink(missing_ok=True)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def sweep_temp_files(self, max_age: float = TEMP_FILE_MAX_AGE_SECONDS) -> int:
+        """Delete temporary render files older than max_age seconds"""
+        cutoff = time.time() - max_age
+        removed = 0
+        for path in self.directory.glob(TEMP_FILE_PATTERN):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            print(f"[RenderCache] Removed {removed} orphaned temporary files")
+        return removed
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    def _eviction_order(self) -> List[RenderCacheEntry]:
+        if self.policy == "lfu":
+            return sorted(self._entries.values(), key=lambda e: (e.hits, e.last_access))
+        return sorted(self._entries.values(), key=lambda e: e.last_access)
+
+    def _evict(self, keep: Optional[str] = None):
+        """Evict entries until the cache fits its budget"""
+        total = self.total_bytes
+        if total <= self.max_bytes:
+            return
+        for entry in self._eviction_order():
+            if total <= self.max_bytes:
+                break
+            if entry.key == keep:
+                continue
+            (self.directory / entry.filename).unlink(missing_ok=True)
+            del self._entries[entry.key]
+            total -= entry.size
+            self.evictions += 1
+        self._dirty = True
+
+    def flush(self, force: bool = False):
+        """Write the index if it changed (at most every FLUSH_INTERVAL_SECONDS unless forced)"""
+        with self._lock:
+            if not self._loaded or not (force or self._dirty):
+                return
+            if not force and time.time() - self._last_flush < FLUSH_INTERVAL_SECONDS:
+                return
+            with self._shared():
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Size and hit-rate statistics for the API.
+
+        Called on the event loop (health and metrics endpoints), so it does
+        not take self._lock, which is held across disk I/O and the index
+        file lock: it reads the counters as they are and sums a snapshot of
+        the entries (copying the dict's values does not release the GIL).
+        """
+        entries = list(self._entries.values())
+        hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "policy": self.policy,
+            "entries": len(entries),
+            "bytes": sum(entry.size for entry in entries),
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+
+render_cache = RenderCache(MP3_CACHE_DIR, RENDER_CACHE_MAX_BYTES, RENDER_CACHE_POLICY)
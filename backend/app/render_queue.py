@@ -0,0 +1,234 @@
+"""
+Asynchronous render-job queue
+
+Render requests are turned into jobs and processed by a fixed number of
+dispatcher tasks, each feeding one job at a time into the render process
+pool, so at most RENDER_WORKERS renders run concurrently and the event
+loop is never blocked.
+
+Jobs are identified by a job ID and keyed by their settings hash:
+submitting a hash that is already queued or running returns the existing
+job instead of rendering twice. Lower priority values run first. Jobs
+that have not started yet can be cancelled.
+"""
+import asyncio
+import itertools
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from app.config import RENDER_WORKERS
+from app.metrics import span
+from app.workers import run_in_render_process, run_in_thread
+
+# Job priorities (lower runs first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Finished jobs kept around for status lookups
+FINISHED_JOBS_KEPT = 500
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+@dataclass
+class RenderJob:
+    """One queued or finished render"""
+    id: str
+    settings_hash: str
+    song_id: UUID
+    priority: int
+    func: Callable[..., Any] = field(repr=False)
+    args: Tuple[Any, ...] = field(repr=False)
+    on_done: Optional[Callable[[Any], Any]] = field(default=None, repr=False)
+    status: str = QUEUED
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    result: Any = None
+    # Number of submissions merged into this job
+    requests: int = 1
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status representation for the API"""
+        return {
+            "job_id": self.id,
+            "settings_hash": self.settings_hash,
+            "song_id": str(self.song_id),
+            "status": self.status,
+            "priority": self.priority,
+            "requests": self.requests,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error
+        }
+
+
+class RenderQueue:
+    """Priority queue of render jobs with in-flight deduplication"""
+
+    def __init__(self, workers: int = RENDER_WORKERS):
+        self.workers = workers
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._jobs: Dict[str, RenderJob] = {}
+        self._in_flight: Dict[str, RenderJob] = {}
+        self._finished: "OrderedDict[str, RenderJob]" = OrderedDict()
+        self.merged = 0
+
+    def start(self):
+        """Start the dispatcher tasks on the running event loop"""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [
+            asyncio.create_task(self._dispatch(), name=f"render-dispatcher-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Cancel the dispatcher tasks (running renders are abandoned)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(
+        self,
+        settings_hash: str,
+        song_id: UUID,
+        func: Callable[..., Any],
+        *args: Any,
+        priority: int = PRIORITY_INTERACTIVE,
+        on_done: Optional[Callable[[Any], Any]] = None
+    ) -> RenderJob:
+        """
+        Enqueue a render, or join the queued/running job with the same hash.
+
+        func must be a picklable top-level function; it runs in the render
+        process pool with args. on_done is called with the result in the
+        storage thread pool once the render succeeded (e.g. to register
+        the file with the render cache).
+        """
+        self.start()
+        job = self._in_flight.get(settings_hash)
+        if job:
+            job.requests += 1
+            self.merged += 1
+            if priority < job.priority and job.status == QUEUED:
+                # Re-queue with the better priority; the stale entry is skipped
+                job.priority = priority
+                self._queue.put_nowait((priority, next(self._sequence), job.id))
+            return job
+
+        job = RenderJob(
+            id=str(uuid4()),
+            settings_hash=settings_hash,
+            song_id=song_id,
+            priority=priority,
+            func=func,
+            args=args,
+            on_done=on_done
+        )
+        self._jobs[job.id] = job
+        self._in_flight[settings_hash] = job
+        self._queue.put_nowait((priority, next(self._sequence), job.id))
+        return job
+
+    def get(self, job_id: str) -> Optional[RenderJob]:
+        """Look up a queued, running or recently finished job"""
+        return self._jobs.get(job_id)
+
+    def find(self, settings_hash: str) -> Optional[RenderJob]:
+        """The queued or running job for a settings hash, if any"""
+        return self._in_flight.get(settings_hash)
+
+    def cancel(self, job: RenderJob) -> bool:
+        """
+        Cancel a job that has not started yet.
+
+        Jobs that are running, or that other requests have joined, are left
+        alone; returns whether the job was cancelled.
+        """
+        if job.status != QUEUED or job.requests > 1:
+            return False
+        job.status = CANCELLED
+        self._finish(job)
+        return True
+
+    async def wait(self, job: RenderJob, timeout: Optional[float] = None) -> RenderJob:
+        """Wait until a job has finished or the timeout has passed"""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue statistics for monitoring"""
+        statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": statuses.count(QUEUED),
+            "running": statuses.count(RUNNING),
+            "done": statuses.count(DONE),
+            "failed": statuses.count(FAILED),
+            "cancelled": statuses.count(CANCELLED),
+            "merged_requests": self.merged
+        }
+
+    async def _dispatch(self):
+        """Take jobs off the queue and run them one at a time"""
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue  # Stale entry of a re-prioritized or cancelled job
+
+            job.status = RUNNING
+            job.started_at = datetime.utcnow()
+            try:
+                with span("render_job"):
+                    job.result = await run_in_render_process(job.func, *job.args)
+                if job.on_done is not None:
+                    await run_in_thread(job.on_done, job.result)
+                job.status = DONE
+            except asyncio.CancelledError:
+                job.status = FAILED
+                job.error = "Render cancelled"
+                raise
+            except Exception as e:
+                print(f"[RenderQueue] Job {job.id} failed: {e}")
+                job.status = FAILED
+                job.error = str(e)
+            finally:
+                self._finish(job)
+
+    def _finish(self, job: RenderJob):
+        job.finished_at = datetime.utcnow()
+        if self._in_flight.get(job.settings_hash) is job:
+            del self._in_flight[job.settings_hash]
+        job.done.set()
+
+        self._finished[job.id] = job
+        while len(self._finished) > FINISHED_JOBS_KEPT:
+            old_id, _ = self._finished.popitem(last=False)
+            self._jobs.pop(old_id, None)
+
+
+render_queue = RenderQueue()
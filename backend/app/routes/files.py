@@ -1,21 +1,66 @@
 """File upload and serving endpoints"""
-from fastapi import APIRouter, UploadFile, File, HTTPException, status
+from datetime import datetime, timezone
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, status
 from fastapi.responses import FileResponse
+from typing import Any, Dict, List, Optional, Tuple
 from uuid import UUID
 from pathlib import Path
-import mido
-from datetime import datetime
+import shutil
 
-from app.storage import StorageService, SONGS_DIR
+from app.alignment import load_alignment
+from app.conditional import FILE_CACHE_CONTROL, cache_headers, format_etag, is_not_modified, not_modified
+from app.config import MAX_MIDI_UPLOAD_BYTES, MAX_SCORE_UPLOAD_BYTES
+from app.metrics import span
+from app.midi_analysis import ANALYSIS_FILENAME, analyze_to_sidecar, read_sidecar
+from app.midi_slicer import invalidate_song_slices
 from app.models import Voice
+from app.prerender import prerender_scheduler
+from app.render_cache import render_cache
+from app.score_processing import RANGES_DIRNAME, SCORE_CACHE_DIRNAME, cached_score_manifest, process_score_to_cache
+from app.storage import AsyncStorageService, StorageService, SONGS_DIR, blob_store
+from app.uploads import stage_upload
+from app.workers import run_in_process, run_in_thread
 
 router = APIRouter()
 
 
+async def _refresh_alignment(id: UUID):
+    """Rebuild the score/MIDI alignment after either file changed"""
+    files = await AsyncStorageService.song_files(id)
+    if not files or not files.midi_file:
+        return
+    try:
+        await run_in_thread(
+            load_alignment, StorageService.get_song_dir(id), files.midi_sha256, files.score_file, files.score_sha256
+        )
+    except Exception as e:
+        print(f"[Alignment] Could not align song {id}: {e}")
+
+
+def _stored_voices(sha256: str, song_dir: Path) -> Optional[List[Voice]]:
+    """Voices from the analysis kept with a stored MIDI blob (linked into song_dir), None if there is none"""
+    sidecar = song_dir / ANALYSIS_FILENAME
+    if not blob_store.fetch(sha256, ANALYSIS_FILENAME, sidecar):
+        return None
+    try:
+        analysis = read_sidecar(sidecar)
+    except (ValueError, OSError):
+        return None
+    return analysis.voices() if analysis.source_sha256 == sha256 else None
+
+
+def _stored_score(sha256: str, song_dir: Path) -> Optional[Dict[str, Any]]:
+    """Manifest of the processed score kept with a stored score blob (linked into song_dir), None if there is none"""
+    cache_dir = song_dir / SCORE_CACHE_DIRNAME
+    if not blob_store.fetch(sha256, SCORE_CACHE_DIRNAME, cache_dir):
+        return None
+    return cached_score_manifest(cache_dir, sha256)
+
+
 @router.post("/{id}/upload/midi")
 async def upload_midi(id: UUID, midi_file: UploadFile = File(...)):
     """Upload MIDI file for a song"""
-    song = StorageService.load_song(id)
+    song = await AsyncStorageService.load_song(id)
     if not song:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
     
@@ -26,49 +71,56 @@ async def upload_midi(id: UUID, midi_file: UploadFile = File(...)):
             detail="Invalid file type. Must be .mid or .midi"
         )
     
-    # Save MIDI file
+    # Stream the upload to a temporary file next to song.mid
     song_dir = StorageService.get_song_dir(id)
-    song_dir.mkdir(parents=True, exist_ok=True)
-    
-    midi_path = song_dir / "song.mid"
-    with open(midi_path, "wb") as f:
-        content = await midi_file.read()
-        f.write(content)
-    
-    # Parse MIDI to extract voices
-    try:
-        mid = mido.MidiFile(str(midi_path))
-        voices = []
-        
-        for i, track in enumerate(mid.tracks):
-            notes = [msg for msg in track if msg.type == 'note_on']
-            if notes:  # Only include tracks with notes
-                # Get channel from first note
-                channel = notes[0].channel if hasattr(notes[0], 'channel') else None
-                
-                voices.append(Voice(
-                    track_number=i,
-                    names=[f"Track {i + 1}"],  # Initialize with default name in list
-                    channel=channel,
-                    note_count=len(notes)
-                ))
-        
+    staged = await stage_upload(midi_file, song_dir, MAX_MIDI_UPLOAD_BYTES)
+    
+    # A file stored before (e.g. the same arrangement in another song) reuses its analysis
+    voices = await run_in_thread(_stored_voices, staged.sha256, song_dir)
+    
+    # Otherwise analyze the MIDI once and store the result as a sidecar
+    # (CPU-bound, runs in the worker process pool)
+    if voices is None:
+        try:
+            with span("midi_parse"):
+                voices = await run_in_process(
+                    analyze_to_sidecar, str(staged.path), str(song_dir / ANALYSIS_FILENAME), staged.sha256
+                )
+        except Exception as e:
+            staged.discard()
+            print(f"Error parsing MIDI: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid MIDI file"
+            )
+    
+    # Only a successfully parsed file replaces song.mid (as a link to the stored blob)
+    await run_in_thread(StorageService.store_upload, id, staged.path, staged.sha256, "song.mid")
+    await run_in_thread(blob_store.keep, staged.sha256, ANALYSIS_FILENAME, song_dir / ANALYSIS_FILENAME)
+    await run_in_thread(invalidate_song_slices, song_dir)
+    await run_in_thread(render_cache.invalidate_song, id)
+    
+    def apply(song):
         song.voices = voices
-    except Exception as e:
-        print(f"Error parsing MIDI: {e}")
-        # Continue even if parsing fails
+        song.midi_file = "song.mid"
+        song.midi_sha256 = staged.sha256
     
-    song.midi_file = "song.mid"
-    song.updated_at = datetime.utcnow()
-    StorageService.save_song(song)
+    # Re-read under the song lock so concurrent edits are not overwritten
+    if not await AsyncStorageService.modify_song(id, apply):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
     
+    if song.midi_sha256 != staged.sha256:
+        await run_in_thread(StorageService.release_blobs, song.midi_sha256)
+    await _refresh_alignment(id)
+    # New voices: rebuild the practice packs of every section
+    prerender_scheduler.schedule(id)
     return {"message": "MIDI file uploaded successfully", "midi_file": "song.mid"}
 
 
 @router.post("/{id}/upload/score")
 async def upload_score(id: UUID, score_file: UploadFile = File(...)):
     """Upload MusicXML score file for a song"""
-    song = StorageService.load_song(id)
+    song = await AsyncStorageService.load_song(id)
     if not song:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
     
@@ -79,55 +131,113 @@ async def upload_score(id: UUID, score_file: UploadFile = File(...)):
             detail="Invalid file type. Must be .xml, .mxl, or .musicxml"
         )
     
-    # Save score file
+    # Stream the upload to a temporary file, then move it into place
     song_dir = StorageService.get_song_dir(id)
-    song_dir.mkdir(parents=True, exist_ok=True)
+    staged = await stage_upload(score_file, song_dir, MAX_SCORE_UPLOAD_BYTES)
+    
+    # A file stored before reuses its processed score
+    manifest = await run_in_thread(_stored_score, staged.sha256, song_dir)
+    
+    # Otherwise decompress, validate and split the score once
+    # (CPU-bound, runs in the worker process pool)
+    if manifest is None:
+        try:
+            manifest = await run_in_process(process_score_to_cache, str(staged.path), str(song_dir), staged.sha256)
+        except ValueError as e:
+            staged.discard()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid MusicXML file: {e}"
+            )
+        except Exception as e:
+            staged.discard()
+            print(f"Error processing score: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid MusicXML file"
+            )
     
     # Determine file extension
-    ext = Path(score_file.filename).suffix
+    ext = Path(score_file.filename).suffix.lower()
     score_filename = f"score{ext}"
-    score_path = song_dir / score_filename
+    await run_in_thread(StorageService.store_upload, id, staged.path, staged.sha256, score_filename)
+    await run_in_thread(
+        blob_store.keep, staged.sha256, SCORE_CACHE_DIRNAME, song_dir / SCORE_CACHE_DIRNAME,
+        shutil.ignore_patterns(RANGES_DIRNAME)
+    )
+    
+    # Remove a previous score stored under a different extension
+    if song.score_file and song.score_file != score_filename:
+        (song_dir / song.score_file).unlink(missing_ok=True)
     
-    with open(score_path, "wb") as f:
-        content = await score_file.read()
-        f.write(content)
+    def apply(song):
+        song.score_file = score_filename
+        song.score_sha256 = staged.sha256
     
-    song.score_file = score_filename
-    song.updated_at = datetime.utcnow()
-    StorageService.save_song(song)
+    # Re-read under the song lock so concurrent edits are not overwritten
+    if not await AsyncStorageService.modify_song(id, apply):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
     
-    return {"message": "Score file uploaded successfully", "score_file": score_filename}
+    if song.score_sha256 != staged.sha256:
+        await run_in_thread(StorageService.release_blobs, song.score_sha256)
+    await _refresh_alignment(id)
+    return {
+        "message": "Score file uploaded successfully",
+        "score_file": score_filename,
+        "parts": manifest["parts"],
+        "measure_count": manifest["measure_count"]
+    }
+
+
+def _file_validators(path: Path, sha256: Optional[str]) -> Tuple[str, datetime]:
+    """Strong ETag (content hash) and modification time of an uploaded file"""
+    stat = path.stat()
+    etag = format_etag(sha256) if sha256 else f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    return etag, datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
 
 
 @router.get("/{id}/midi")
-async def get_midi(id: UUID):
-    """Serve MIDI file"""
-    song = StorageService.load_song(id)
-    if not song or not song.midi_file:
+async def get_midi(id: UUID, request: Request):
+    """Serve MIDI file (answers If-None-Match / If-Modified-Since with 304)"""
+    files = await AsyncStorageService.song_files(id)
+    if not files or not files.midi_file:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="MIDI file not found")
     
-    midi_path = StorageService.get_song_dir(id) / song.midi_file
-    if not midi_path.exists():
+    midi_path = StorageService.get_song_dir(id) / files.midi_file
+    try:
+        etag, last_modified = await run_in_thread(_file_validators, midi_path, files.midi_sha256)
+    except FileNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="MIDI file not found")
     
+    headers = cache_headers(etag, last_modified, FILE_CACHE_CONTROL)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(headers)
+    
     return FileResponse(
         path=str(midi_path),
         media_type="audio/midi",
-        filename=song.midi_file
+        filename=files.midi_file,
+        headers=headers
     )
 
 
 @router.get("/{id}/score")
-async def get_score(id: UUID):
-    """Serve MusicXML score file"""
-    song = StorageService.load_song(id)
-    if not song or not song.score_file:
+async def get_score(id: UUID, request: Request):
+    """Serve MusicXML score file (answers If-None-Match / If-Modified-Since with 304)"""
+    files = await AsyncStorageService.song_files(id)
+    if not files or not files.score_file:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Score file not found")
     
-    score_path = StorageService.get_song_dir(id) / song.score_file
-    if not score_path.exists():
+    score_path = StorageService.get_song_dir(id) / files.score_file
+    try:
+        etag, last_modified = await run_in_thread(_file_validators, score_path, files.score_sha256)
+    except FileNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Score file not found")
     
+    headers = cache_headers(etag, last_modified, FILE_CACHE_CONTROL)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(headers)
+    
     # Determine media type
     if score_path.suffix == '.mxl':
         media_type = "application/vnd.recordare.musicxml"
@@ -137,5 +247,6 @@ async def get_score(id: UUID):
     return FileResponse(
         path=str(score_path),
         media_type=media_type,
-        filename=song.score_file
+        filename=files.score_file,
+        headers=headers
     )
@@ -1,9 +1,62 @@
-"""Health check endpoint"""
-from fastapi import APIRouter
+"""Health check, cache statistics and metrics endpoints"""
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import Response
+
+from app.metrics import CACHE_REQUESTS, CACHE_SIZE, CONTENT_TYPE, RENDER_QUEUE_JOBS, metrics
+from app.mp3_generator import stem_stats
+from app.prerender import prerender_scheduler
+from app.render_cache import render_cache
+from app.render_queue import render_queue
+from app.serialization import response_cache
+from app.storage import StorageService
 
 router = APIRouter()
 
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "ok", "message": "ChoirLoop API is running"}
+    return {
+        "status": "ok",
+        "message": "ChoirLoop API is running",
+        "storage": StorageService.cache_stats(),
+        "response_cache": response_cache.stats(),
+        "render_queue": render_queue.stats(),
+        "prerender": prerender_scheduler.stats(),
+        "render_cache": {**render_cache.stats(), "stems": stem_stats.stats()}
+    }
+
+
+@router.get("/render-cache")
+async def render_cache_stats():
+    """Size, budget and hit-rate statistics of the render cache and its stems"""
+    return {**render_cache.stats(), "stems": stem_stats.stats()}
+
+
+def _collect():
+    """Copy counters kept by the caches and the render queue into the registry"""
+    storage = StorageService.cache_stats()
+    if "hits" in storage:
+        CACHE_REQUESTS.set(storage["hits"], "storage", "hit")
+        CACHE_REQUESTS.set(storage["misses"], "storage", "miss")
+
+    cache = render_cache.stats()
+    CACHE_REQUESTS.set(cache["hits"], "render", "hit")
+    CACHE_REQUESTS.set(cache["misses"], "render", "miss")
+    CACHE_SIZE.set(cache["bytes"], "render")
+
+    stems = stem_stats.stats()
+    CACHE_REQUESTS.set(stems["stems_reused"], "stem", "hit")
+    CACHE_REQUESTS.set(stems["stems_rendered"], "stem", "miss")
+
+    queue = render_queue.stats()
+    for name in ("queued", "running", "done", "failed", "cancelled"):
+        RENDER_QUEUE_JOBS.set(queue[name], name)
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Request timings, internal spans, cache and render queue figures (Prometheus text format)"""
+    if not metrics.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    _collect()
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,100 @@
+"""Library export and import endpoints"""
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+import aiofiles
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.config import MAX_IMPORT_BYTES
+from app.library_archive import EXPORT_MEDIA_TYPES, export_archive, library_importer
+from app.storage import AsyncStorageService
+
+router = APIRouter()
+
+CONFLICT_POLICIES = ("skip", "replace")
+
+
+@router.get("/export")
+async def export_library(ids: Optional[List[UUID]] = Query(None), format: str = "zip"):
+    """Stream a zip or tar archive of the given songs (default: all songs)"""
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid format. Must be one of: {', '.join(EXPORT_MEDIA_TYPES)}"
+        )
+
+    existing = await AsyncStorageService.song_ids()
+    if ids:
+        missing = [str(song_id) for song_id in ids if str(song_id) not in existing]
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Songs not found: {', '.join(missing)}"
+            )
+        song_ids = list(dict.fromkeys(ids))
+    else:
+        song_ids = sorted(UUID(song_id) for song_id in existing)
+
+    filename = f"choirloop-library-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    # A sync generator: Starlette iterates it in the threadpool, so file reads do not block
+    return StreamingResponse(
+        export_archive(song_ids, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/import", status_code=status.HTTP_202_ACCEPTED)
+async def import_library(request: Request, on_conflict: str = "skip"):
+    """
+    Import a library archive sent as the raw request body.
+
+    The archive is streamed to disk and processed in the background;
+    poll GET /api/import/{job_id} for progress.
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid on_conflict. Must be one of: {', '.join(CONFLICT_POLICIES)}"
+        )
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > MAX_IMPORT_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Archive too large. Maximum size is {MAX_IMPORT_BYTES // (1024 * 1024)} MB"
+        )
+
+    job = library_importer.create(on_conflict)
+    try:
+        async with aiofiles.open(library_importer.archive_path(job), "wb") as f:
+            async for chunk in request.stream():
+                job.bytes_received += len(chunk)
+                if job.bytes_received > MAX_IMPORT_BYTES:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Archive too large. Maximum size is {MAX_IMPORT_BYTES // (1024 * 1024)} MB"
+                    )
+                await f.write(chunk)
+    except BaseException as e:
+        library_importer.fail(job, getattr(e, "detail", None) or "Upload interrupted")
+        raise
+
+    if not job.bytes_received:
+        library_importer.fail(job, "Empty request body")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty request body")
+
+    library_importer.start(job)
+    return JSONResponse(job.to_dict(), status_code=status.HTTP_202_ACCEPTED)
+
+
+@router.get("/import/{job_id}")
+async def get_import(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    """Status of an import (optionally waits up to `wait` seconds for it to finish)"""
+    job = library_importer.get(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import not found")
+    if wait and not job.finished:
+        await library_importer.wait(job, wait)
+    return job.to_dict()
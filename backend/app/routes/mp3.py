@@ -1,106 +1,185 @@
-"""
-MP3 generation and download endpoints - TEMPORARILY DISABLED
-This module is currently commented out as MP3/ffmpeg functionality has been disabled.
-"""
-
-# """MP3 generation and download endpoints"""
-# from fastapi import APIRouter, HTTPException, status, BackgroundTasks
-# from fastapi.responses import FileResponse
-# from pydantic import BaseModel, Field
-# from typing import Optional, Dict
-# from uuid import UUID
-
-# from app.mp3_generator import MP3GeneratorService
-
-# router = APIRouter()
-
-
-# class MP3GenerateRequest(BaseModel):
-#     """Request model for MP3 generation"""
-#     tempo: int = Field(default=100, ge=50, le=150, description="Tempo percentage (50-150)")
-#     track_volumes: Dict[str, int] = Field(default_factory=dict, description="Track volumes in dB (-60 to 0)")
-#     enabled_tracks: Dict[str, bool] = Field(default_factory=dict, description="Enabled/disabled tracks")
-#     section_id: Optional[UUID] = Field(None, description="Practice section ID to render")
-#     start_measure: Optional[int] = Field(None, description="Start measure for custom section")
-#     start_beat: Optional[int] = Field(None, description="Start beat for custom section")
-#     end_measure: Optional[int] = Field(None, description="End measure for custom section")
-#     end_beat: Optional[int] = Field(None, description="End beat for custom section")
-
-
-# @router.post("/{id}/generate-mp3", response_model=dict)
-# async def generate_mp3(id: UUID, request: MP3GenerateRequest, background_tasks: BackgroundTasks):
-#     """Generate MP3 file with specified settings"""
-#     try:
-#         # Convert string keys to integers for track volumes and enabled tracks
-#         track_volumes = {int(k): v for k, v in request.track_volumes.items()}
-#         enabled_tracks = {int(k): v for k, v in request.enabled_tracks.items()}
-#         
-#         # Generate settings hash
-#         settings_hash = MP3GeneratorService.generate_settings_hash(
-#             id,
-#             request.tempo,
-#             track_volumes,
-#             enabled_tracks,
-#             request.section_id,
-#             request.start_measure,
-#             request.start_beat,
-#             request.end_measure,
-#             request.end_beat
-#         )
-#         
-#         # Check if MP3 already exists
-#         existing_mp3 = MP3GeneratorService.get_cached_mp3_path(settings_hash)
-#         if existing_mp3:
-#             return {
-#                 "message": "MP3 already exists",
-#                 "settings_hash": settings_hash,
-#                 "cached": True
-#             }
-#         
-#         # Generate MP3 asynchronously
-#         mp3_path = await MP3GeneratorService.generate_mp3(
-#             id,
-#             request.tempo,
-#             track_volumes,
-#             enabled_tracks,
-#             request.section_id,
-#             request.start_measure,
-#             request.start_beat,
-#             request.end_measure,
-#             request.end_beat
-#         )
-#         
-#         return {
-#             "message": "MP3 generated successfully",
-#             "settings_hash": settings_hash,
-#             "cached": False
-#         }
-#     
-#     except Exception as e:
-#         raise HTTPException(
-#             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-#             detail=f"MP3 generation failed: {str(e)}"
-#         )
-
-
-# @router.get("/{id}/download-mp3/{settings_hash}")
-# async def download_mp3(id: UUID, settings_hash: str):
-#     """Download generated MP3 file"""
-#     mp3_path = MP3GeneratorService.get_cached_mp3_path(settings_hash)
-#     
-#     if not mp3_path:
-#         raise HTTPException(
-#             status_code=status.HTTP_404_NOT_FOUND,
-#             detail="MP3 file not found. Generate it first."
-#         )
-#     
-#     # Get song name for filename
-#     from app.storage import StorageService
-#     song = StorageService.load_song(id)
-#     filename = f"{song.title if song else 'song'}_{settings_hash[:8]}.mp3"
-#     
-#     return FileResponse(
-#         path=str(mp3_path),
-#         media_type="audio/mpeg",
-#         filename=filename
-#     )
+"""MP3 generation and download endpoints"""
+import re
+from fastapi import APIRouter, HTTPException, Query, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, Dict
+from uuid import UUID
+
+from app.mp3_generator import MP3GeneratorService
+from app.render_queue import render_queue
+from app.storage import AsyncStorageService
+from app.workers import run_in_thread
+
+router = APIRouter()
+
+# Longest a client may block on a job in one request
+MAX_WAIT_SECONDS = 60
+
+SETTINGS_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+AUDIO_MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav"
+}
+
+
+class MP3GenerateRequest(BaseModel):
+    """Request model for MP3 generation"""
+    tempo: int = Field(default=100, ge=50, le=150, description="Tempo percentage (50-150)")
+    track_volumes: Dict[str, int] = Field(default_factory=dict, description="Track volumes in dB (-60 to 0)")
+    enabled_tracks: Dict[str, bool] = Field(default_factory=dict, description="Enabled/disabled tracks")
+    section_id: Optional[UUID] = Field(None, description="Practice section ID to render")
+    start_measure: Optional[int] = Field(None, ge=1, description="Start measure for custom section")
+    start_beat: Optional[int] = Field(None, ge=1, description="Start beat for custom section")
+    end_measure: Optional[int] = Field(None, ge=1, description="End measure for custom section")
+    end_beat: Optional[int] = Field(None, ge=1, description="End beat for custom section")
+    count_in: int = Field(default=0, ge=0, le=4, description="Measures of click track before the music")
+
+
+@router.post("/{id}/generate-mp3", response_model=dict)
+async def generate_mp3(
+    id: UUID,
+    request: MP3GenerateRequest,
+    response: Response,
+    wait: float = Query(0, ge=0, le=MAX_WAIT_SECONDS, description="Seconds to wait for the render to finish")
+):
+    """
+    Queue audio generation with the specified settings (WAV with the
+    builtin engine, MP3 with fluidsynth).
+
+    Returns immediately (202) with a job ID unless the MP3 is already cached
+    or the render finishes within `wait` seconds.
+    """
+    try:
+        # Convert string keys to integers for track volumes and enabled tracks
+        track_volumes = {int(k): v for k, v in request.track_volumes.items()}
+        enabled_tracks = {int(k): v for k, v in request.enabled_tracks.items()}
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Track keys must be track numbers"
+        )
+
+    try:
+        settings_hash, job = await MP3GeneratorService.request_mp3(
+            id,
+            request.tempo,
+            track_volumes,
+            enabled_tracks,
+            request.section_id,
+            request.start_measure,
+            request.start_beat,
+            request.end_measure,
+            request.end_beat,
+            request.count_in
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if job is None:
+        return {
+            "message": "MP3 already exists",
+            "settings_hash": settings_hash,
+            "status": "done",
+            "cached": True
+        }
+
+    if wait:
+        await render_queue.wait(job, wait)
+    if not job.finished:
+        response.status_code = status.HTTP_202_ACCEPTED
+    return {**job.to_dict(), "cached": False}
+
+
+@router.get("/{id}/render-jobs/{job_id}", response_model=dict)
+async def get_render_job(
+    id: UUID,
+    job_id: str,
+    wait: float = Query(0, ge=0, le=MAX_WAIT_SECONDS, description="Seconds to wait for the job to finish")
+):
+    """Poll (or wait for) a render job"""
+    job = render_queue.get(job_id)
+    if not job or job.song_id != id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Render job not found"
+        )
+
+    if wait:
+        await render_queue.wait(job, wait)
+    return job.to_dict()
+
+
+@router.get("/{id}/download-mp3/{settings_hash}")
+async def download_mp3(id: UUID, settings_hash: str):
+    """Download generated MP3 file"""
+    mp3_path = None
+    if SETTINGS_HASH_PATTERN.match(settings_hash):
+        mp3_path = await run_in_thread(MP3GeneratorService.get_cached_mp3_path, settings_hash, True, id)
+
+    if not mp3_path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="MP3 file not found. Generate it first."
+        )
+
+    # Get song name for filename
+    song = await AsyncStorageService.load_song(id)
+    filename = f"{song.title if song else 'song'}_{settings_hash[:8]}{mp3_path.suffix}"
+
+    return FileResponse(
+        path=str(mp3_path),
+        media_type=AUDIO_MEDIA_TYPES.get(mp3_path.suffix, "application/octet-stream"),
+        filename=filename
+    )
+
+
+@router.get("/{id}/stream-audio/{settings_hash}")
+async def stream_audio(id: UUID, settings_hash: str):
+    """
+    Play generated audio, starting before the render has finished.
+
+    A cached render is served as a file with Range support (206), so audio
+    elements can seek. A builtin render that is still queued or running is
+    streamed as WAV while it is synthesized, one measure per chunk; the
+    queued render keeps going and serves later requests from the cache.
+    """
+    if not SETTINGS_HASH_PATTERN.match(settings_hash):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Render not found. Generate it first."
+        )
+
+    audio_path = await run_in_thread(MP3GeneratorService.get_cached_mp3_path, settings_hash, False, id)
+    if not audio_path:
+        job = render_queue.find(settings_hash)
+        if not job or job.song_id != id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Render not found. Generate it first."
+            )
+
+        stream = MP3GeneratorService.stream_job(job)
+        if stream is not None:
+            return StreamingResponse(
+                stream,
+                media_type=AUDIO_MEDIA_TYPES[".wav"],
+                headers={"Cache-Control": "no-store", "Accept-Ranges": "none"}
+            )
+
+        # Engines that cannot stream: wait for the file
+        await render_queue.wait(job, MAX_WAIT_SECONDS)
+        audio_path = await run_in_thread(MP3GeneratorService.get_cached_mp3_path, settings_hash, False, id)
+        if not audio_path:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=job.error or "Render not finished yet"
+            )
+
+    return FileResponse(
+        path=str(audio_path),
+        media_type=AUDIO_MEDIA_TYPES.get(audio_path.suffix, "application/octet-stream")
+    )
@@ -0,0 +1,112 @@
+"""Processed MusicXML: part list, single parts and measure ranges"""
+from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from app.conditional import FILE_CACHE_CONTROL, cache_headers, format_etag, is_not_modified, not_modified
+from app.encoding import negotiate_variant
+from app.score_processing import get_or_create_range, load_score_manifest, part_index, part_path
+from app.storage import AsyncStorageService, StorageService
+from app.workers import run_in_thread
+
+router = APIRouter()
+
+MUSICXML_MEDIA_TYPE = "application/vnd.recordare.musicxml+xml"
+
+
+async def _load_manifest(id: UUID) -> Tuple[Path, Dict[str, Any]]:
+    files = await AsyncStorageService.song_files(id)
+    if not files or not files.score_file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Score file not found")
+
+    song_dir = StorageService.get_song_dir(id)
+    try:
+        manifest = await run_in_thread(load_score_manifest, song_dir, files.score_file, files.score_sha256)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Score cannot be processed: {e}")
+    if not manifest:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Score file not found")
+    return song_dir, manifest
+
+
+def _check_range(manifest: Dict[str, Any], start_measure: Optional[int], end_measure: Optional[int]) -> Tuple[int, int]:
+    start = start_measure or 1
+    end = min(end_measure or manifest["measure_count"], manifest["measure_count"])
+    if start > manifest["measure_count"] or end < start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid measure range (the score has {manifest['measure_count']} measures)"
+        )
+    return start, end
+
+
+def _select_variant(path: Path, accept_encoding: Optional[str]) -> Tuple[Path, Optional[str], datetime]:
+    """Variant to serve and the modification time of the document (blocking)"""
+    served, encoding = negotiate_variant(path, accept_encoding)
+    return served, encoding, datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc)
+
+
+async def _serve(request: Request, path: Path, manifest: Dict[str, Any], name: str):
+    """Serve a processed document in the encoding the client prefers (304 if unchanged)"""
+    served, encoding, last_modified = await run_in_thread(
+        _select_variant, path, request.headers.get("accept-encoding")
+    )
+    etag = format_etag(f"{manifest['source_sha256'][:32]}-{name}-{encoding or 'identity'}")
+    headers = cache_headers(etag, last_modified, FILE_CACHE_CONTROL)
+    headers["Vary"] = "Accept-Encoding"
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path=str(served), media_type=MUSICXML_MEDIA_TYPE, headers=headers)
+
+
+@router.get("/{id}/score/parts", response_model=dict)
+async def list_score_parts(id: UUID):
+    """Part list and measure count of the song's score"""
+    _, manifest = await _load_manifest(id)
+    return {
+        "title": manifest["title"],
+        "measure_count": manifest["measure_count"],
+        "parts": manifest["parts"]
+    }
+
+
+@router.get("/{id}/score/parts/{part_id}")
+async def get_score_part(
+    id: UUID,
+    part_id: str,
+    request: Request,
+    start_measure: Optional[int] = Query(None, ge=1, description="First measure (by position, default: 1)"),
+    end_measure: Optional[int] = Query(None, ge=1, description="Last measure, inclusive (default: last)")
+):
+    """Serve one part of the score as MusicXML, optionally only a measure range"""
+    song_dir, manifest = await _load_manifest(id)
+    index = part_index(manifest, part_id)
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Part not found")
+
+    if start_measure is None and end_measure is None:
+        return await _serve(request, part_path(song_dir, index), manifest, f"part-{index}")
+
+    start, end = _check_range(manifest, start_measure, end_measure)
+    path = await run_in_thread(get_or_create_range, song_dir, manifest, start, end, part_id)
+    return await _serve(request, path, manifest, f"part-{index}-{start}-{end}")
+
+
+@router.get("/{id}/score/measures")
+async def get_score_measures(
+    id: UUID,
+    request: Request,
+    start_measure: int = Query(..., ge=1, description="First measure (by position)"),
+    end_measure: Optional[int] = Query(None, ge=1, description="Last measure, inclusive (default: last)")
+):
+    """Serve a measure range of all parts as MusicXML"""
+    song_dir, manifest = await _load_manifest(id)
+    start, end = _check_range(manifest, start_measure, end_measure)
+    path = await run_in_thread(get_or_create_range, song_dir, manifest, start, end)
+    return await _serve(request, path, manifest, f"score-{start}-{end}")
@@ -1,61 +1,209 @@
 """Practice section endpoints"""
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Header, HTTPException, Response, status
+from typing import Optional
 from uuid import UUID
 
-from app.models import PracticeSection, PracticeSectionCreate, PracticeSectionUpdate
-from app.storage import StorageService
+from app.alignment import load_alignment
+from app.conditional import parse_if_match, precondition_failed, song_etag
+from app.midi_slicer import invalidate_section_slices
+from app.models import (
+    MessageResponse, PracticeSectionCreate, PracticeSectionUpdate, SectionBatch, SectionBatchResponse,
+    SectionListResponse, SectionResponse, TimedPracticeSection
+)
+from app.prerender import prerender_scheduler
+from app.serialization import JSONBytesResponse, dumps
+from app.storage import (
+    AsyncStorageService, SectionCheck, SectionNotFoundError, SongChanges, StorageService, VersionConflictError,
+    version_tag
+)
+from app.timeline import load_timeline
+from app.workers import run_in_thread
 
 router = APIRouter()
 
 
-@router.get("/{id}/sections", response_model=dict)
+async def _alignment(id: UUID):
+    """Measure alignment of the song's MIDI file, None without one"""
+    files = await AsyncStorageService.song_files(id)
+    if not files or not files.midi_file:
+        return None
+    return await run_in_thread(
+        load_alignment, StorageService.get_song_dir(id), files.midi_sha256, files.score_file, files.score_sha256
+    )
+
+
+async def bounds_check(id: UUID) -> Optional[SectionCheck]:
+    """Section bounds check for section writes (run under the song lock); None without a MIDI file"""
+    alignment = await _alignment(id)
+    if not alignment:
+        return None
+    return lambda section: alignment.check_range(
+        section.start_measure, section.start_beat, section.end_measure, section.end_beat
+    )
+
+
+async def sections_changed(id: UUID, changes: SongChanges):
+    """Drop stale slices and (re)build practice packs after a batch or patch"""
+    song_dir = StorageService.get_song_dir(id)
+    for section_id in [section.id for section in changes.updated] + changes.deleted:
+        await run_in_thread(invalidate_section_slices, song_dir, section_id)
+    for section_id in changes.deleted:
+        prerender_scheduler.cancel(id, section_id)
+    if changes.voices_changed:
+        prerender_scheduler.schedule(id)
+    elif changes.created or changes.updated:
+        prerender_scheduler.schedule(id, [section.id for section in changes.created + changes.updated])
+
+
+@router.get("/{id}/sections", response_model=SectionListResponse)
 async def list_sections(id: UUID):
     """Get all practice sections for a song"""
-    song = StorageService.load_song(id)
+    song = await AsyncStorageService.load_song(id)
     if not song:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Song not found"
         )
-    return {"sections": song.practice_sections}
+    timeline = alignment = None
+    if song.midi_file:
+        song_dir = StorageService.get_song_dir(id)
+        timeline = await run_in_thread(load_timeline, song_dir, song.midi_sha256)
+        if song.score_file:
+            alignment = await run_in_thread(load_alignment, song_dir, song.midi_sha256, song.score_file, song.score_sha256)
+    
+    sections = []
+    for section in song.practice_sections:
+        timed = TimedPracticeSection(**section.model_dump())
+        if timeline:
+            timed.start_time = round(timeline.measure_beat_to_seconds(section.start_measure, section.start_beat), 6)
+            timed.end_time = round(timeline.measure_beat_to_seconds(section.end_measure, section.end_beat), 6)
+        if alignment:
+            start = alignment.score_measure_at(timeline.measure_beat_to_tick(section.start_measure, section.start_beat))
+            end = alignment.score_measure_at(timeline.measure_beat_to_tick(section.end_measure, section.end_beat) - 1)
+            timed.start_score_measure = start["number"] if start else None
+            timed.end_score_measure = end["number"] if end else None
+        sections.append(timed)
+    
+    return JSONBytesResponse(dumps({"sections": sections}), headers={"ETag": song_etag(version_tag(song.updated_at))})
+
+
+@router.patch("/{id}/sections", response_model=SectionBatchResponse)
+async def batch_sections(
+    id: UUID,
+    batch: SectionBatch,
+    if_match: Optional[str] = Header(None)
+):
+    """
+    Create, update and delete several practice sections at once.
+
+    The operations are applied in order under one lock and saved together;
+    if any of them refers to a missing section (404) or has invalid bounds
+    (400), nothing is changed. Returns the affected sections and the new
+    song version.
+    """
+    check = await bounds_check(id)
+    operations = [operation.model_dump(exclude_unset=True) for operation in batch.operations]
+    try:
+        changes = await AsyncStorageService.apply_section_operations(id, operations, parse_if_match(if_match), check)
+    except VersionConflictError as e:
+        raise precondition_failed(e)
+    except SectionNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not changes:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Song not found"
+        )
+    await sections_changed(id, changes)
+    version = version_tag(changes.song.updated_at)
+    body = dumps({"created": changes.created, "updated": changes.updated, "deleted": changes.deleted, "version": version})
+    return JSONBytesResponse(body, headers={"ETag": song_etag(version)})
 
 
-@router.post("/{id}/sections", response_model=dict, status_code=status.HTTP_201_CREATED)
-async def create_section(id: UUID, section_data: PracticeSectionCreate):
+@router.post("/{id}/sections", response_model=SectionResponse, status_code=status.HTTP_201_CREATED)
+async def create_section(
+    id: UUID,
+    section_data: PracticeSectionCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None)
+):
     """Create a new practice section"""
-    section = StorageService.add_practice_section(id, section_data.model_dump())
-    if not section:
+    check = await bounds_check(id)
+    try:
+        write = await AsyncStorageService.add_practice_section(
+            id, section_data.model_dump(), parse_if_match(if_match), check
+        )
+    except VersionConflictError as e:
+        raise precondition_failed(e)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not write:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Song not found"
         )
-    return {"section": section}
+    # The version saved by this write (a later writer's version must not be passed off as ours)
+    response.headers["ETag"] = song_etag(write.version)
+    prerender_scheduler.schedule(id, [write.section.id])
+    return {"section": write.section}
 
 
-@router.put("/{id}/sections/{sectionId}", response_model=dict)
-async def update_section(id: UUID, sectionId: UUID, update_data: PracticeSectionUpdate):
+@router.put("/{id}/sections/{sectionId}", response_model=SectionResponse)
+async def update_section(
+    id: UUID,
+    sectionId: UUID,
+    update_data: PracticeSectionUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None)
+):
     """Update a practice section"""
-    section = StorageService.update_practice_section(
-        id, 
-        sectionId, 
-        update_data.model_dump(exclude_unset=True)
-    )
-    if not section:
+    bounds = ("start_measure", "start_beat", "end_measure", "end_beat")
+    changes = update_data.model_dump(exclude_unset=True)
+    # Checked against the section as saved under the lock, merged with the changes
+    check = await bounds_check(id) if any(field in changes for field in bounds) else None
+    try:
+        write = await AsyncStorageService.update_practice_section(
+            id, 
+            sectionId, 
+            changes,
+            parse_if_match(if_match),
+            check
+        )
+    except VersionConflictError as e:
+        raise precondition_failed(e)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not write:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Section or song not found"
         )
-    return {"section": section}
+    await run_in_thread(invalidate_section_slices, StorageService.get_song_dir(id), sectionId)
+    response.headers["ETag"] = song_etag(write.version)
+    prerender_scheduler.schedule(id, [sectionId])
+    return {"section": write.section}
 
 
-@router.delete("/{id}/sections/{sectionId}", response_model=dict)
-async def delete_section(id: UUID, sectionId: UUID):
+@router.delete("/{id}/sections/{sectionId}", response_model=MessageResponse)
+async def delete_section(
+    id: UUID,
+    sectionId: UUID,
+    response: Response,
+    if_match: Optional[str] = Header(None)
+):
     """Delete a practice section"""
-    success = StorageService.delete_practice_section(id, sectionId)
-    if not success:
+    try:
+        write = await AsyncStorageService.delete_practice_section(id, sectionId, parse_if_match(if_match))
+    except VersionConflictError as e:
+        raise precondition_failed(e)
+    if not write:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Section or song not found"
         )
+    await run_in_thread(invalidate_section_slices, StorageService.get_song_dir(id), sectionId)
+    response.headers["ETag"] = song_etag(write.version)
+    prerender_scheduler.cancel(id, sectionId)
     return {"message": "Section deleted successfully"}
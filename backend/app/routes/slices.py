@@ -0,0 +1,81 @@
+"""Trimmed MIDI slices for practice sections and measure ranges"""
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from typing import List, Optional
+from uuid import UUID
+
+from app.midi_analysis import load_analysis
+from app.midi_slicer import get_or_create_slice
+from app.storage import AsyncStorageService, StorageService
+from app.timeline import Timeline
+from app.workers import run_in_thread
+
+router = APIRouter()
+
+
+def _build_slice(song, start_measure: int, start_beat: int, end_measure: int, end_beat: int,
+                 tracks: Optional[List[int]], section_id: Optional[UUID] = None):
+    """Resolve measure/beat bounds and return the cached slice path (blocking)"""
+    song_dir = StorageService.get_song_dir(song.id)
+    analysis = load_analysis(song_dir, song.midi_sha256)
+    if analysis is None:
+        return None
+
+    timeline = Timeline.from_analysis(analysis)
+    start_tick = timeline.measure_beat_to_tick(start_measure, start_beat)
+    end_tick = timeline.measure_beat_to_tick(end_measure, end_beat)
+    if end_tick <= start_tick:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Range end must be after range start"
+        )
+    return get_or_create_slice(song_dir, analysis, start_tick, end_tick, tracks, section_id)
+
+
+async def _load_song_with_midi(id: UUID):
+    song = await AsyncStorageService.load_song(id)
+    if not song or not song.midi_file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="MIDI file not found")
+    return song
+
+
+@router.get("/{id}/sections/{sectionId}/midi")
+async def get_section_midi(
+    id: UUID,
+    sectionId: UUID,
+    relevant_only: bool = Query(False, description="Only include the section's relevant_voices tracks")
+):
+    """Serve a MIDI file containing only the notes of one practice section"""
+    song = await _load_song_with_midi(id)
+    section = next((s for s in song.practice_sections if s.id == sectionId), None)
+    if not section:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Section not found")
+    
+    tracks = section.relevant_voices if relevant_only and section.relevant_voices else None
+    path = await run_in_thread(
+        _build_slice, song,
+        section.start_measure, section.start_beat, section.end_measure, section.end_beat,
+        tracks, section.id
+    )
+    if not path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="MIDI file not found")
+    
+    return FileResponse(path=str(path), media_type="audio/midi", filename="section.mid")
+
+
+@router.get("/{id}/midi/range")
+async def get_midi_range(
+    id: UUID,
+    start_measure: int = Query(..., ge=1),
+    end_measure: int = Query(..., ge=1),
+    start_beat: int = Query(1, ge=1),
+    end_beat: int = Query(1, ge=1),
+    tracks: Optional[List[int]] = Query(None, description="Track numbers to include (default: all)")
+):
+    """Serve a MIDI file containing only the notes of a measure range (end is exclusive)"""
+    song = await _load_song_with_midi(id)
+    path = await run_in_thread(_build_slice, song, start_measure, start_beat, end_measure, end_beat, tracks)
+    if not path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="MIDI file not found")
+    
+    return FileResponse(path=str(path), media_type="audio/midi", filename="range.mid")
@@ -1,59 +1,206 @@
 """Song management endpoints"""
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+import hashlib
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from typing import List, Literal, Optional, Union
 from uuid import UUID
 
-from app.models import Song, SongCreate, SongUpdate, SongSummary
-from app.storage import StorageService
+from app.conditional import (
+    SONG_CACHE_CONTROL, cache_headers, is_not_modified, not_modified,
+    parse_if_match, precondition_failed, song_etag
+)
+from app.json_patch import JsonPatchError, JsonPatchTestFailed
+from app.models import (
+    JsonPatchOperation, MessageResponse, SongCreate, SongListResponse, SongPageResponse, SongPatchResponse,
+    SongResponse, SongSummary, SongUpdate
+)
+from app.prerender import prerender_scheduler
+from app.render_cache import render_cache
+from app.routes.sections import bounds_check, sections_changed
+from app.serialization import JSONBytesResponse, dumps, envelope, response_cache, song_json
+from app.storage import AsyncStorageService, SongPage, VersionConflictError, version_tag
+from app.workers import run_in_thread
 
 router = APIRouter()
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
-@router.get("", response_model=dict)
-async def list_songs():
-    """List all songs"""
-    songs = StorageService.list_songs()
-    return {"songs": songs}
+# response_cache key of the full song list
+_LIST_CACHE_KEY = "songs"
 
 
-@router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
+def _list_etag(songs: List[SongSummary]) -> str:
+    """Weak ETag of the song list, changing whenever a song is added, removed or updated"""
+    digest = hashlib.sha256()
+    for song in songs:
+        digest.update(f"{song.id}:{version_tag(song.updated_at)};".encode())
+    return song_etag(digest.hexdigest()[:32])
+
+
+def _page_etag(page: SongPage, query: str) -> str:
+    """Weak ETag of one page, covering the request and everything the page shows"""
+    digest = hashlib.sha256(f"{query}|{page.total}|{page.next_cursor}|".encode())
+    for song in page.songs:
+        digest.update(f"{song.id}:{version_tag(song.updated_at)};".encode())
+    return song_etag(digest.hexdigest()[:32])
+
+
+@router.get("", response_model=Union[SongPageResponse, SongListResponse])
+async def list_songs(
+    request: Request,
+    q: Optional[str] = Query(None, max_length=200, description="Search title, description and voice names"),
+    sort: Optional[Literal["updated_at", "title"]] = Query(None, description="Sort field (default: updated_at)"),
+    order: Optional[Literal["asc", "desc"]] = Query(
+        None, description="Sort order (default: desc for updated_at, asc for title)"
+    ),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
+):
+    """
+    List songs.
+
+    Without parameters all songs are returned in storage order. With any of
+    q, sort, order, limit or cursor the result is one page of matching
+    songs plus their total count and the cursor of the next page.
+    """
+    if q is None and sort is None and order is None and limit is None and cursor is None:
+        # The serialized list is reused until the catalog changes
+        version = await AsyncStorageService.catalog_version()
+        cached = response_cache.get(_LIST_CACHE_KEY, version)
+        if cached:
+            body, (headers, last_modified) = cached
+        else:
+            songs = await AsyncStorageService.list_songs()
+            last_modified = max((song.updated_at for song in songs), default=None)
+            headers = cache_headers(_list_etag(songs), last_modified, SONG_CACHE_CONTROL)
+            body = response_cache.put(_LIST_CACHE_KEY, version, dumps({"songs": songs}), (headers, last_modified))
+        if is_not_modified(request, headers["ETag"], last_modified):
+            return not_modified(headers)
+        return JSONBytesResponse(body, headers=headers)
+
+    try:
+        page = await AsyncStorageService.search_songs(q, sort or "updated_at", order, limit or DEFAULT_PAGE_SIZE, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # No Last-Modified: a page also changes when songs outside it are removed
+    headers = cache_headers(_page_etag(page, str(request.query_params)), None, SONG_CACHE_CONTROL)
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    body = dumps({"songs": page.songs, "total": page.total, "next_cursor": page.next_cursor})
+    return JSONBytesResponse(body, headers=headers)
+
+
+@router.post("", response_model=SongResponse, status_code=status.HTTP_201_CREATED)
 async def create_song(song_data: SongCreate):
     """Create a new song"""
-    song = StorageService.create_song(song_data)
-    return {"song": song}
+    song = await AsyncStorageService.create_song(song_data)
+    return JSONBytesResponse(
+        envelope("song", song_json(song)),
+        status_code=status.HTTP_201_CREATED,
+        headers={"ETag": song_etag(version_tag(song.updated_at))}
+    )
 
 
-@router.get("/{id}", response_model=dict)
-async def get_song(id: UUID):
-    """Get song details"""
-    song = StorageService.load_song(id)
+@router.get("/{id}", response_model=SongResponse)
+async def get_song(id: UUID, request: Request):
+    """Get song details (answers If-None-Match / If-Modified-Since with 304)"""
+    # Revalidate against the cheap version lookup before loading the full song
+    files = await AsyncStorageService.song_files(id)
+    if files:
+        version = version_tag(files.updated_at)
+        headers = cache_headers(song_etag(version), files.updated_at, SONG_CACHE_CONTROL)
+        if is_not_modified(request, headers["ETag"], files.updated_at):
+            return not_modified(headers)
+        cached = response_cache.get(id, version)
+        if cached:
+            return JSONBytesResponse(envelope("song", cached[0]), headers=headers)
+
+    song = await AsyncStorageService.load_song(id)
     if not song:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Song not found"
         )
-    return {"song": song}
+    headers = cache_headers(song_etag(version_tag(song.updated_at)), song.updated_at, SONG_CACHE_CONTROL)
+    return JSONBytesResponse(envelope("song", song_json(song)), headers=headers)
 
 
-@router.put("/{id}", response_model=dict)
-async def update_song(id: UUID, update_data: SongUpdate):
-    """Update song metadata"""
-    song = StorageService.update_song(id, update_data)
+@router.put("/{id}", response_model=SongResponse)
+async def update_song(
+    id: UUID,
+    update_data: SongUpdate,
+    if_match: Optional[str] = Header(None)
+):
+    """Update song metadata (send If-Match with the song's ETag to avoid lost updates)"""
+    try:
+        song = await AsyncStorageService.update_song(id, update_data, parse_if_match(if_match))
+    except VersionConflictError as e:
+        raise precondition_failed(e)
     if not song:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Song not found"
         )
-    return {"song": song}
+    if update_data.voices is not None:
+        prerender_scheduler.schedule(id)
+    return JSONBytesResponse(
+        envelope("song", song_json(song)), headers={"ETag": song_etag(version_tag(song.updated_at))}
+    )
+
+
+@router.patch("/{id}", response_model=SongPatchResponse)
+async def patch_song(
+    id: UUID,
+    operations: List[JsonPatchOperation],
+    if_match: Optional[str] = Header(None)
+):
+    """
+    Partially update a song with JSON Patch (RFC 6902), e.g.
+    [{"op": "replace", "path": "/practice_sections/2/label", "value": "Coda"}].
+
+    All operations are applied under one lock and saved together. A failing
+    test operation gives 409, a patch that cannot be applied or produces an
+    invalid song 422 and section bounds outside the song 400; nothing is
+    changed in these cases. id, timestamps and upload fields are read-only.
+    """
+    check = await bounds_check(id)
+    patch = [operation.model_dump(by_alias=True, exclude_unset=True) for operation in operations]
+    try:
+        changes = await AsyncStorageService.patch_song(id, patch, parse_if_match(if_match), check)
+    except VersionConflictError as e:
+        raise precondition_failed(e)
+    except JsonPatchTestFailed as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except JsonPatchError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=jsonable_encoder(e.errors(include_url=False)))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not changes:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Song not found"
+        )
+    await sections_changed(id, changes)
+    version = version_tag(changes.song.updated_at)
+    return JSONBytesResponse(
+        envelope("song", song_json(changes.song), version=version), headers={"ETag": song_etag(version)}
+    )
 
 
-@router.delete("/{id}", response_model=dict)
+@router.delete("/{id}", response_model=MessageResponse)
 async def delete_song(id: UUID):
     """Delete a song"""
-    success = StorageService.delete_song(id)
+    success = await AsyncStorageService.delete_song(id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Song not found"
         )
+    prerender_scheduler.cancel(id)
+    response_cache.discard(id)
+    await run_in_thread(render_cache.invalidate_song, id)
     return {"message": "Song deleted successfully"}
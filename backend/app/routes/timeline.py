@@ -0,0 +1,50 @@
+"""Song timeline and score alignment endpoints"""
+from fastapi import APIRouter, HTTPException, status
+from uuid import UUID
+
+from app.alignment import load_alignment
+from app.storage import AsyncStorageService, StorageService
+from app.timeline import load_timeline
+from app.workers import run_in_thread
+
+router = APIRouter()
+
+
+@router.get("/{id}/timeline", response_model=dict)
+async def get_timeline(id: UUID):
+    """Measure/beat to tick/seconds map built from the MIDI tempo and meter changes"""
+    song = await AsyncStorageService.load_song(id)
+    if not song or not song.midi_file:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="MIDI file not found"
+        )
+    
+    timeline = await run_in_thread(load_timeline, StorageService.get_song_dir(id), song.midi_sha256)
+    if not timeline:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="MIDI file not found"
+        )
+    return {"timeline": timeline.to_dict()}
+
+
+@router.get("/{id}/alignment", response_model=dict)
+async def get_alignment(id: UUID):
+    """Score measure numbers mapped to MIDI tick ranges, with a cross-check of both bar grids"""
+    files = await AsyncStorageService.song_files(id)
+    if not files or not files.midi_file:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="MIDI file not found"
+        )
+    
+    alignment = await run_in_thread(
+        load_alignment, StorageService.get_song_dir(id), files.midi_sha256, files.score_file, files.score_sha256
+    )
+    if not alignment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="MIDI file not found"
+        )
+    return {"alignment": alignment.to_dict()}
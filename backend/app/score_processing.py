@@ -0,0 +1,406 @@
+"""
+MusicXML score processing
+
+Runs once per upload instead of once per view: the score is decompressed
+(.mxl is a zip container), parsed and validated, and its part list and
+measure count are stored in a manifest. The whole score and every part are
+written as standalone MusicXML documents with precompressed variants (see
+app.encoding), so a phone only downloads the part its singer needs.
+
+Everything lives in songs/<id>/score_cache/. The manifest records the hash
+of the uploaded file; a missing or stale cache (e.g. for scores uploaded
+before processing existed) is rebuilt on first use.
+
+The manifest also holds a measure table (number, length in quarter notes,
+pickup flag, repeat barlines and volta endings) that app.alignment uses to
+map score measures onto the MIDI timeline without parsing the XML again.
+
+Measure ranges count measures by position in the part (1 = first measure,
+pickups included). A range slice carries the divisions, key, time, clef and
+other attributes in effect at its start, so it renders on its own. Slices
+are built on demand and cached next to the parts, within
+RANGE_CACHE_MAX_BYTES per song (see app.range_cache).
+"""
+import copy
+import hashlib
+import io
+import json
+import re
+import shutil
+import xml.etree.ElementTree as ET
+import zipfile
+from fractions import Fraction
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from app.encoding import ENCODING_SUFFIXES, write_precompressed
+from app.range_cache import touch_range, trim_ranges
+
+SCORE_CACHE_DIRNAME = "score_cache"
+RANGES_DIRNAME = "ranges"
+MANIFEST_FILENAME = "manifest.json"
+SCORE_FILENAME = "score.xml"
+
+# Bump when the processed output changes so old caches are rebuilt
+SCORE_CACHE_VERSION = 2
+
+# Decompression limit for .mxl containers (protects against zip bombs)
+MAX_XML_BYTES = 200 * 1024 * 1024
+
+XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+PARTWISE_DOCTYPE = (
+    '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML {version} Partwise//EN" '
+    '"http://www.musicxml.org/dtds/partwise.dtd">\n'
+)
+
+# Attribute children carried into a range slice, in MusicXML order; the
+# value is the XML attribute that distinguishes several of them (per staff)
+CARRIED_ATTRIBUTES = {
+    "divisions": None,
+    "key": "number",
+    "time": "number",
+    "staves": None,
+    "part-symbol": None,
+    "instruments": None,
+    "clef": "number",
+    "staff-details": "number",
+    "transpose": "number",
+}
+ATTRIBUTE_ORDER = [*CARRIED_ATTRIBUTES, "directive", "measure-style"]
+
+
+def read_musicxml(path: Path) -> bytes:
+    """Return the XML of a .musicxml/.xml file or of the root file of an .mxl container"""
+    if not zipfile.is_zipfile(path):
+        return path.read_bytes()
+
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            rootfile = None
+            if "META-INF/container.xml" in names:
+                container = ET.fromstring(archive.read("META-INF/container.xml"))
+                for element in container.iter():
+                    if element.tag.rsplit("}", 1)[-1] == "rootfile" and element.get("full-path"):
+                        rootfile = element.get("full-path")
+                        break
+            if rootfile is None:
+                rootfile = next(
+                    (name for name in names
+                     if name.lower().endswith((".xml", ".musicxml")) and not name.startswith("META-INF/")),
+                    None
+                )
+            if rootfile is None or rootfile not in names:
+                raise ValueError("Compressed score contains no MusicXML file")
+            if archive.getinfo(rootfile).file_size > MAX_XML_BYTES:
+                raise ValueError("Score is too large")
+            with archive.open(rootfile) as f:
+                data = f.read(MAX_XML_BYTES + 1)
+    except (zipfile.BadZipFile, ET.ParseError, KeyError) as e:
+        raise ValueError(f"Invalid compressed score: {e}")
+    if len(data) > MAX_XML_BYTES:
+        raise ValueError("Score is too large")
+    return data
+
+
+def parse_score(data: bytes) -> ET.Element:
+    """Parse and validate a partwise MusicXML document"""
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError as e:
+        raise ValueError(f"Invalid XML: {e}")
+
+    if root.tag == "score-timewise":
+        raise ValueError("Timewise MusicXML is not supported")
+    if root.tag != "score-partwise":
+        raise ValueError("Not a MusicXML score")
+
+    part_list = root.find("part-list")
+    if part_list is None:
+        raise ValueError("Score has no part-list")
+    declared = [score_part.get("id") for score_part in part_list.findall("score-part")]
+    parts = [part.get("id") for part in root.findall("part")]
+    if not parts:
+        raise ValueError("Score has no parts")
+    missing = set(parts) - set(declared)
+    if missing:
+        raise ValueError(f"Parts missing from part-list: {', '.join(sorted(missing))}")
+    return root
+
+
+def _document(root: ET.Element, part_ids: List[str], parts: List[ET.Element]) -> bytes:
+    """Serialize a score with only the given parts (header elements are kept)"""
+    document = ET.Element(root.tag, root.attrib)
+    keep_groups = len(part_ids) == len(root.findall("part"))
+    for child in root:
+        if child.tag == "part-list":
+            part_list = ET.SubElement(document, "part-list", child.attrib)
+            for entry in child:
+                if entry.tag == "score-part" and entry.get("id") in part_ids:
+                    part_list.append(entry)
+                elif entry.tag == "part-group" and keep_groups:
+                    part_list.append(entry)
+        elif child.tag != "part":
+            document.append(child)
+    document.extend(parts)
+
+    buffer = io.BytesIO()
+    buffer.write(XML_DECLARATION)
+    buffer.write(PARTWISE_DOCTYPE.format(version=root.get("version", "4.0")).encode())
+    ET.ElementTree(document).write(buffer, encoding="utf-8", xml_declaration=False)
+    return buffer.getvalue()
+
+
+def _attributes_at(part: ET.Element, index: int) -> Dict[Tuple[str, Optional[str]], ET.Element]:
+    """Attribute elements in effect at the start of the measure at position index (0-based)"""
+    state: Dict[Tuple[str, Optional[str]], ET.Element] = {}
+    for measure in part.findall("measure")[:index]:
+        for attributes in measure.findall("attributes"):
+            for element in attributes:
+                if element.tag in CARRIED_ATTRIBUTES:
+                    distinguisher = CARRIED_ATTRIBUTES[element.tag]
+                    state[(element.tag, element.get(distinguisher) if distinguisher else None)] = element
+    return state
+
+
+def slice_part(part: ET.Element, start: int, end: int) -> ET.Element:
+    """Measures start..end (1-based positions, inclusive) of a part as a new part element"""
+    measures = part.findall("measure")[start - 1:end]
+    sliced = ET.Element("part", part.attrib)
+    if not measures:
+        return sliced
+
+    carried = _attributes_at(part, start - 1)
+    first = copy.deepcopy(measures[0])
+    if carried:
+        # Merge into the measure's leading attributes element or add one
+        leading = None
+        for child in first:
+            if child.tag == "attributes":
+                leading = child
+                break
+            if child.tag in ("note", "backup", "forward"):
+                break
+        present = set()
+        if leading is not None:
+            for element in leading:
+                distinguisher = CARRIED_ATTRIBUTES.get(element.tag)
+                present.add((element.tag, element.get(distinguisher) if distinguisher else None))
+        else:
+            leading = ET.Element("attributes")
+            first.insert(0, leading)
+
+        elements = [element for key, element in carried.items() if key not in present] + list(leading)
+        elements.sort(key=lambda element: ATTRIBUTE_ORDER.index(element.tag)
+                      if element.tag in ATTRIBUTE_ORDER else len(ATTRIBUTE_ORDER))
+        leading[:] = elements
+
+    sliced.append(first)
+    sliced.extend(measures[1:])
+    return sliced
+
+
+def _measure_length(measure: ET.Element, divisions: int) -> Optional[Fraction]:
+    """Notated length of a measure in quarter notes (None if it has no timed content)"""
+    position = longest = 0
+    for element in measure:
+        if element.tag == "note":
+            if element.find("chord") is not None or element.find("grace") is not None:
+                continue
+            position += int(element.findtext("duration") or 0)
+        elif element.tag == "backup":
+            position -= int(element.findtext("duration") or 0)
+        elif element.tag == "forward":
+            position += int(element.findtext("duration") or 0)
+        longest = max(longest, position)
+    return Fraction(longest, divisions) if longest else None
+
+
+def measure_table(root: ET.Element) -> List[Dict[str, Any]]:
+    """
+    Per-measure timing and repeat structure of a score, taken from its
+    first part (parts of a partwise score share their measures)
+    """
+    part = root.find("part")
+    measures = part.findall("measure")
+    divisions = 1
+    meter = Fraction(4)
+    endings: List[int] = []
+    table = []
+    for position, measure in enumerate(measures, start=1):
+        for attributes in measure.findall("attributes"):
+            divisions = int(attributes.findtext("divisions") or divisions)
+            time = attributes.find("time")
+            if time is not None and time.findtext("beats"):
+                beats = sum(int(b) for b in time.findtext("beats").split("+"))
+                meter = Fraction(beats * 4, int(time.findtext("beat-type") or 4))
+
+        forward = backward = False
+        times = 2
+        starts_ending = []
+        for barline in measure.findall("barline"):
+            repeat = barline.find("repeat")
+            if repeat is not None:
+                if repeat.get("direction") == "forward":
+                    forward = True
+                elif repeat.get("direction") == "backward":
+                    backward = True
+                    times = int(repeat.get("times") or 2)
+            ending = barline.find("ending")
+            if ending is not None and ending.get("type") == "start":
+                starts_ending = [int(n) for n in re.findall(r"\d+", ending.get("number", ""))]
+        if starts_ending:
+            endings = starts_ending
+
+        length = _measure_length(measure, divisions)
+        # Pickups and the closing partial bar keep their actual length;
+        # other bars get the full meter even if a voice is incomplete
+        implicit = measure.get("implicit") == "yes"
+        partial = length is not None and length < meter and (implicit or position in (1, len(measures)))
+        table.append({
+            "number": measure.get("number", str(position)),
+            "quarters": str(length if partial else meter),
+            "implicit": implicit or (partial and position == 1),
+            "repeat_forward": forward,
+            "repeat_backward": times if backward else 0,
+            "endings": endings
+        })
+
+        for barline in measure.findall("barline"):
+            ending = barline.find("ending")
+            if ending is not None and ending.get("type") in ("stop", "discontinue"):
+                endings = []
+    return table
+
+
+def _part_filename(index: int) -> str:
+    return f"part-{index}.xml"
+
+
+def part_index(manifest: Dict[str, Any], part_id: str) -> Optional[int]:
+    """Position of a part in the manifest, None if the score has no such part"""
+    return next((i for i, part in enumerate(manifest["parts"]) if part["id"] == part_id), None)
+
+
+def part_path(song_dir: Path, index: int) -> Path:
+    """Processed document of the part at a position"""
+    return song_dir / SCORE_CACHE_DIRNAME / _part_filename(index)
+
+
+def process_score(score_path: Path, cache_dir: Path, sha256: str) -> Dict[str, Any]:
+    """
+    Decompress, validate and split a score into cache_dir.
+
+    Raises ValueError for files that are not usable MusicXML. The cache is
+    built in a temporary directory and swapped in when complete.
+    """
+    root = parse_score(read_musicxml(score_path))
+    score_parts = {entry.get("id"): entry for entry in root.find("part-list").findall("score-part")}
+
+    build_dir = cache_dir.with_name(f".{cache_dir.name}-{uuid4().hex}")
+    build_dir.mkdir(parents=True)
+    try:
+        parts = []
+        for index, part in enumerate(root.findall("part")):
+            part_id = part.get("id")
+            name = score_parts[part_id].findtext("part-name") or part_id
+            parts.append({
+                "id": part_id,
+                "name": name.strip(),
+                "abbreviation": (score_parts[part_id].findtext("part-abbreviation") or "").strip() or None,
+                "measures": len(part.findall("measure"))
+            })
+            write_precompressed(build_dir / _part_filename(index), _document(root, [part_id], [part]))
+        write_precompressed(build_dir / SCORE_FILENAME, _document(root, list(score_parts), root.findall("part")))
+
+        manifest = {
+            "version": SCORE_CACHE_VERSION,
+            "source_sha256": sha256,
+            "title": (root.findtext("work/work-title") or root.findtext("movement-title") or "").strip() or None,
+            "measure_count": max(part["measures"] for part in parts),
+            "parts": parts,
+            "measures": measure_table(root)
+        }
+        (build_dir / MANIFEST_FILENAME).write_text(json.dumps(manifest))
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        try:
+            build_dir.rename(cache_dir)
+        except OSError:
+            # A concurrent rebuild got there first
+            if not (cache_dir / MANIFEST_FILENAME).exists():
+                raise
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return manifest
+
+
+def process_score_to_cache(score_path: str, song_dir: str, sha256: str) -> Dict[str, Any]:
+    """Entry point for the worker process pool (plain arguments, picklable result)"""
+    return process_score(Path(score_path), Path(song_dir) / SCORE_CACHE_DIRNAME, sha256)
+
+
+def cached_score_manifest(cache_dir: Path, sha256: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Manifest of a processed score cache if it is current (and built from sha256)"""
+    try:
+        manifest = json.loads((cache_dir / MANIFEST_FILENAME).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("version") == SCORE_CACHE_VERSION and (sha256 is None or manifest.get("source_sha256") == sha256):
+        return manifest
+    return None
+
+
+def load_score_manifest(song_dir: Path, score_file: Optional[str], sha256: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Return the manifest of a song's processed score, processing it if the
+    cache is missing or stale. None if the song has no score file.
+    """
+    if not score_file:
+        return None
+    cache_dir = song_dir / SCORE_CACHE_DIRNAME
+    manifest = cached_score_manifest(cache_dir, sha256)
+    if manifest:
+        return manifest
+
+    score_path = song_dir / score_file
+    if not score_path.exists():
+        return None
+    return process_score(score_path, cache_dir, sha256 or hashlib.sha256(score_path.read_bytes()).hexdigest())
+
+
+def get_or_create_range(
+    song_dir: Path,
+    manifest: Dict[str, Any],
+    start: int,
+    end: int,
+    part_id: Optional[str] = None
+) -> Path:
+    """Return the cached measure-range document (one part or all), building it on a miss"""
+    cache_dir = song_dir / SCORE_CACHE_DIRNAME
+    key = f"{manifest['source_sha256'][:16]}-{start}-{end}"
+    if part_id is not None:
+        index = part_index(manifest, part_id)
+        path = cache_dir / RANGES_DIRNAME / f"part-{index}-{key}.xml"
+        source = cache_dir / _part_filename(index)
+    else:
+        path = cache_dir / RANGES_DIRNAME / f"score-{key}.xml"
+        source = cache_dir / SCORE_FILENAME
+    if path.exists():
+        touch_range(path)
+        return path
+
+    root = ET.parse(source).getroot()
+    parts = root.findall("part")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_precompressed(path, _document(
+        root, [part.get("id") for part in parts], [slice_part(part, start, end) for part in parts]
+    ))
+    trim_ranges(path.parent, "*.xml", ENCODING_SUFFIXES.values(), keep=path)
+    return path
+
+
+def invalidate_score_cache(song_dir: Path):
+    """Drop the processed score of a song"""
+    shutil.rmtree(song_dir / SCORE_CACHE_DIRNAME, ignore_errors=True)
@@ -0,0 +1,122 @@
+"""
+JSON serialization of API responses and stored song documents
+
+Everything goes through pydantic's Rust serializer (pydantic_core.to_json),
+which writes models, UUIDs and datetimes straight to bytes in the same
+format FastAPI produces. Serialized songs are kept in a small LRU cache keyed
+by song ID and version, so reading an unchanged song does not load or
+serialize it again.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from pydantic_core import to_json
+
+from app.config import RESPONSE_CACHE_MAX_BYTES
+from app.metrics import record_cache
+from app.models import Song
+from app.storage.base import version_tag
+
+
+def dumps(data: Any, pretty: bool = False) -> bytes:
+    """Serialize data (which may contain models) to compact or indented JSON"""
+    return to_json(data, indent=2 if pretty else None)
+
+
+def envelope(key: str, body: bytes, **fields: Any) -> bytes:
+    """Wrap already serialized JSON as {"key": body, **fields}"""
+    extra = b"".join(b',"' + name.encode() + b'":' + dumps(value) for name, value in fields.items())
+    return b'{"' + key.encode() + b'":' + body + extra + b"}"
+
+
+class JSONBytesResponse(JSONResponse):
+    """JSON response that accepts pre-serialized bytes or serializes with dumps()"""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+class SerializedCache:
+    """
+    LRU cache of serialized JSON documents with a byte budget.
+
+    Every entry records the version it was serialized from; a lookup with
+    another version misses, so writes never need to invalidate anything.
+    """
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[Any, bytes, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: Any) -> Optional[Tuple[bytes, Any]]:
+        """Cached body and extra data for key if it was stored for this version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry[0] == version
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        record_cache(self.name, hit)
+        return (entry[1], entry[2]) if hit else None
+
+    def put(self, key: Hashable, version: Any, body: bytes, extra: Any = None) -> bytes:
+        """Store a body for a version (documents over the budget are not kept)"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= len(old[1])
+            if len(body) <= self.max_bytes:
+                self._entries[key] = (version, body, extra)
+                self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return body
+
+    def discard(self, key: Hashable):
+        """Drop an entry"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= len(old[1])
+
+    def clear(self):
+        """Drop all entries and reset counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters for monitoring"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# Serialized API documents: songs by ID plus the full song list
+response_cache = SerializedCache("response", RESPONSE_CACHE_MAX_BYTES)
+
+
+def song_json(song: Song) -> bytes:
+    """Serialize a song and keep the bytes until its next change"""
+    return response_cache.put(song.id, version_tag(song.updated_at), dumps(song))
@@ -0,0 +1,389 @@
+"""
+Storage service for ChoirLoop
+
+StorageService is the facade used by the routes. It delegates to the backend
+selected with the STORAGE_BACKEND setting ("json" or "sqlite"); uploaded
+MIDI and score files always live in DATA_DIR/songs/<id>/.
+"""
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Dict, Any, Set
+from uuid import UUID
+
+from app.config import DATA_DIR, STORAGE_BACKEND, SQLITE_PATH
+from app.metrics import span
+from app.models import Song, SongCreate, SongUpdate, SongSummary, PracticeSection
+from app.storage.base import (
+    SectionCheck, SectionNotFoundError, SectionWrite, SongChanges, SongFiles, SongPage, StorageBackend,
+    VersionConflictError, summarize, version_tag
+)
+from app.storage.blobs import BlobStore
+from app.storage.json_backend import JsonStorageBackend
+from app.storage.search import song_search
+from app.storage.sqlite_backend import SqliteStorageBackend
+from app.workers import run_in_thread
+
+SONGS_DIR = DATA_DIR / "songs"
+BLOBS_DIR = DATA_DIR / "blobs"
+INDEX_FILE = DATA_DIR / "index.json"
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+# Uploaded MIDI and score files, shared between songs by content hash
+blob_store = BlobStore(BLOBS_DIR)
+
+
+def create_backend(kind: str = STORAGE_BACKEND) -> StorageBackend:
+    """Instantiate a storage backend by name"""
+    if kind == "json":
+        return JsonStorageBackend(DATA_DIR)
+    if kind == "sqlite":
+        return SqliteStorageBackend(SQLITE_PATH, SONGS_DIR)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def get_backend() -> StorageBackend:
+    """Return the process-wide storage backend"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def set_backend(backend: StorageBackend):
+    """Replace the process-wide storage backend"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+class StorageService:
+    """Handle storage operations through the configured backend"""
+
+    @staticmethod
+    def ensure_directories():
+        """Ensure required directories exist"""
+        get_backend().ensure_directories()
+
+    @staticmethod
+    def get_song_dir(song_id: UUID) -> Path:
+        """Get directory path for a song"""
+        return SONGS_DIR / str(song_id)
+
+    @staticmethod
+    def load_song(song_id: UUID) -> Optional[Song]:
+        """Load song from storage"""
+        with span("storage_load"):
+            return get_backend().load_song(song_id)
+
+    @staticmethod
+    def save_song(song: Song):
+        """Save song to storage"""
+        with span("storage_save"):
+            get_backend().save_song(song)
+
+    @staticmethod
+    def save_songs(songs: List[Song]):
+        """Save several songs at once (e.g. an import)"""
+        with span("storage_save"):
+            get_backend().save_songs(songs)
+
+    @staticmethod
+    def delete_song(song_id: UUID) -> bool:
+        """Delete song and all its files (stored blobs no other song uses are removed)"""
+        files = get_backend().song_files(song_id)
+        deleted = get_backend().delete_song(song_id)
+        if files:
+            StorageService.release_blobs(files.midi_sha256, files.score_sha256)
+        return deleted
+
+    @staticmethod
+    def store_upload(song_id: UUID, source: Path, sha256: str, filename: str) -> bool:
+        """Move an upload into the blob store and link it into the song directory (True: duplicate)"""
+        return blob_store.store(source, sha256, StorageService.get_song_dir(song_id) / filename)
+
+    @staticmethod
+    def release_blobs(*hashes: Optional[str]):
+        """Drop blobs that are no longer linked from any song"""
+        for sha256 in hashes:
+            if sha256:
+                blob_store.release(sha256)
+
+    @staticmethod
+    def sync_blobs() -> Dict[str, int]:
+        """
+        Move song files that are not in the blob store yet (e.g. uploaded
+        before it existed) into it and collect unreferenced blobs.
+        """
+        adopted = 0
+        for song_id in get_backend().song_ids():
+            files = get_backend().song_files(UUID(song_id))
+            if not files:
+                continue
+            song_dir = StorageService.get_song_dir(UUID(song_id))
+            for name, sha256 in ((files.midi_file, files.midi_sha256), (files.score_file, files.score_sha256)):
+                path = song_dir / name if name else None
+                if not sha256 or not path or not path.exists():
+                    continue
+                if blob_store.contains(sha256) and path.samefile(blob_store.path(sha256)):
+                    continue
+                blob_store.store(path, sha256, path)
+                adopted += 1
+        removed = blob_store.collect()
+        if adopted:
+            print(f"[BlobStore] Moved {adopted} song files into the blob store")
+        return {"adopted": adopted, "removed": removed}
+
+    @staticmethod
+    def list_songs() -> List[SongSummary]:
+        """List all songs"""
+        with span("storage_list"):
+            return get_backend().list_songs()
+
+    @staticmethod
+    def search_songs(
+        query: Optional[str] = None,
+        sort: str = "updated_at",
+        order: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> SongPage:
+        """One page of songs matching a search, sorted by updated_at or title"""
+        with span("storage_search"):
+            return song_search.search(get_backend(), query, sort, order, limit, cursor)
+
+    @staticmethod
+    def song_ids() -> Set[str]:
+        """IDs of all songs"""
+        return get_backend().song_ids()
+
+    @staticmethod
+    def catalog_version() -> Any:
+        """Value that changes whenever a song is saved or deleted"""
+        return get_backend().catalog_version()
+
+    @staticmethod
+    def summarize(song: Song) -> SongSummary:
+        """Build the list-view summary for a song"""
+        return summarize(song)
+
+    @staticmethod
+    def cache_stats() -> Dict[str, Any]:
+        """Storage cache statistics"""
+        return {"backend": get_backend().name, **get_backend().cache_stats(), "search": song_search.stats(), "blobs": blob_store.stats()}
+
+    @staticmethod
+    def song_version(song_id: UUID) -> Optional[str]:
+        """Current version tag of a song (used for ETags / If-Match)"""
+        return get_backend().song_version(song_id)
+
+    @staticmethod
+    def song_files(song_id: UUID) -> Optional[SongFiles]:
+        """File names and content hashes of a song's uploads"""
+        return get_backend().song_files(song_id)
+
+    @staticmethod
+    def modify_song(
+        song_id: UUID,
+        mutate: Callable[[Song], Optional[bool]],
+        expected_version: Optional[str] = None
+    ) -> Optional[Song]:
+        """Apply a change to a song under its lock and save it"""
+        with span("storage_modify"):
+            return get_backend().modify_song(song_id, mutate, expected_version)
+
+    @staticmethod
+    def create_song(song_data: SongCreate) -> Song:
+        """Create a new song"""
+        with span("storage_modify"):
+            return get_backend().create_song(song_data)
+
+    @staticmethod
+    def update_song(
+        song_id: UUID,
+        update_data: SongUpdate,
+        expected_version: Optional[str] = None
+    ) -> Optional[Song]:
+        """Update an existing song"""
+        with span("storage_modify"):
+            return get_backend().update_song(song_id, update_data, expected_version)
+
+    @staticmethod
+    def add_practice_section(
+        song_id: UUID,
+        section_data: Dict[str, Any],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SectionWrite]:
+        """Add a practice section to a song (returns it with the song's new version)"""
+        with span("storage_modify"):
+            return get_backend().add_practice_section(song_id, section_data, expected_version, check)
+
+    @staticmethod
+    def update_practice_section(
+        song_id: UUID,
+        section_id: UUID,
+        update_data: Dict[str, Any],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SectionWrite]:
+        """Update a practice section (returns it with the song's new version)"""
+        with span("storage_modify"):
+            return get_backend().update_practice_section(song_id, section_id, update_data, expected_version, check)
+
+    @staticmethod
+    def delete_practice_section(
+        song_id: UUID,
+        section_id: UUID,
+        expected_version: Optional[str] = None
+    ) -> Optional[SectionWrite]:
+        """Delete a practice section (returns the song's new version, None if not found)"""
+        with span("storage_modify"):
+            return get_backend().delete_practice_section(song_id, section_id, expected_version)
+
+    @staticmethod
+    def apply_section_operations(
+        song_id: UUID,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SongChanges]:
+        """Create, update and delete several practice sections in one save"""
+        with span("storage_modify"):
+            return get_backend().apply_section_operations(song_id, operations, expected_version, check)
+
+    @staticmethod
+    def patch_song(
+        song_id: UUID,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SongChanges]:
+        """Apply JSON Patch operations to a song in one save"""
+        with span("storage_modify"):
+            return get_backend().patch_song(song_id, operations, expected_version, check)
+
+
+class AsyncStorageService:
+    """
+    Awaitable counterpart of StorageService for request handlers.
+
+    Every call runs in the bounded storage thread pool (see app.workers),
+    so slow disks or database locks never stall the event loop.
+    """
+
+    @staticmethod
+    async def load_song(song_id: UUID) -> Optional[Song]:
+        return await run_in_thread(StorageService.load_song, song_id)
+
+    @staticmethod
+    async def save_song(song: Song):
+        await run_in_thread(StorageService.save_song, song)
+
+    @staticmethod
+    async def save_songs(songs: List[Song]):
+        await run_in_thread(StorageService.save_songs, songs)
+
+    @staticmethod
+    async def delete_song(song_id: UUID) -> bool:
+        return await run_in_thread(StorageService.delete_song, song_id)
+
+    @staticmethod
+    async def list_songs() -> List[SongSummary]:
+        return await run_in_thread(StorageService.list_songs)
+
+    @staticmethod
+    async def search_songs(
+        query: Optional[str] = None,
+        sort: str = "updated_at",
+        order: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> SongPage:
+        return await run_in_thread(StorageService.search_songs, query, sort, order, limit, cursor)
+
+    @staticmethod
+    async def song_ids() -> Set[str]:
+        return await run_in_thread(StorageService.song_ids)
+
+    @staticmethod
+    async def catalog_version() -> Any:
+        return await run_in_thread(StorageService.catalog_version)
+
+    @staticmethod
+    async def song_version(song_id: UUID) -> Optional[str]:
+        return await run_in_thread(StorageService.song_version, song_id)
+
+    @staticmethod
+    async def song_files(song_id: UUID) -> Optional[SongFiles]:
+        return await run_in_thread(StorageService.song_files, song_id)
+
+    @staticmethod
+    async def modify_song(
+        song_id: UUID,
+        mutate: Callable[[Song], Optional[bool]],
+        expected_version: Optional[str] = None
+    ) -> Optional[Song]:
+        return await run_in_thread(StorageService.modify_song, song_id, mutate, expected_version)
+
+    @staticmethod
+    async def create_song(song_data: SongCreate) -> Song:
+        return await run_in_thread(StorageService.create_song, song_data)
+
+    @staticmethod
+    async def update_song(
+        song_id: UUID,
+        update_data: SongUpdate,
+        expected_version: Optional[str] = None
+    ) -> Optional[Song]:
+        return await run_in_thread(StorageService.update_song, song_id, update_data, expected_version)
+
+    @staticmethod
+    async def add_practice_section(
+        song_id: UUID,
+        section_data: Dict[str, Any],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SectionWrite]:
+        return await run_in_thread(StorageService.add_practice_section, song_id, section_data, expected_version, check)
+
+    @staticmethod
+    async def update_practice_section(
+        song_id: UUID,
+        section_id: UUID,
+        update_data: Dict[str, Any],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SectionWrite]:
+        return await run_in_thread(
+            StorageService.update_practice_section, song_id, section_id, update_data, expected_version, check
+        )
+
+    @staticmethod
+    async def delete_practice_section(
+        song_id: UUID,
+        section_id: UUID,
+        expected_version: Optional[str] = None
+    ) -> Optional[SectionWrite]:
+        return await run_in_thread(StorageService.delete_practice_section, song_id, section_id, expected_version)
+
+    @staticmethod
+    async def apply_section_operations(
+        song_id: UUID,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SongChanges]:
+        return await run_in_thread(StorageService.apply_section_operations, song_id, operations, expected_version, check)
+
+    @staticmethod
+    async def patch_song(
+        song_id: UUID,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SongChanges]:
+        return await run_in_thread(StorageService.patch_song, song_id, operations, expected_version, check)
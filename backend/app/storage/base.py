@@ -0,0 +1,416 @@
+"""
+Storage backend interface for ChoirLoop
+"""
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, ContextManager, List, Optional, Dict, Any, Set
+from uuid import UUID, uuid4
+
+from app.json_patch import JsonPatchError, apply_patch
+from app.models import Song, SongCreate, SongUpdate, SongSummary, PracticeSection, Voice
+
+# Song fields a JSON Patch may not change (managed by the server and the uploads)
+READ_ONLY_FIELDS = ("id", "created_at", "updated_at", "midi_file", "midi_sha256", "score_file", "score_sha256")
+
+# Returns an error message for invalid section bounds, None if they are fine
+SectionCheck = Callable[[PracticeSection], Optional[str]]
+
+
+class VersionConflictError(Exception):
+    """Raised when a write was based on an outdated version of a song"""
+
+    def __init__(self, current_version: str):
+        super().__init__(f"Song was modified concurrently (current version {current_version})")
+        self.current_version = current_version
+
+
+class SectionNotFoundError(LookupError):
+    """Raised when a batch refers to a section the song does not have"""
+
+    def __init__(self, section_id: UUID):
+        super().__init__(f"Section {section_id} not found")
+        self.section_id = section_id
+
+
+def version_tag(updated_at: datetime) -> str:
+    """Opaque version of a song, derived from its updated_at timestamp"""
+    return updated_at.strftime("%Y%m%d%H%M%S%f")
+
+
+@dataclass(frozen=True)
+class SongFiles:
+    """File names and content hashes of a song's uploads"""
+    updated_at: datetime
+    midi_file: Optional[str] = None
+    midi_sha256: Optional[str] = None
+    score_file: Optional[str] = None
+    score_sha256: Optional[str] = None
+
+    @classmethod
+    def from_song(cls, song: Song) -> "SongFiles":
+        return cls(
+            updated_at=song.updated_at,
+            midi_file=song.midi_file,
+            midi_sha256=song.midi_sha256,
+            score_file=song.score_file,
+            score_sha256=song.score_sha256
+        )
+
+
+def utc_naive(value: datetime) -> datetime:
+    """A timestamp as naive UTC (older documents may carry an offset)"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def voice_names(voices: List[Voice]) -> List[str]:
+    """Assigned names of all voices, falling back to the MIDI track name"""
+    names: List[str] = []
+    for voice in voices:
+        names.extend(voice.names or ([voice.track_name] if voice.track_name else []))
+    return names
+
+
+def summarize(song: Song) -> SongSummary:
+    """Build the list-view summary for a song"""
+    return SongSummary(
+        id=song.id,
+        title=song.title,
+        description=song.description or "",
+        updated_at=song.updated_at,
+        voice_count=len(song.voices),
+        section_count=len(song.practice_sections),
+        voice_names=voice_names(song.voices)
+    )
+
+
+@dataclass
+class SectionWrite:
+    """Result of a single-section write: the section (None for deletes) and the song's new version"""
+    section: Optional[PracticeSection]
+    version: str
+
+
+@dataclass
+class SongChanges:
+    """Saved song and the sections a batch or patch created, changed or removed"""
+    song: Song
+    created: List[PracticeSection] = field(default_factory=list)
+    updated: List[PracticeSection] = field(default_factory=list)
+    deleted: List[UUID] = field(default_factory=list)
+    voices_changed: bool = False
+
+
+def _check_section(section: PracticeSection, check: Optional[SectionCheck]):
+    error = check(section) if check else None
+    if error:
+        raise ValueError(error)
+
+
+@dataclass(frozen=True)
+class SongPage:
+    """One page of a filtered, sorted song listing"""
+    songs: List[SongSummary]
+    total: int
+    next_cursor: Optional[str] = None
+
+
+class StorageBackend(ABC):
+    """
+    Persistence for songs, voices and practice sections.
+
+    Backends only have to implement the song-level primitives. The
+    higher-level operations are expressed as load/modify/save and can be
+    overridden when a backend can do them more cheaply.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def ensure_directories(self):
+        """Prepare the backend (directories, schema, ...)"""
+
+    @abstractmethod
+    def load_song(self, song_id: UUID) -> Optional[Song]:
+        """Load a song, or None if it does not exist"""
+
+    @abstractmethod
+    def save_song(self, song: Song):
+        """Create or replace a song"""
+
+    def save_songs(self, songs: List[Song]):
+        """Create or replace several songs (backends may batch the index update)"""
+        for song in songs:
+            self.save_song(song)
+
+    @abstractmethod
+    def delete_song(self, song_id: UUID) -> bool:
+        """Delete a song, returning False if it does not exist"""
+
+    @abstractmethod
+    def list_songs(self) -> List[SongSummary]:
+        """List summaries of all songs"""
+
+    def catalog_version(self) -> Any:
+        """
+        Cheap token that changes whenever a song is added, changed or
+        removed (used to keep the search index current)
+        """
+        songs = self.list_songs()
+        return len(songs), max((utc_naive(song.updated_at) for song in songs), default=None)
+
+    def song_ids(self) -> Set[str]:
+        """IDs of all songs"""
+        return {str(song.id) for song in self.list_songs()}
+
+    def summaries_since(self, updated_at: datetime) -> List[SongSummary]:
+        """Summaries of the songs changed at or after a (naive UTC) time"""
+        return [song for song in self.list_songs() if utc_naive(song.updated_at) >= updated_at]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Cache statistics, if the backend keeps a cache"""
+        return {}
+
+    def song_lock(self, song_id: UUID) -> ContextManager:
+        """Serialize read-modify-write cycles on one song"""
+        return nullcontext()
+
+    def song_version(self, song_id: UUID) -> Optional[str]:
+        """Current version tag of a song, or None if it does not exist"""
+        song = self.load_song(song_id)
+        return version_tag(song.updated_at) if song else None
+
+    def song_files(self, song_id: UUID) -> Optional[SongFiles]:
+        """Upload metadata of a song (used to answer conditional file requests)"""
+        song = self.load_song(song_id)
+        return SongFiles.from_song(song) if song else None
+
+    def modify_song(
+        self,
+        song_id: UUID,
+        mutate: Callable[[Song], Optional[bool]],
+        expected_version: Optional[str] = None
+    ) -> Optional[Song]:
+        """
+        Load, change and save a song while holding its lock.
+
+        mutate may return False to leave the song untouched, in which case
+        None is returned. If expected_version is given and does not match
+        the stored song, VersionConflictError is raised.
+        """
+        with self.song_lock(song_id):
+            song = self.load_song(song_id)
+            if not song:
+                return None
+
+            current_version = version_tag(song.updated_at)
+            if expected_version is not None and expected_version != current_version:
+                raise VersionConflictError(current_version)
+
+            if mutate(song) is False:
+                return None
+
+            song.updated_at = datetime.utcnow()
+            self.save_song(song)
+            return song
+
+    def create_song(self, song_data: SongCreate) -> Song:
+        """Create a new song"""
+        song = Song(
+            id=uuid4(),
+            title=song_data.title,
+            description=song_data.description or "",
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        )
+
+        self.save_song(song)
+        return song
+
+    def update_song(
+        self,
+        song_id: UUID,
+        update_data: SongUpdate,
+        expected_version: Optional[str] = None
+    ) -> Optional[Song]:
+        """Update an existing song"""
+        def apply(song: Song):
+            if update_data.title is not None:
+                song.title = update_data.title
+            if update_data.description is not None:
+                song.description = update_data.description
+            if update_data.voices is not None:
+                song.voices = update_data.voices
+
+        return self.modify_song(song_id, apply, expected_version)
+
+    def add_practice_section(
+        self,
+        song_id: UUID,
+        section_data: Dict[str, Any],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SectionWrite]:
+        """Add a practice section to a song (ValueError if it fails check, run under the lock)"""
+        section = PracticeSection(**section_data)
+
+        def apply(song: Song):
+            _check_section(section, check)
+            song.practice_sections.append(section)
+
+        song = self.modify_song(song_id, apply, expected_version)
+        if not song:
+            return None
+        return SectionWrite(section, version_tag(song.updated_at))
+
+    def update_practice_section(
+        self,
+        song_id: UUID,
+        section_id: UUID,
+        update_data: Dict[str, Any],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SectionWrite]:
+        """Update a practice section (ValueError if the result fails check, run under the lock)"""
+        updated = []
+
+        def apply(song: Song):
+            # Find section
+            section = next((s for s in song.practice_sections if s.id == section_id), None)
+            if not section:
+                return False
+
+            # Update fields
+            for key, value in update_data.items():
+                if value is not None and hasattr(section, key):
+                    setattr(section, key, value)
+            _check_section(section, check)
+            updated.append(section)
+
+        song = self.modify_song(song_id, apply, expected_version)
+        if not song:
+            return None
+        return SectionWrite(updated[0], version_tag(song.updated_at))
+
+    def delete_practice_section(
+        self,
+        song_id: UUID,
+        section_id: UUID,
+        expected_version: Optional[str] = None
+    ) -> Optional[SectionWrite]:
+        """Delete a practice section (None if the song or section does not exist)"""
+        def apply(song: Song):
+            original_count = len(song.practice_sections)
+            song.practice_sections = [s for s in song.practice_sections if s.id != section_id]
+            if len(song.practice_sections) == original_count:
+                return False  # Section not found
+
+        song = self.modify_song(song_id, apply, expected_version)
+        if not song:
+            return None
+        return SectionWrite(None, version_tag(song.updated_at))
+
+    def apply_section_operations(
+        self,
+        song_id: UUID,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SongChanges]:
+        """
+        Create, update and delete several sections in one load/save.
+
+        Operations are applied in order: {"op": "create", "section": {...}},
+        {"op": "update", "id": ..., "changes": {...}} (None values are left
+        unchanged) and {"op": "delete", "id": ...}. Created and updated
+        sections are passed to check. If an operation refers to a missing
+        section (SectionNotFoundError) or fails the check (ValueError),
+        nothing is saved.
+        """
+        changes: List[SongChanges] = []
+
+        def apply(song: Song):
+            sections = {section.id: section for section in song.practice_sections}
+            created: Dict[UUID, PracticeSection] = {}
+            updated: Dict[UUID, PracticeSection] = {}
+            deleted: List[UUID] = []
+            for operation in operations:
+                if operation["op"] == "create":
+                    section = PracticeSection(**operation["section"])
+                    _check_section(section, check)
+                    sections[section.id] = created[section.id] = section
+                    continue
+
+                section = sections.get(operation["id"])
+                if section is None:
+                    raise SectionNotFoundError(operation["id"])
+                if operation["op"] == "update":
+                    for key, value in operation.get("changes", {}).items():
+                        if value is not None and hasattr(section, key):
+                            setattr(section, key, value)
+                    _check_section(section, check)
+                    if section.id not in created:
+                        updated[section.id] = section
+                else:
+                    del sections[section.id]
+                    updated.pop(section.id, None)
+                    if created.pop(section.id, None) is None:
+                        deleted.append(section.id)
+
+            # Existing sections keep their order, new ones are appended
+            song.practice_sections = list(sections.values())
+            changes.append(SongChanges(
+                song=song, created=list(created.values()), updated=list(updated.values()), deleted=deleted
+            ))
+
+        if not self.modify_song(song_id, apply, expected_version):
+            return None
+        return changes[0]
+
+    def patch_song(
+        self,
+        song_id: UUID,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SongChanges]:
+        """
+        Apply JSON Patch operations to a song document in one load/save.
+
+        Raises JsonPatchError (or JsonPatchTestFailed) if the patch cannot
+        be applied, ValueError if the result is not a valid song, changes a
+        read-only field or has a section failing check. Nothing is saved in
+        that case.
+        """
+        changes: List[SongChanges] = []
+
+        def apply(song: Song):
+            patched = Song.model_validate(apply_patch(song.model_dump(mode="json"), operations))
+            for name in READ_ONLY_FIELDS:
+                if getattr(patched, name) != getattr(song, name):
+                    raise JsonPatchError(f"{name} cannot be changed")
+
+            result = SongChanges(song=song, voices_changed=patched.voices != song.voices)
+            before = {section.id: section for section in song.practice_sections}
+            for section in patched.practice_sections:
+                if section.id not in before:
+                    _check_section(section, check)
+                    result.created.append(section)
+                elif section != before[section.id]:
+                    _check_section(section, check)
+                    result.updated.append(section)
+            after = {section.id for section in patched.practice_sections}
+            if len(after) != len(patched.practice_sections):
+                raise ValueError("Section IDs must be unique")
+            result.deleted = [section_id for section_id in before if section_id not in after]
+
+            for name in Song.model_fields:
+                setattr(song, name, getattr(patched, name))
+            changes.append(result)
+
+        if not self.modify_song(song_id, apply, expected_version):
+            return None
+        return changes[0]
@@ -0,0 +1,188 @@
+"""
+Content-addressed store for uploaded MIDI and score files
+
+Every distinct upload is kept once under DATA_DIR/blobs, keyed by its
+SHA-256:
+
+    blobs/<first 2 hex digits>/<sha256>/data            the file itself
+    blobs/<first 2 hex digits>/<sha256>/song.analysis   derived artifacts,
+    blobs/<first 2 hex digits>/<sha256>/score_cache/    shared by all copies
+
+Song directories keep their song.mid / score.* (every reader still opens
+those paths), but as hard links to the blob, so duplicate uploads take no
+extra disk space. The link count of the blob file is its reference count:
+it is maintained by the filesystem, survives crashes and is shared by all
+processes. A blob whose file has no other link is unreferenced and removed
+by release() or collect().
+
+On filesystems without hard links files are copied instead; duplicates
+then still skip processing, but take their own space.
+"""
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+from uuid import uuid4
+
+from app.metrics import record_cache
+from app.storage.locking import file_lock
+
+BLOB_FILENAME = "data"
+
+
+def _link_or_copy(source: Path, destination: Path):
+    """Atomically make destination a hard link to source (a copy if linking is not possible)"""
+    try:
+        if destination.exists() and os.path.samefile(source, destination):
+            return
+    except FileNotFoundError:
+        pass
+    tmp = destination.with_name(f".{destination.name}.{uuid4().hex}.tmp")
+    try:
+        try:
+            os.link(source, tmp)
+        except OSError:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, destination)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _link_tree(source: Path, destination: Path):
+    """Replace the directory destination with a tree of links to the files of source"""
+    tmp = destination.with_name(f".{destination.name}-{uuid4().hex}")
+    try:
+        shutil.copytree(source, tmp, copy_function=lambda src, dst: _link_or_copy(Path(src), Path(dst)))
+        shutil.rmtree(destination, ignore_errors=True)
+        os.rename(tmp, destination)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+class BlobStore:
+    """SHA-256 keyed file store with link-count reference counting"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.lock_dir = self.directory / ".locks"
+        self.stored = 0
+        self.deduplicated = 0
+        self.released = 0
+
+    @contextmanager
+    def _lock(self, sha256: str) -> Iterator[None]:
+        # One lock per hash prefix keeps the number of lock files bounded
+        with file_lock(self.lock_dir / f"{sha256[:2]}.lock"):
+            yield
+
+    def blob_dir(self, sha256: str) -> Path:
+        """Directory of a blob and its derived artifacts"""
+        if len(sha256) != 64 or not all(c in "0123456789abcdef" for c in sha256):
+            raise ValueError(f"Invalid SHA-256: {sha256!r}")
+        return self.directory / sha256[:2] / sha256
+
+    def path(self, sha256: str) -> Path:
+        """Path of the stored file"""
+        return self.blob_dir(sha256) / BLOB_FILENAME
+
+    def contains(self, sha256: str) -> bool:
+        """True if the content is stored"""
+        return self.path(sha256).exists()
+
+    def refcount(self, sha256: str) -> int:
+        """Number of song files linked to a blob"""
+        try:
+            return self.path(sha256).stat().st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def store(self, source: Path, sha256: str, destination: Path) -> bool:
+        """
+        Put a file into the store and link it at destination.
+
+        source (e.g. a staged upload) is consumed; it may be destination
+        itself to adopt a file already in place. Returns True if the content
+        was stored before, i.e. the upload is a duplicate.
+        """
+        data = self.path(sha256)
+        with self._lock(sha256):
+            existed = data.exists()
+            if not existed:
+                data.parent.mkdir(parents=True, exist_ok=True)
+                _link_or_copy(source, data)
+            _link_or_copy(data, destination)
+            if source != destination:
+                source.unlink(missing_ok=True)
+        if existed:
+            self.deduplicated += 1
+        else:
+            self.stored += 1
+        record_cache("blob", existed)
+        return existed
+
+    def fetch(self, sha256: str, name: str, destination: Path) -> bool:
+        """Link a derived artifact (file or directory) of a blob to destination, False if it has none"""
+        source = self.blob_dir(sha256) / name
+        with self._lock(sha256):
+            if source.is_dir():
+                _link_tree(source, destination)
+            elif source.is_file():
+                _link_or_copy(source, destination)
+            else:
+                return False
+        return True
+
+    def keep(self, sha256: str, name: str, source: Path, ignore: Optional[Callable] = None):
+        """Add a derived artifact built for a song to its blob (if the blob is stored and lacks it)"""
+        target = self.blob_dir(sha256) / name
+        with self._lock(sha256):
+            if not self.path(sha256).exists() or target.exists() or not source.exists():
+                return
+            if source.is_dir():
+                tmp = target.with_name(f".{name}-{uuid4().hex}")
+                try:
+                    shutil.copytree(
+                        source, tmp, ignore=ignore,
+                        copy_function=lambda src, dst: _link_or_copy(Path(src), Path(dst))
+                    )
+                    os.rename(tmp, target)
+                finally:
+                    shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                _link_or_copy(source, target)
+
+    def release(self, sha256: str) -> bool:
+        """Remove a blob and its artifacts if no song file links to it any more"""
+        data = self.path(sha256)
+        with self._lock(sha256):
+            try:
+                if data.stat().st_nlink > 1:
+                    return False
+            except FileNotFoundError:
+                pass
+            if not data.parent.exists():
+                return False
+            shutil.rmtree(data.parent, ignore_errors=True)
+            try:
+                data.parent.parent.rmdir()
+            except OSError:
+                pass
+        self.released += 1
+        return True
+
+    def collect(self) -> int:
+        """Garbage-collect every unreferenced blob (e.g. left behind by a crash); returns the count"""
+        removed = 0
+        for prefix in self.directory.glob("[0-9a-f][0-9a-f]"):
+            for blob in prefix.iterdir():
+                if len(blob.name) == 64 and self.release(blob.name):
+                    removed += 1
+        if removed:
+            print(f"[BlobStore] Removed {removed} unreferenced blobs")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Store and dedup counters of this process"""
+        return {"stored": self.stored, "deduplicated": self.deduplicated, "released": self.released}
@@ -0,0 +1,305 @@
+"""
+File-based JSON storage backend for ChoirLoop
+
+Layout (compatible with the Laravel backend):
+
+    DATA_DIR/index.json              summary index
+    DATA_DIR/songs/<id>/config.json  full song document
+    DATA_DIR/locks/                  flock files (one per song, one for the index)
+
+Both files are replaced atomically and every read-modify-write cycle runs
+under the song lock (and the index lock for index.json), so several
+workers can share one data directory.
+"""
+import json
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import ContextManager, List, Optional, Dict, Any, Tuple
+from uuid import UUID
+
+from pydantic_core import to_json
+
+from app.config import STORAGE_PRETTY_JSON
+from app.models import Song, SongSummary
+from app.storage.base import SongFiles, StorageBackend, summarize, version_tag
+from app.storage.locking import atomic_write_bytes, atomic_write_text, file_lock
+
+# Fields every entry of a summary-format index.json carries
+SUMMARY_FIELDS = set(SongSummary.model_fields)
+
+
+@dataclass
+class CatalogEntry:
+    """Parsed config.json together with its bytes and the file state it was read from"""
+    mtime_ns: int
+    size: int
+    song: Song
+    data: bytes
+
+
+class SongCatalogCache:
+    """
+    Process-wide cache of parsed songs and the summary index.
+
+    Entries are revalidated against the st_mtime_ns and st_size of the
+    backing config.json / index.json, so edits made by other processes (or
+    by hand) are picked up on the next read. Writes through StorageService
+    refresh the affected entry directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._index: Optional[Tuple[int, int, List[SongSummary]]] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, song_id: str, stat: os.stat_result) -> Optional[CatalogEntry]:
+        """Return the cached entry if it still matches the file on disk"""
+        with self._lock:
+            entry = self._entries.get(song_id)
+            if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, song_id: str, stat: os.stat_result, data: bytes) -> CatalogEntry:
+        """Parse and store the config.json bytes read or written for the given file state"""
+        entry = CatalogEntry(mtime_ns=stat.st_mtime_ns, size=stat.st_size, song=Song.model_validate_json(data), data=data)
+        with self._lock:
+            self._entries[song_id] = entry
+        return entry
+
+    def discard(self, song_id: str):
+        """Drop a song from the cache"""
+        with self._lock:
+            self._entries.pop(song_id, None)
+
+    def get_index(self, stat: os.stat_result) -> Optional[List[SongSummary]]:
+        """Return the cached summary index if index.json is unchanged"""
+        with self._lock:
+            if self._index and self._index[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.hits += 1
+                return list(self._index[2])
+            self.misses += 1
+            return None
+
+    def put_index(self, stat: os.stat_result, summaries: List[SongSummary]):
+        """Store the parsed summary index for the given file state"""
+        with self._lock:
+            self._index = (stat.st_mtime_ns, stat.st_size, list(summaries))
+
+    def clear(self):
+        """Drop all cached entries and reset counters"""
+        with self._lock:
+            self._entries.clear()
+            self._index = None
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class JsonStorageBackend(StorageBackend):
+    """Store each song as songs/<id>/config.json plus a summary index.json"""
+
+    name = "json"
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+        self.songs_dir = self.data_dir / "songs"
+        self.index_file = self.data_dir / "index.json"
+        self.lock_dir = self.data_dir / "locks"
+        self.cache = SongCatalogCache()
+
+    def ensure_directories(self):
+        """Ensure required directories exist"""
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.songs_dir.mkdir(exist_ok=True)
+        self.lock_dir.mkdir(exist_ok=True)
+        with self.index_lock():
+            if not self.index_file.exists():
+                atomic_write_text(self.index_file, "[]")
+
+    def song_lock(self, song_id: UUID) -> ContextManager:
+        """Exclusive lock for one song's config.json"""
+        return file_lock(self.lock_dir / f"{song_id}.lock")
+
+    def index_lock(self) -> ContextManager:
+        """Exclusive lock for index.json"""
+        return file_lock(self.lock_dir / "index.lock")
+
+    def get_config_file(self, song_id: UUID) -> Path:
+        """Get config.json path for a song"""
+        return self.songs_dir / str(song_id) / "config.json"
+
+    def load_summaries(self) -> List[SongSummary]:
+        """
+        Load the summary index.
+
+        Older indexes (plain list of IDs, or Laravel-style objects that only
+        carry an 'id') are migrated by reading each config.json once and
+        rewriting index.json in the summary format.
+        """
+        try:
+            stat = self.index_file.stat()
+        except FileNotFoundError:
+            return []
+
+        cached = self.cache.get_index(stat)
+        if cached is not None:
+            return cached
+
+        data = json.loads(self.index_file.read_text())
+
+        if all(isinstance(entry, dict) and set(entry) >= SUMMARY_FIELDS for entry in data):
+            summaries = [SongSummary(**entry) for entry in data]
+            self.cache.put_index(stat, summaries)
+            return summaries
+
+        # Legacy index: plain IDs or Laravel format (array of objects with 'id' field)
+        with self.index_lock():
+            summaries = []
+            for song_id_str in self.load_index(data):
+                try:
+                    song = self.load_song(UUID(song_id_str))
+                    if song:
+                        summaries.append(summarize(song))
+                except Exception as e:
+                    print(f"Error loading song {song_id_str}: {e}")
+                    continue
+
+            self.save_index(summaries)
+        return summaries
+
+    def load_index(self, data: Optional[List[Any]] = None) -> List[str]:
+        """Load song IDs from the index - compatible with Laravel format"""
+        if data is None:
+            return [str(summary.id) for summary in self.load_summaries()]
+        return [entry['id'] if isinstance(entry, dict) else entry for entry in data]
+
+    def save_index(self, summaries: List[SongSummary]):
+        """Save summary index"""
+        atomic_write_bytes(self.index_file, to_json(summaries, indent=2 if STORAGE_PRETTY_JSON else None))
+        self.cache.put_index(self.index_file.stat(), summaries)
+
+    def _load_entry(self, song_id: UUID) -> Optional[CatalogEntry]:
+        """Load the catalog entry for a song, parsing config.json only when it changed"""
+        config_file = self.get_config_file(song_id)
+        song_id_str = str(song_id)
+        try:
+            stat = config_file.stat()
+        except FileNotFoundError:
+            self.cache.discard(song_id_str)
+            return None
+
+        entry = self.cache.get(song_id_str, stat)
+        if entry:
+            return entry
+
+        return self.cache.put(song_id_str, stat, config_file.read_bytes())
+
+    def load_song(self, song_id: UUID) -> Optional[Song]:
+        """Load song from storage"""
+        entry = self._load_entry(song_id)
+        if not entry:
+            return None
+
+        # Callers mutate the returned song, so never hand out the cached instance
+        # (parsing the cached bytes is several times faster than a deep copy)
+        return Song.model_validate_json(entry.data)
+
+    def song_version(self, song_id: UUID) -> Optional[str]:
+        """Current version tag, served from the catalog cache"""
+        entry = self._load_entry(song_id)
+        return version_tag(entry.song.updated_at) if entry else None
+
+    def song_files(self, song_id: UUID) -> Optional[SongFiles]:
+        """Upload metadata, served from the catalog cache"""
+        entry = self._load_entry(song_id)
+        return SongFiles.from_song(entry.song) if entry else None
+
+    def _write_config(self, song: Song):
+        """Write config.json (the caller holds the song lock)"""
+        config_file = self.get_config_file(song.id)
+        config_file.parent.mkdir(parents=True, exist_ok=True)
+        data = song.model_dump_json(indent=2 if STORAGE_PRETTY_JSON else None).encode()
+        atomic_write_bytes(config_file, data)
+        self.cache.put(str(song.id), config_file.stat(), data)
+
+    def _update_index(self, songs: List[Song]):
+        """Replace or append the summaries of songs in index.json"""
+        with self.index_lock():
+            summaries = self.load_summaries()
+            positions = {summary.id: i for i, summary in enumerate(summaries)}
+            for song in songs:
+                summary = summarize(song)
+                if song.id in positions:
+                    summaries[positions[song.id]] = summary
+                else:
+                    positions[song.id] = len(summaries)
+                    summaries.append(summary)
+            self.save_index(summaries)
+
+    def save_song(self, song: Song):
+        """Save song to storage"""
+        with self.song_lock(song.id):
+            self._write_config(song)
+            # Update index (lock order is always song, then index)
+            self._update_index([song])
+
+    def save_songs(self, songs: List[Song]):
+        """Save several songs, rewriting index.json only once"""
+        for song in songs:
+            with self.song_lock(song.id):
+                self._write_config(song)
+        self._update_index(songs)
+
+    def delete_song(self, song_id: UUID) -> bool:
+        """Delete song and all its files"""
+        song_dir = self.songs_dir / str(song_id)
+        with self.song_lock(song_id):
+            if not song_dir.exists():
+                return False
+
+            # Remove directory and all contents
+            shutil.rmtree(song_dir)
+            self.cache.discard(str(song_id))
+
+            # Update index
+            with self.index_lock():
+                summaries = self.load_summaries()
+                remaining = [summary for summary in summaries if summary.id != song_id]
+                if len(remaining) != len(summaries):
+                    self.save_index(remaining)
+
+        return True
+
+    def list_songs(self) -> List[SongSummary]:
+        """List all songs from the summary index"""
+        return self.load_summaries()
+
+    def catalog_version(self) -> Any:
+        """index.json changes with every write, so its file state is the version"""
+        try:
+            stat = self.index_file.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Catalog cache statistics"""
+        return self.cache.stats()
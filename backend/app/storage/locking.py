@@ -0,0 +1,70 @@
+"""
+Atomic file writes and cross-process locks for the storage backends
+"""
+import fcntl
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Union
+
+_held = threading.local()
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """
+    Write a file so readers see either the old or the new content.
+
+    The data goes to a temporary file in the same directory, is fsynced and
+    then renamed over the target with os.replace.
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def atomic_write_text(path: Path, text: str):
+    """Text variant of atomic_write_bytes (UTF-8)"""
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+@contextmanager
+def file_lock(path: Union[str, Path]) -> Iterator[None]:
+    """
+    Hold an exclusive flock on a lock file.
+
+    flock locks are per open file, so this serializes threads as well as
+    processes (e.g. several uvicorn workers). Re-entering the same lock from
+    the thread that already holds it is a no-op, so a locked operation can
+    call other locked operations on the same resource.
+    """
+    path = Path(path)
+    key = str(path)
+    held = getattr(_held, "paths", None)
+    if held is None:
+        held = _held.paths = set()
+    if key in held:
+        yield
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
@@ -0,0 +1,66 @@
+"""
+One-shot import of a JSON data tree into the SQLite backend
+
+Usage:
+    python -m app.storage.migrate [--data-dir ../data] [--database ../data/choirloop.db]
+
+Songs are imported in index.json order, followed by any song directories
+that are missing from the index. Existing rows with the same ID are
+replaced, so the command can be re-run safely. MIDI and score files are
+left where they are; the SQLite backend reads them from the same songs/
+directory.
+"""
+import argparse
+import sys
+from pathlib import Path
+from uuid import UUID
+
+from app.config import DATA_DIR, SQLITE_PATH
+from app.storage.json_backend import JsonStorageBackend
+from app.storage.sqlite_backend import SqliteStorageBackend
+
+
+def migrate(data_dir: Path, database: Path) -> int:
+    """Copy every song under data_dir into the database, returning the count"""
+    source = JsonStorageBackend(data_dir)
+    target = SqliteStorageBackend(database, source.songs_dir)
+    target.ensure_directories()
+
+    song_ids = source.load_index()
+    if source.songs_dir.exists():
+        known = set(song_ids)
+        song_ids += sorted(
+            path.parent.name for path in source.songs_dir.glob("*/config.json")
+            if path.parent.name not in known
+        )
+
+    imported = 0
+    for song_id_str in song_ids:
+        try:
+            song = source.load_song(UUID(song_id_str))
+        except Exception as e:
+            print(f"Skipping song {song_id_str}: {e}")
+            continue
+        if not song:
+            print(f"Skipping song {song_id_str}: config.json not found")
+            continue
+        target.save_song(song)
+        imported += 1
+
+    return imported
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import a ChoirLoop data/ tree into SQLite")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="Data directory to import")
+    parser.add_argument("--database", type=Path, default=None, help="SQLite database file to write")
+    args = parser.parse_args(argv)
+
+    database = args.database or (args.data_dir / SQLITE_PATH.name)
+    imported = migrate(args.data_dir, database)
+    print(f"Imported {imported} songs into {database}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+In-memory search index and keyset pagination over the song catalog
+
+The index maps every word of a song's title, description and voice names
+to the songs containing it; query words match as prefixes, so it can
+answer a search box as the user types. Songs are also kept in one sorted
+list per sort order, which makes a page a binary search plus a scan of
+(roughly) the page size.
+
+The index follows the backend's catalog_version(): when it changes after
+a save or delete, only the songs updated since the last sync are fetched
+(summaries_since) and re-indexed, and removed songs are dropped by
+comparing IDs. This also picks up writes made by other worker processes.
+"""
+import base64
+import json
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.models import SongSummary
+from app.storage.base import SongPage, StorageBackend, utc_naive
+
+SORT_FIELDS = ("updated_at", "title")
+DEFAULT_ORDER = {"updated_at": "desc", "title": "asc"}
+
+_WORD = re.compile(r"\w+")
+
+# (sort key, song ID) entries of a sorted list
+SortEntry = Tuple[Any, str]
+
+_UNSYNCED = object()
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case words of a text with accents removed ("Ave María" -> ["ave", "maria"])"""
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return _WORD.findall(folded)
+
+
+def _sort_key(summary: SongSummary, sort: str) -> Any:
+    return summary.title.casefold() if sort == "title" else utc_naive(summary.updated_at)
+
+
+def encode_cursor(sort: str, order: str, key: Any, song_id: str) -> str:
+    """Opaque cursor pointing just after a song in a sort order"""
+    value = key.isoformat() if isinstance(key, datetime) else key
+    raw = json.dumps([sort, order, value, song_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> SortEntry:
+    """Position encoded in a cursor; ValueError if it is malformed or for another order"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, cursor_order, value, song_id = json.loads(raw)
+        key = datetime.fromisoformat(value) if cursor_sort == "updated_at" else str(value)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise ValueError("Cursor belongs to a different sort order")
+    return key, str(song_id)
+
+
+class SongSearchIndex:
+    """Inverted index and sorted views of the song summaries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend: Optional[StorageBackend] = None
+        self.syncs = 0
+        self.reindexed = 0
+        self._reset()
+
+    def _reset(self):
+        self._version: Any = _UNSYNCED
+        # Newest updated_at in the index; later syncs only fetch songs changed since
+        self._latest: Optional[datetime] = None
+        self._songs: Dict[str, SongSummary] = {}
+        self._tokens: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        # Sorted vocabulary, for prefix lookups
+        self._words: List[str] = []
+        self._sorted: Dict[str, List[SortEntry]] = {sort: [] for sort in SORT_FIELDS}
+
+    def search(
+        self,
+        backend: StorageBackend,
+        query: Optional[str] = None,
+        sort: str = "updated_at",
+        order: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> SongPage:
+        """
+        One page of the songs matching every word of query (as prefixes),
+        in the given order. Raises ValueError for unknown sort orders and
+        invalid cursors.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort field: {sort}")
+        order = order or DEFAULT_ORDER[sort]
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unknown sort order: {order}")
+        after = decode_cursor(cursor, sort, order) if cursor else None
+
+        with self._lock:
+            self._sync(backend)
+            matches = self._match(tokenize(query)) if query and query.strip() else None
+            entries = self._sorted[sort]
+            if order == "asc":
+                start = bisect_right(entries, after) if after else 0
+                candidates: Iterable[SortEntry] = (entries[i] for i in range(start, len(entries)))
+            else:
+                end = bisect_left(entries, after) if after else len(entries)
+                candidates = (entries[i] for i in range(end - 1, -1, -1))
+
+            page: List[SortEntry] = []
+            for entry in candidates:
+                if matches is None or entry[1] in matches:
+                    page.append(entry)
+                    if len(page) > limit:
+                        break
+            total = len(self._songs) if matches is None else len(matches)
+            songs = [self._songs[song_id] for _, song_id in page[:limit]]
+
+        next_cursor = None
+        if len(page) > limit:
+            key, song_id = page[limit - 1]
+            next_cursor = encode_cursor(sort, order, key, song_id)
+        return SongPage(songs=songs, total=total, next_cursor=next_cursor)
+
+    def stats(self) -> Dict[str, Any]:
+        """Index size and maintenance counters for monitoring"""
+        with self._lock:
+            return {
+                "songs": len(self._songs),
+                "words": len(self._words),
+                "syncs": self.syncs,
+                "reindexed": self.reindexed
+            }
+
+    def _sync(self, backend: StorageBackend):
+        """Bring the index up to date with the backend's catalog"""
+        if backend is not self._backend:
+            self._reset()
+            self._backend = backend
+        version = backend.catalog_version()
+        if version == self._version:
+            return
+
+        if self._latest is None:
+            changed = backend.list_songs()
+        else:
+            ids = backend.song_ids()
+            for song_id in [song_id for song_id in self._songs if song_id not in ids]:
+                self._remove(song_id)
+            if ids - self._songs.keys() and len(ids) > len(self._songs):
+                # New songs with old timestamps (e.g. imported): compare everything
+                changed = backend.list_songs()
+            else:
+                changed = backend.summaries_since(self._latest)
+
+        for summary in changed:
+            song_id = str(summary.id)
+            indexed = self._songs.get(song_id)
+            # Every write bumps updated_at
+            if indexed is None or indexed.updated_at != summary.updated_at:
+                if indexed is not None:
+                    self._remove(song_id)
+                self._add(song_id, summary)
+        self._version = version
+        self.syncs += 1
+
+    def _add(self, song_id: str, summary: SongSummary):
+        self._songs[song_id] = summary
+        updated_at = utc_naive(summary.updated_at)
+        if self._latest is None or updated_at > self._latest:
+            self._latest = updated_at
+        tokens = set(tokenize(" ".join([summary.title, summary.description, *summary.voice_names])))
+        self._tokens[song_id] = tokens
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = set()
+                insort(self._words, token)
+            posting.add(song_id)
+        for sort in SORT_FIELDS:
+            insort(self._sorted[sort], (_sort_key(summary, sort), song_id))
+        self.reindexed += 1
+
+    def _remove(self, song_id: str):
+        summary = self._songs.pop(song_id)
+        for token in self._tokens.pop(song_id):
+            posting = self._postings[token]
+            posting.discard(song_id)
+            if not posting:
+                del self._postings[token]
+                del self._words[bisect_left(self._words, token)]
+        for sort in SORT_FIELDS:
+            entries = self._sorted[sort]
+            del entries[bisect_left(entries, (_sort_key(summary, sort), song_id))]
+
+    def _match(self, words: List[str]) -> Set[str]:
+        """Songs containing a word starting with each of the query words"""
+        result: Optional[Set[str]] = None
+        for word in sorted(set(words), key=len, reverse=True):
+            found: Set[str] = set()
+            i = bisect_left(self._words, word)
+            while i < len(self._words) and self._words[i].startswith(word):
+                found |= self._postings[self._words[i]]
+                i += 1
+            result = found if result is None else result & found
+            if not result:
+                return set()
+        return result if result is not None else set(self._songs)
+
+
+song_search = SongSearchIndex()
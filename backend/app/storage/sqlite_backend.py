@@ -0,0 +1,456 @@
+"""
+SQLite storage backend for ChoirLoop
+
+Songs, voices and practice sections live in their own tables of a single
+database file opened in WAL mode, so readers never block the writer and a
+section edit only touches the section's row (plus the song's updated_at).
+Uploaded MIDI and score files stay in DATA_DIR/songs/<id>/ as before.
+"""
+import json
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import ContextManager, List, Optional, Dict, Any, Set, Tuple
+from uuid import UUID
+
+from app.models import Song, SongSummary, PracticeSection, Voice
+from app.storage.base import (
+    SectionCheck, SectionWrite, SongFiles, StorageBackend, VersionConflictError, _check_section, utc_naive, version_tag
+)
+
+# (column, SQL declaration, stored as JSON) per table. Columns missing from an
+# existing database are added on startup, so new model fields only need an
+# entry here.
+SONG_COLUMNS: List[Tuple[str, str, bool]] = [
+    ("id", "TEXT PRIMARY KEY", False),
+    ("title", "TEXT NOT NULL", False),
+    ("description", "TEXT NOT NULL DEFAULT ''", False),
+    ("midi_file", "TEXT", False),
+    ("midi_sha256", "TEXT", False),
+    ("score_file", "TEXT", False),
+    ("score_sha256", "TEXT", False),
+    ("created_at", "TEXT NOT NULL", False),
+    ("updated_at", "TEXT NOT NULL", False),
+]
+
+VOICE_COLUMNS: List[Tuple[str, str, bool]] = [
+    ("track_number", "INTEGER NOT NULL", False),
+    ("names", "TEXT NOT NULL DEFAULT '[]'", True),
+    ("channel", "INTEGER", False),
+    ("note_count", "INTEGER NOT NULL DEFAULT 0", False),
+    ("track_name", "TEXT", False),
+    ("program", "INTEGER", False),
+]
+
+SECTION_COLUMNS: List[Tuple[str, str, bool]] = [
+    ("id", "TEXT PRIMARY KEY", False),
+    ("label", "TEXT NOT NULL", False),
+    ("start_measure", "INTEGER NOT NULL", False),
+    ("start_beat", "INTEGER NOT NULL", False),
+    ("end_measure", "INTEGER NOT NULL", False),
+    ("end_beat", "INTEGER NOT NULL", False),
+    ("relevant_voices", "TEXT NOT NULL DEFAULT '[]'", True),
+    ("created_at", "TEXT NOT NULL", False),
+]
+
+# Timestamps are stored as naive UTC in one fixed-width format, so comparing
+# the TEXT values (summaries_since, MAX(updated_at)) orders them like the times
+TIMESTAMP_COLUMNS = {"created_at", "updated_at"}
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+TIMESTAMP_LENGTH = len("2000-01-01T00:00:00.000000")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS voices (
+    song_id TEXT NOT NULL REFERENCES songs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    track_number INTEGER NOT NULL,
+    PRIMARY KEY (song_id, position)
+);
+CREATE TABLE IF NOT EXISTS practice_sections (
+    id TEXT PRIMARY KEY,
+    song_id TEXT NOT NULL REFERENCES songs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    start_measure INTEGER NOT NULL,
+    start_beat INTEGER NOT NULL,
+    end_measure INTEGER NOT NULL,
+    end_beat INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_practice_sections_song ON practice_sections(song_id, position);
+CREATE INDEX IF NOT EXISTS idx_songs_updated_at ON songs(updated_at);
+"""
+
+
+def _timestamp(value: Any) -> str:
+    """Column value of a datetime (or ISO 8601 string)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return utc_naive(value).strftime(TIMESTAMP_FORMAT)
+
+
+def _to_row(data: Dict[str, Any], columns: List[Tuple[str, str, bool]]) -> List[Any]:
+    """Convert a model_dump(mode='json') dict into column values"""
+    row = []
+    for name, _, is_json in columns:
+        value = data.get(name)
+        if is_json:
+            value = json.dumps(value, separators=(",", ":"))
+        elif name in TIMESTAMP_COLUMNS and value is not None:
+            value = _timestamp(value)
+        row.append(value)
+    return row
+
+
+def _from_row(row: sqlite3.Row, columns: List[Tuple[str, str, bool]]) -> Dict[str, Any]:
+    """Convert a database row back into model field values"""
+    data = {}
+    for name, _, is_json in columns:
+        value = row[name]
+        data[name] = json.loads(value) if is_json and value is not None else value
+    return data
+
+
+class SqliteStorageBackend(StorageBackend):
+    """Store songs, voices and practice sections in an SQLite database"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: Path, songs_dir: Path):
+        self.db_path = Path(db_path)
+        self.songs_dir = Path(songs_dir)
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, creating it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        if not self._schema_ready:
+            self._create_schema(conn)
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        """
+        Create tables, add any columns introduced since the database was
+        created and normalize timestamps written in other formats.
+
+        The migration runs in a write transaction, so processes starting at
+        the same time take turns and each sees the columns the previous one
+        added.
+        """
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn.executescript(SCHEMA)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table, columns in (
+                    ("songs", SONG_COLUMNS),
+                    ("voices", VOICE_COLUMNS),
+                    ("practice_sections", SECTION_COLUMNS),
+                ):
+                    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+                    for name, declaration, _ in columns:
+                        if name not in existing:
+                            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+                conn.executemany(
+                    "UPDATE songs SET created_at = ?, updated_at = ? WHERE id = ?",
+                    [
+                        (_timestamp(row["created_at"]), _timestamp(row["updated_at"]), row["id"])
+                        for row in conn.execute(
+                            "SELECT id, created_at, updated_at FROM songs "
+                            "WHERE length(created_at) != ? OR length(updated_at) != ?",
+                            (TIMESTAMP_LENGTH, TIMESTAMP_LENGTH)
+                        ).fetchall()
+                    ]
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            self._schema_ready = True
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run statements in a write transaction.
+
+        BEGIN IMMEDIATE takes the database write lock up front, which
+        serializes writers across processes. Nested use joins the outer
+        transaction.
+        """
+        conn = self._connect()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def song_lock(self, song_id: UUID) -> ContextManager:
+        """Read-modify-write cycles run inside one write transaction"""
+        return self._transaction()
+
+    def song_version(self, song_id: UUID) -> Optional[str]:
+        """Current version tag from the songs row"""
+        row = self._connect().execute(
+            "SELECT updated_at FROM songs WHERE id = ?", (str(song_id),)
+        ).fetchone()
+        return version_tag(datetime.fromisoformat(row["updated_at"])) if row else None
+
+    def song_files(self, song_id: UUID) -> Optional[SongFiles]:
+        """Upload metadata from the songs row, without loading voices or sections"""
+        row = self._connect().execute(
+            "SELECT updated_at, midi_file, midi_sha256, score_file, score_sha256 FROM songs WHERE id = ?",
+            (str(song_id),)
+        ).fetchone()
+        if row is None:
+            return None
+        return SongFiles(
+            updated_at=datetime.fromisoformat(row["updated_at"]),
+            midi_file=row["midi_file"],
+            midi_sha256=row["midi_sha256"],
+            score_file=row["score_file"],
+            score_sha256=row["score_sha256"]
+        )
+
+    def _check_version(self, conn: sqlite3.Connection, song_id: UUID, expected_version: Optional[str]) -> bool:
+        """Return False if the song does not exist, raise on a version mismatch"""
+        row = conn.execute("SELECT updated_at FROM songs WHERE id = ?", (str(song_id),)).fetchone()
+        if row is None:
+            return False
+        current_version = version_tag(datetime.fromisoformat(row["updated_at"]))
+        if expected_version is not None and expected_version != current_version:
+            raise VersionConflictError(current_version)
+        return True
+
+    def ensure_directories(self):
+        """Ensure the songs directory and database schema exist"""
+        self.songs_dir.mkdir(parents=True, exist_ok=True)
+        self._connect()
+
+    def _touch_song(self, conn: sqlite3.Connection, song_id: UUID) -> str:
+        """Bump updated_at of a song and return its new version"""
+        now = datetime.utcnow()
+        conn.execute(
+            "UPDATE songs SET updated_at = ? WHERE id = ?",
+            (_timestamp(now), str(song_id))
+        )
+        return version_tag(now)
+
+    def load_song(self, song_id: UUID) -> Optional[Song]:
+        """Load song with its voices and sections"""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM songs WHERE id = ?", (str(song_id),)).fetchone()
+        if row is None:
+            return None
+
+        data = _from_row(row, SONG_COLUMNS)
+        data["voices"] = [
+            Voice(**_from_row(voice, VOICE_COLUMNS))
+            for voice in conn.execute(
+                "SELECT * FROM voices WHERE song_id = ? ORDER BY position", (str(song_id),)
+            )
+        ]
+        data["practice_sections"] = [
+            PracticeSection(**_from_row(section, SECTION_COLUMNS))
+            for section in conn.execute(
+                "SELECT * FROM practice_sections WHERE song_id = ? ORDER BY position", (str(song_id),)
+            )
+        ]
+        return Song(**data)
+
+    def save_song(self, song: Song):
+        """Create or replace a song and all of its voices and sections"""
+        data = song.model_dump(mode='json')
+        names = [name for name, _, _ in SONG_COLUMNS]
+        updates = ", ".join(f"{name} = excluded.{name}" for name in names if name != "id")
+
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT INTO songs ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+                f"ON CONFLICT(id) DO UPDATE SET {updates}",
+                _to_row(data, SONG_COLUMNS)
+            )
+
+            conn.execute("DELETE FROM voices WHERE song_id = ?", (data["id"],))
+            voice_names = ["song_id", "position"] + [name for name, _, _ in VOICE_COLUMNS]
+            conn.executemany(
+                f"INSERT INTO voices ({', '.join(voice_names)}) VALUES ({', '.join('?' * len(voice_names))})",
+                [
+                    [data["id"], position] + _to_row(voice, VOICE_COLUMNS)
+                    for position, voice in enumerate(data["voices"])
+                ]
+            )
+
+            conn.execute("DELETE FROM practice_sections WHERE song_id = ?", (data["id"],))
+            section_names = ["song_id", "position"] + [name for name, _, _ in SECTION_COLUMNS]
+            conn.executemany(
+                f"INSERT INTO practice_sections ({', '.join(section_names)}) "
+                f"VALUES ({', '.join('?' * len(section_names))})",
+                [
+                    [data["id"], position] + _to_row(section, SECTION_COLUMNS)
+                    for position, section in enumerate(data["practice_sections"])
+                ]
+            )
+
+        self.songs_dir.joinpath(data["id"]).mkdir(parents=True, exist_ok=True)
+
+    def save_songs(self, songs: List[Song]):
+        """Save several songs in one transaction"""
+        with self._transaction():
+            for song in songs:
+                self.save_song(song)
+
+    def delete_song(self, song_id: UUID) -> bool:
+        """Delete song rows and its uploaded files"""
+        with self._transaction() as conn:
+            deleted = conn.execute("DELETE FROM songs WHERE id = ?", (str(song_id),)).rowcount > 0
+
+        song_dir = self.songs_dir / str(song_id)
+        if song_dir.exists():
+            shutil.rmtree(song_dir)
+        return deleted
+
+    def list_songs(self) -> List[SongSummary]:
+        """List all songs in creation order"""
+        return self._summaries()
+
+    def _summaries(self, where: str = "", params: Tuple[Any, ...] = ()) -> List[SongSummary]:
+        # Voice names follow base.voice_names: assigned names, else the track name
+        rows = self._connect().execute(
+            f"""
+            SELECT s.id, s.title, s.description, s.updated_at,
+                   (SELECT COUNT(*) FROM voices v WHERE v.song_id = s.id) AS voice_count,
+                   (SELECT COUNT(*) FROM practice_sections p WHERE p.song_id = s.id) AS section_count,
+                   (SELECT group_concat(name, char(31)) FROM (
+                        SELECT n.value AS name FROM voices v, json_each(
+                            CASE WHEN v.names = '[]' AND v.track_name IS NOT NULL
+                                 THEN json_array(v.track_name) ELSE v.names END
+                        ) n
+                        WHERE v.song_id = s.id ORDER BY v.position, n.key
+                   )) AS voice_names
+            FROM songs s {where} ORDER BY s.rowid
+            """,
+            params
+        )
+        return [
+            SongSummary(**{**dict(row), "voice_names": row["voice_names"].split("\x1f") if row["voice_names"] else []})
+            for row in rows
+        ]
+
+    def song_ids(self) -> Set[str]:
+        """IDs of all songs"""
+        return {row[0] for row in self._connect().execute("SELECT id FROM songs")}
+
+    def summaries_since(self, updated_at: datetime) -> List[SongSummary]:
+        """Summaries of the songs changed at or after a time (uses idx_songs_updated_at)"""
+        return self._summaries("WHERE s.updated_at >= ?", (_timestamp(updated_at),))
+
+    def catalog_version(self) -> Any:
+        """Every write bumps a song's updated_at and deletes change the count"""
+        conn = self._connect()
+        # Two queries: together they cannot use the index for MAX
+        count = conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+        return count, conn.execute("SELECT MAX(updated_at) FROM songs").fetchone()[0]
+
+    def add_practice_section(
+        self,
+        song_id: UUID,
+        section_data: Dict[str, Any],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SectionWrite]:
+        """Insert a single section row"""
+        section = PracticeSection(**section_data)
+        names = ["song_id", "position"] + [name for name, _, _ in SECTION_COLUMNS]
+
+        with self._transaction() as conn:
+            if not self._check_version(conn, song_id, expected_version):
+                return None
+            _check_section(section, check)
+            version = self._touch_song(conn, song_id)
+            position = conn.execute(
+                "SELECT COALESCE(MAX(position), -1) + 1 FROM practice_sections WHERE song_id = ?",
+                (str(song_id),)
+            ).fetchone()[0]
+            conn.execute(
+                f"INSERT INTO practice_sections ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                [str(song_id), position] + _to_row(section.model_dump(mode='json'), SECTION_COLUMNS)
+            )
+        return SectionWrite(section, version)
+
+    def update_practice_section(
+        self,
+        song_id: UUID,
+        section_id: UUID,
+        update_data: Dict[str, Any],
+        expected_version: Optional[str] = None,
+        check: Optional[SectionCheck] = None
+    ) -> Optional[SectionWrite]:
+        """Update a single section row"""
+        with self._transaction() as conn:
+            if not self._check_version(conn, song_id, expected_version):
+                return None
+            row = conn.execute(
+                "SELECT * FROM practice_sections WHERE id = ? AND song_id = ?",
+                (str(section_id), str(song_id))
+            ).fetchone()
+            if row is None:
+                return None
+
+            section = PracticeSection(**_from_row(row, SECTION_COLUMNS))
+            for key, value in update_data.items():
+                if value is not None and hasattr(section, key):
+                    setattr(section, key, value)
+            _check_section(section, check)
+
+            names = [name for name, _, _ in SECTION_COLUMNS if name != "id"]
+            data = section.model_dump(mode='json')
+            conn.execute(
+                f"UPDATE practice_sections SET {', '.join(f'{name} = ?' for name in names)} WHERE id = ?",
+                _to_row(data, [c for c in SECTION_COLUMNS if c[0] != "id"]) + [data["id"]]
+            )
+            version = self._touch_song(conn, song_id)
+        return SectionWrite(section, version)
+
+    def delete_practice_section(
+        self,
+        song_id: UUID,
+        section_id: UUID,
+        expected_version: Optional[str] = None
+    ) -> Optional[SectionWrite]:
+        """Delete a single section row"""
+        with self._transaction() as conn:
+            if not self._check_version(conn, song_id, expected_version):
+                return None
+            deleted = conn.execute(
+                "DELETE FROM practice_sections WHERE id = ? AND song_id = ?",
+                (str(section_id), str(song_id))
+            ).rowcount > 0
+            if not deleted:
+                return None
+            return SectionWrite(None, self._touch_song(conn, song_id))
@@ -0,0 +1,420 @@
+"""
+Built-in synthesizer for practice audio
+
+Renders the note arrays of a MIDI analysis straight to PCM with NumPy, so
+practice audio needs neither fluidsynth nor ffmpeg. Every voice is a small
+additive wavetable (a few harmonics with an attack/release envelope) and
+notes are cached per (pitch, length) within NOTE_CACHE_MAX_BYTES, which
+makes repeated notes, the common case in choir parts, almost free. Each track is rendered as its
+own stem and added to the mix with its gain.
+
+Output is 16-bit mono WAV written with the stdlib wave module, or streamed
+chunk by chunk (e.g. measure by measure) while rendering.
+"""
+import struct
+import threading
+import wave
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.midi_analysis import MidiAnalysis, TrackAnalysis
+
+SAMPLE_RATE = 22050
+
+# Bump when the synthesized sound changes so cached stems are not reused
+SYNTH_VERSION = 1
+
+# Note lengths are rounded to this grid so the note cache stays small
+LENGTH_QUANTUM_SECONDS = 0.01
+
+# Memory for cached note waveforms per process (least recently used go first);
+# a bound on the entry count alone would let long notes take gigabytes
+NOTE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+ATTACK_SECONDS = 0.012
+RELEASE_SECONDS = 0.08
+
+# Relative amplitudes of the harmonics of the voice wavetable
+HARMONICS = (1.0, 0.45, 0.22, 0.12, 0.06)
+
+# Count-in click: accented first beat of a measure, shorter decay otherwise
+CLICK_SECONDS = 0.04
+CLICK_ACCENT_HZ = 1500.0
+CLICK_HZ = 1000.0
+CLICK_LEVEL = 0.5
+
+# Peak level of the final mix (about -1 dBFS)
+PEAK_LEVEL = 0.89
+
+
+def _midi_to_hz(pitch: int) -> float:
+    return 440.0 * 2 ** ((pitch - 69) / 12)
+
+
+class _NoteCache:
+    """LRU cache of note waveforms bounded by their total size"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[Tuple[int, int, int], np.ndarray]" = OrderedDict()
+        # Streaming renders synthesize in several threads of the API process
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[int, int, int]) -> Optional[np.ndarray]:
+        with self._lock:
+            samples = self._entries.get(key)
+            if samples is not None:
+                self._entries.move_to_end(key)
+            return samples
+
+    def put(self, key: Tuple[int, int, int], samples: np.ndarray):
+        if samples.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = samples
+            self.bytes += samples.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+_note_cache = _NoteCache(NOTE_CACHE_MAX_BYTES)
+
+
+def note_samples(pitch: int, length: int, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Waveform of one note at full velocity: length samples of tone followed
+    by the release tail. Cached, so the returned array is read-only.
+    """
+    key = (pitch, length, sample_rate)
+    samples = _note_cache.get(key)
+    if samples is None:
+        samples = _synthesize_note(pitch, length, sample_rate)
+        _note_cache.put(key, samples)
+    return samples
+
+
+def _synthesize_note(pitch: int, length: int, sample_rate: int) -> np.ndarray:
+    release = int(RELEASE_SECONDS * sample_rate)
+    total = length + release
+    t = np.arange(total, dtype=np.float32) / sample_rate
+
+    frequency = _midi_to_hz(pitch)
+    wave_data = np.zeros(total, dtype=np.float32)
+    for k, amplitude in enumerate(HARMONICS, start=1):
+        if frequency * k >= sample_rate / 2:
+            break
+        wave_data += amplitude * np.sin(2 * np.pi * frequency * k * t, dtype=np.float32)
+    wave_data /= sum(HARMONICS)
+
+    envelope = np.ones(total, dtype=np.float32)
+    attack = min(int(ATTACK_SECONDS * sample_rate), length)
+    if attack:
+        envelope[:attack] = np.linspace(0, 1, attack, endpoint=False, dtype=np.float32)
+    envelope[length:] = np.linspace(1, 0, release, dtype=np.float32)
+    wave_data *= envelope
+
+    wave_data.setflags(write=False)
+    return wave_data
+
+
+@lru_cache(maxsize=4)
+def _click(accent: bool, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    length = int(CLICK_SECONDS * sample_rate)
+    t = np.arange(length, dtype=np.float32) / sample_rate
+    frequency = CLICK_ACCENT_HZ if accent else CLICK_HZ
+    click = np.sin(2 * np.pi * frequency * t, dtype=np.float32) * np.exp(-t * 90, dtype=np.float32)
+    click *= CLICK_LEVEL
+    click.setflags(write=False)
+    return click
+
+
+def ticks_to_seconds(analysis: MidiAnalysis, ticks: np.ndarray) -> np.ndarray:
+    """Vectorized tick -> seconds conversion through the tempo map"""
+    change_ticks = np.array([tick for tick, _ in analysis.tempo_changes], dtype=np.float64)
+    tempos = np.array([tempo for _, tempo in analysis.tempo_changes], dtype=np.float64)
+    seconds_per_tick = tempos / (1e6 * analysis.ticks_per_beat)
+    change_seconds = np.concatenate(([0.0], np.cumsum(np.diff(change_ticks) * seconds_per_tick[:-1])))
+
+    i = np.maximum(np.searchsorted(change_ticks, ticks, side="right") - 1, 0)
+    return change_seconds[i] + (ticks - change_ticks[i]) * seconds_per_tick[i]
+
+
+def _tempo_at(analysis: MidiAnalysis, tick: int) -> int:
+    tempo = analysis.tempo_changes[0][1]
+    for change_tick, change_tempo in analysis.tempo_changes:
+        if change_tick > tick:
+            break
+        tempo = change_tempo
+    return tempo
+
+
+def _meter_at(analysis: MidiAnalysis, tick: int) -> Tuple[int, int]:
+    meter = analysis.time_signatures[0][1:]
+    for change_tick, numerator, denominator in analysis.time_signatures:
+        if change_tick > tick:
+            break
+        meter = (numerator, denominator)
+    return meter
+
+
+def count_in_clicks(
+    analysis: MidiAnalysis,
+    start_tick: int,
+    measures: int,
+    tempo_scale: float = 1.0,
+    sample_rate: int = SAMPLE_RATE
+) -> np.ndarray:
+    """Click track of `measures` bars in the meter and tempo at start_tick"""
+    numerator, denominator = _meter_at(analysis, start_tick)
+    beat_seconds = _tempo_at(analysis, start_tick) / 1e6 * 4 / denominator / tempo_scale
+    beat_samples = int(round(beat_seconds * sample_rate))
+
+    clicks = np.zeros(beat_samples * numerator * measures, dtype=np.float32)
+    for beat in range(numerator * measures):
+        click = _click(beat % numerator == 0, sample_rate)[:beat_samples]
+        offset = beat * beat_samples
+        clicks[offset:offset + len(click)] += click
+    return clicks
+
+
+def _span(
+    analysis: MidiAnalysis,
+    start_tick: int,
+    end_tick: int,
+    tempo_scale: float,
+    sample_rate: int
+) -> Tuple[float, int]:
+    """Start of the range in seconds and the number of samples it needs"""
+    origin, end = ticks_to_seconds(analysis, np.array([start_tick, end_tick], dtype=np.float64))
+    length = int(np.ceil((end - origin) / tempo_scale * sample_rate)) + int(RELEASE_SECONDS * sample_rate)
+    return origin, max(length, 0)
+
+
+def _note_events(
+    analysis: MidiAnalysis,
+    track: TrackAnalysis,
+    start_tick: int,
+    end_tick: int,
+    clamp_tick: int,
+    origin: float,
+    tempo_scale: float,
+    sample_rate: int
+) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Sample offsets (from origin), lengths, pitches and levels of the notes
+    of a track starting in [start_tick, end_tick), with note ends clamped
+    to clamp_tick. None if there are no such notes.
+    """
+    onsets = np.frombuffer(track.onsets, dtype=np.uint32).astype(np.int64)
+    first, last = np.searchsorted(onsets, [start_tick, end_tick])
+    if first == last:
+        return None
+
+    quantum = max(int(LENGTH_QUANTUM_SECONDS * sample_rate), 1)
+    onsets = onsets[first:last]
+    ends = np.minimum(onsets + np.frombuffer(track.durations, dtype=np.uint32)[first:last], clamp_tick)
+    starts = ((ticks_to_seconds(analysis, onsets) - origin) / tempo_scale * sample_rate).astype(np.int64)
+    stops = ((ticks_to_seconds(analysis, ends) - origin) / tempo_scale * sample_rate).astype(np.int64)
+    lengths = np.maximum((stops - starts + quantum // 2) // quantum, 1) * quantum
+    levels = np.frombuffer(track.velocities, dtype=np.uint8)[first:last].astype(np.float32) / 127
+    pitches = np.frombuffer(track.pitches, dtype=np.uint8)[first:last]
+    return starts, lengths, pitches, levels
+
+
+def _add_notes(
+    out: np.ndarray,
+    offset: int,
+    events: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    sample_rate: int,
+    gain: float = 1.0
+):
+    """Add note events to out, whose first sample is at `offset` from the origin"""
+    starts, lengths, pitches, levels = events
+    for start, note_length, pitch, level in zip(
+        (starts - offset).tolist(), lengths.tolist(), pitches.tolist(), levels.tolist()
+    ):
+        samples = note_samples(pitch, note_length, sample_rate)
+        end = min(start + len(samples), len(out))
+        if end > start:
+            out[start:end] += (gain * level) * samples[:end - start]
+
+
+def render_stem(
+    analysis: MidiAnalysis,
+    track: TrackAnalysis,
+    start_tick: int,
+    end_tick: int,
+    tempo_scale: float = 1.0,
+    sample_rate: int = SAMPLE_RATE,
+    out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Render the notes of one track starting in [start_tick, end_tick) at
+    full gain (velocity only). Pass out to reuse a zeroed buffer.
+    """
+    origin, length = _span(analysis, start_tick, end_tick, tempo_scale, sample_rate)
+    stem = out if out is not None else np.zeros(length, dtype=np.float32)
+
+    events = _note_events(analysis, track, start_tick, end_tick, end_tick, origin, tempo_scale, sample_rate)
+    if events is not None:
+        _add_notes(stem, 0, events, sample_rate)
+    return stem
+
+
+def normalize(samples: np.ndarray, peak_level: float = PEAK_LEVEL) -> np.ndarray:
+    """Scale down so the loudest sample stays below peak_level"""
+    peak = float(np.max(np.abs(samples))) if len(samples) else 0.0
+    if peak > peak_level:
+        samples *= peak_level / peak
+    return samples
+
+
+def synthesize(
+    analysis: MidiAnalysis,
+    start_tick: int,
+    end_tick: int,
+    tracks: Optional[Iterable[int]] = None,
+    gains: Optional[Dict[int, float]] = None,
+    tempo_scale: float = 1.0,
+    count_in: int = 0,
+    sample_rate: int = SAMPLE_RATE,
+    stems: Optional[Callable[[TrackAnalysis], np.ndarray]] = None
+) -> np.ndarray:
+    """
+    Render a range of the song with per-track gains to a mono float32 signal.
+
+    Tracks are rendered one stem at a time into a scratch buffer and added
+    to the mix with their gain, so memory stays at two signal lengths
+    regardless of the number of voices. A stems callable can supply the
+    stem of a track instead (e.g. from a cache); it must return what
+    render_stem would for the same range, tempo and sample rate.
+    """
+    wanted = set(tracks) if tracks else None
+    gains = gains or {}
+    _, length = _span(analysis, start_tick, end_tick, tempo_scale, sample_rate)
+
+    mixed = np.zeros(length, dtype=np.float32)
+    stem = np.empty(length, dtype=np.float32) if stems is None else None
+    for track in analysis.tracks:
+        if not track.note_count or (wanted is not None and track.track_number not in wanted):
+            continue
+        gain = gains.get(track.track_number, 1.0)
+        if gain <= 0:
+            continue
+        if stems is not None:
+            source = stems(track)
+        else:
+            stem.fill(0)
+            source = render_stem(analysis, track, start_tick, end_tick, tempo_scale, sample_rate, out=stem)
+        mixed += np.float32(gain) * source
+
+    mixed = normalize(mixed)
+    if count_in:
+        mixed = np.concatenate((count_in_clicks(analysis, start_tick, count_in, tempo_scale, sample_rate), mixed))
+    return mixed
+
+
+def synthesize_chunks(
+    analysis: MidiAnalysis,
+    boundaries: List[int],
+    tracks: Optional[Iterable[int]] = None,
+    gains: Optional[Dict[int, float]] = None,
+    tempo_scale: float = 1.0,
+    count_in: int = 0,
+    sample_rate: int = SAMPLE_RATE
+) -> Iterator[np.ndarray]:
+    """
+    Render the range [boundaries[0], boundaries[-1]) chunk by chunk.
+
+    Yields the samples between consecutive boundary ticks (e.g. bar lines)
+    as soon as they are rendered; notes that sound past a boundary are
+    carried into the following chunks. Concatenated, the chunks match
+    synthesize() except for the level: the peak of the whole mix is not
+    known up front, so the mix is scaled by PEAK_LEVEL over the sum of the
+    track gains instead of being normalized.
+    """
+    start_tick, end_tick = boundaries[0], boundaries[-1]
+    wanted = set(tracks) if tracks else None
+    gains = gains or {}
+    origin, length = _span(analysis, start_tick, end_tick, tempo_scale, sample_rate)
+
+    active = []
+    for track in analysis.tracks:
+        if not track.note_count or (wanted is not None and track.track_number not in wanted):
+            continue
+        gain = gains.get(track.track_number, 1.0)
+        if gain > 0:
+            active.append((track, gain))
+    level = PEAK_LEVEL / max(sum(gain for _, gain in active), 1.0)
+
+    if count_in:
+        yield count_in_clicks(analysis, start_tick, count_in, tempo_scale, sample_rate)
+
+    offsets = ((ticks_to_seconds(analysis, np.array(boundaries, dtype=np.float64)) - origin)
+               / tempo_scale * sample_rate).astype(np.int64).tolist()
+    offsets[-1] = length  # The last chunk includes the release tail
+    release = int(RELEASE_SECONDS * sample_rate)
+    carry = np.zeros(0, dtype=np.float32)
+
+    for chunk_start_tick, chunk_end_tick, chunk_start, chunk_end in zip(
+        boundaries, boundaries[1:], offsets, offsets[1:]
+    ):
+        events = []
+        reach = max(chunk_end, chunk_start + len(carry))
+        for track, gain in active:
+            track_events = _note_events(
+                analysis, track, chunk_start_tick, chunk_end_tick, end_tick, origin, tempo_scale, sample_rate
+            )
+            if track_events is not None:
+                events.append((track_events, gain))
+                starts, lengths, _, _ = track_events
+                reach = max(reach, int((starts + lengths).max()) + release)
+
+        chunk = np.zeros(max(min(reach, length) - chunk_start, 0), dtype=np.float32)
+        chunk[:len(carry)] += carry
+        for track_events, gain in events:
+            _add_notes(chunk, chunk_start, track_events, sample_rate, gain * level)
+
+        split = max(chunk_end - chunk_start, 0)
+        carry = chunk[split:]
+        yield chunk[:split]
+
+
+def pcm16(samples: np.ndarray) -> bytes:
+    """Float signal in [-1, 1] as little-endian 16-bit PCM"""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def wav_stream_header(sample_rate: int = SAMPLE_RATE) -> bytes:
+    """
+    Header of a 16-bit mono WAV stream of unknown length (the sizes are
+    set to the maximum, which players treat as "read until the end")
+    """
+    data_size = 0xFFFFFFFF - 36
+    return (
+        b"RIFF" + struct.pack("<I", data_size + 36) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def write_wav(path: Path, samples: np.ndarray, sample_rate: int = SAMPLE_RATE):
+    """Write a float signal in [-1, 1] as 16-bit mono WAV"""
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm16(samples))
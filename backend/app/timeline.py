@@ -0,0 +1,213 @@
+"""
+Measure/beat <-> tick <-> seconds mapping for a song
+
+Built from the tempo map and time signatures of the MIDI analysis, so
+section boundaries stay correct for songs with tempo or meter changes.
+Lookups binary-search the change points.
+
+Beats are counted in the unit of the time signature's denominator (a 6/8
+bar has six eighth-note beats) and measures start at 1. A meter change
+that does not fall on a bar line starts a new measure.
+"""
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.midi_analysis import MidiAnalysis, load_analysis
+
+
+@dataclass(frozen=True)
+class MeterSegment:
+    """A stretch of the song with one time signature"""
+    tick: int
+    measure: int
+    numerator: int
+    denominator: int
+    ticks_per_beat: int
+
+    @property
+    def ticks_per_measure(self) -> int:
+        return self.numerator * self.ticks_per_beat
+
+
+class Timeline:
+    """Precomputed tempo and meter index for one MIDI file"""
+
+    def __init__(
+        self,
+        ticks_per_beat: int,
+        tempo_changes: List[Tuple[int, int]],
+        time_signatures: List[Tuple[int, int, int]],
+        length_ticks: int
+    ):
+        self.ticks_per_beat = ticks_per_beat
+        self.length_ticks = length_ticks
+
+        # Tempo segments: start tick, start seconds, microseconds per quarter note
+        self._tempo_ticks: List[int] = []
+        self._tempo_seconds: List[float] = []
+        self._tempos: List[int] = []
+        seconds = 0.0
+        for tick, tempo in tempo_changes:
+            if self._tempo_ticks:
+                seconds += (tick - self._tempo_ticks[-1]) * self._tempos[-1] / (1e6 * ticks_per_beat)
+            self._tempo_ticks.append(tick)
+            self._tempo_seconds.append(seconds)
+            self._tempos.append(tempo)
+
+        # Meter segments with the measure number each one starts at
+        self._meters: List[MeterSegment] = []
+        for tick, numerator, denominator in time_signatures:
+            measure = 1
+            if self._meters:
+                previous = self._meters[-1]
+                elapsed = tick - previous.tick
+                measure = previous.measure + -(-elapsed // previous.ticks_per_measure)
+            self._meters.append(MeterSegment(
+                tick=tick,
+                measure=measure,
+                numerator=numerator,
+                denominator=denominator,
+                ticks_per_beat=ticks_per_beat * 4 // denominator
+            ))
+        self._meter_ticks = [segment.tick for segment in self._meters]
+        self._meter_measures = [segment.measure for segment in self._meters]
+
+    @classmethod
+    def from_analysis(cls, analysis: MidiAnalysis) -> "Timeline":
+        return cls(
+            analysis.ticks_per_beat,
+            analysis.tempo_changes,
+            analysis.time_signatures,
+            analysis.length_ticks
+        )
+
+    def tick_to_seconds(self, tick: int) -> float:
+        i = max(bisect_right(self._tempo_ticks, tick) - 1, 0)
+        return self._tempo_seconds[i] + (tick - self._tempo_ticks[i]) * self._tempos[i] / (1e6 * self.ticks_per_beat)
+
+    def seconds_to_tick(self, seconds: float) -> int:
+        i = max(bisect_right(self._tempo_seconds, seconds) - 1, 0)
+        ticks = (seconds - self._tempo_seconds[i]) * 1e6 * self.ticks_per_beat / self._tempos[i]
+        return self._tempo_ticks[i] + round(ticks)
+
+    def meter_at_measure(self, measure: int) -> MeterSegment:
+        return self._meters[max(bisect_right(self._meter_measures, measure) - 1, 0)]
+
+    def meter_at_tick(self, tick: int) -> MeterSegment:
+        return self._meters[max(bisect_right(self._meter_ticks, tick) - 1, 0)]
+
+    def measure_beat_to_tick(self, measure: int, beat: int = 1) -> int:
+        """Tick at which the given beat of the given measure starts"""
+        segment = self.meter_at_measure(measure)
+        return (
+            segment.tick
+            + (measure - segment.measure) * segment.ticks_per_measure
+            + (beat - 1) * segment.ticks_per_beat
+        )
+
+    def measure_beat_to_seconds(self, measure: int, beat: int = 1) -> float:
+        return self.tick_to_seconds(self.measure_beat_to_tick(measure, beat))
+
+    def tick_to_measure_beat(self, tick: int) -> Tuple[int, int]:
+        """Measure and beat containing the given tick"""
+        segment = self.meter_at_tick(tick)
+        measures, remainder = divmod(tick - segment.tick, segment.ticks_per_measure)
+        return segment.measure + measures, remainder // segment.ticks_per_beat + 1
+
+    def bar_lines(self, start_tick: int, end_tick: int) -> List[int]:
+        """Ticks of the measure starts strictly between start_tick and end_tick"""
+        ticks = []
+        measure = self.tick_to_measure_beat(start_tick)[0] + 1
+        tick = self.measure_beat_to_tick(measure)
+        while tick < end_tick:
+            if tick > start_tick:
+                ticks.append(tick)
+            measure += 1
+            tick = self.measure_beat_to_tick(measure)
+        return ticks
+
+    @property
+    def measure_count(self) -> int:
+        """Number of measures needed to cover the whole song"""
+        if self.length_ticks <= 0:
+            return 0
+        measure, _ = self.tick_to_measure_beat(self.length_ticks - 1)
+        return measure
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.tick_to_seconds(self.length_ticks)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON representation for the timeline endpoint"""
+        measures = []
+        for measure in range(1, self.measure_count + 1):
+            tick = self.measure_beat_to_tick(measure)
+            segment = self.meter_at_measure(measure)
+            measures.append({
+                "measure": measure,
+                "tick": tick,
+                "seconds": round(self.tick_to_seconds(tick), 6),
+                "beats": segment.numerator
+            })
+
+        return {
+            "ticks_per_beat": self.ticks_per_beat,
+            "length_ticks": self.length_ticks,
+            "duration_seconds": round(self.duration_seconds, 6),
+            "measure_count": self.measure_count,
+            "tempo_changes": [
+                {
+                    "tick": tick,
+                    "seconds": round(seconds, 6),
+                    "bpm": round(60_000_000 / tempo, 3)
+                }
+                for tick, seconds, tempo in zip(self._tempo_ticks, self._tempo_seconds, self._tempos)
+            ],
+            "time_signatures": [
+                {
+                    "tick": segment.tick,
+                    "measure": segment.measure,
+                    "numerator": segment.numerator,
+                    "denominator": segment.denominator
+                }
+                for segment in self._meters
+            ],
+            "measures": measures
+        }
+
+
+_timelines: "OrderedDict[str, Timeline]" = OrderedDict()
+_timelines_lock = threading.Lock()
+_TIMELINE_CACHE_SIZE = 64
+
+
+def load_timeline(song_dir: Path, midi_sha256: Optional[str]) -> Optional[Timeline]:
+    """
+    Return the (cached) timeline for a song's MIDI file.
+
+    Timelines are keyed by the MIDI content hash, so a re-upload yields a
+    fresh timeline while unchanged songs reuse the cached one.
+    """
+    key = midi_sha256 or str(song_dir)
+    with _timelines_lock:
+        timeline = _timelines.get(key)
+        if timeline is not None:
+            _timelines.move_to_end(key)
+            return timeline
+
+    analysis = load_analysis(song_dir, midi_sha256)
+    if analysis is None:
+        return None
+    timeline = Timeline.from_analysis(analysis)
+
+    if midi_sha256:
+        with _timelines_lock:
+            _timelines[key] = timeline
+            while len(_timelines) > _TIMELINE_CACHE_SIZE:
+                _timelines.popitem(last=False)
+    return timeline
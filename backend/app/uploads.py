@@ -0,0 +1,72 @@
+"""
+Streaming upload handling
+
+Uploads are copied to a temporary file next to their final location in
+fixed-size chunks while being size-checked and hashed, and are only moved
+into place once the caller has accepted them.
+"""
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import uuid4
+
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class StagedUpload:
+    """An upload written to a temporary file, not yet moved into place"""
+    path: Path
+    size: int
+    sha256: str
+
+    def commit(self, destination: Path):
+        """Atomically move the upload to its final path"""
+        os.replace(self.path, destination)
+        self.path = destination
+
+    def discard(self):
+        """Remove the temporary file"""
+        self.path.unlink(missing_ok=True)
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Maximum size is {max_bytes // (1024 * 1024)} MB"
+    )
+
+
+async def stage_upload(upload: UploadFile, directory: Path, max_bytes: int) -> StagedUpload:
+    """
+    Stream an upload into a temporary file in directory.
+
+    Raises 413 as soon as more than max_bytes have been received. The
+    temporary file lives in the destination directory so that commit() is a
+    same-filesystem rename.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f".upload-{uuid4().hex}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large(max_bytes)
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+
+    return StagedUpload(path=path, size=size, sha256=digest.hexdigest())
@@ -0,0 +1,93 @@
+"""
+Executors for blocking work
+
+Storage I/O runs in a bounded thread pool, CPU-heavy MIDI analysis and
+audio rendering in two separate process pools, so request handlers never
+block the event loop. Pool sizes come from STORAGE_THREADS, MIDI_WORKERS
+and RENDER_WORKERS.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, TypeVar
+
+from app.config import MIDI_WORKERS, RENDER_WORKERS, STORAGE_THREADS
+
+T = TypeVar("T")
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_render_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """Thread pool for blocking file and database I/O"""
+    global _thread_pool
+    if _thread_pool is None:
+        with _pool_lock:
+            if _thread_pool is None:
+                _thread_pool = ThreadPoolExecutor(max_workers=STORAGE_THREADS, thread_name_prefix="storage")
+    return _thread_pool
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Process pool for CPU-bound work such as MIDI analysis"""
+    global _process_pool
+    if _process_pool is None:
+        with _pool_lock:
+            if _process_pool is None:
+                # spawn: forking a process that already runs threads is unsafe
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=MIDI_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _process_pool
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Process pool for audio rendering jobs"""
+    global _render_pool
+    if _render_pool is None:
+        with _pool_lock:
+            if _render_pool is None:
+                _render_pool = ProcessPoolExecutor(
+                    max_workers=RENDER_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _render_pool
+
+
+async def run_in_thread(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking function in the storage thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_thread_pool(), partial(func, *args, **kwargs))
+
+
+async def run_in_process(func: Callable[..., T], *args: Any) -> T:
+    """Run a picklable top-level function in the process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), partial(func, *args))
+
+
+async def run_in_render_process(func: Callable[..., T], *args: Any) -> T:
+    """Run a picklable top-level function in the render process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_render_pool(), partial(func, *args))
+
+
+def shutdown():
+    """Stop all pools (called on application shutdown)"""
+    global _thread_pool, _process_pool, _render_pool
+    with _pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=True, cancel_futures=True)
+            _render_pool = None
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=True, cancel_futures=True)
+            _process_pool = None
+        if _thread_pool is not None:
+            _thread_pool.shutdown(wait=True)
+            _thread_pool = None
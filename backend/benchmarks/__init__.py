@@ -0,0 +1,12 @@
+"""
+Benchmark suite for the ChoirLoop backend
+
+Generates synthetic song libraries and MIDI files (seeded, so every run
+sees the same data) and times the hot paths: list_songs, load_song,
+paginated search, section CRUD, MIDI analysis and, with --api, song
+list and detail requests or, with --render, audio rendering. Results are JSON and can be compared between commits:
+
+    python -m benchmarks run --output before.json
+    python -m benchmarks run --output after.json
+    python -m benchmarks compare before.json after.json
+"""
@@ -0,0 +1,144 @@
+"""
+Command line entry point of the benchmark suite
+
+Usage (from backend/):
+    python -m benchmarks run [--sizes 10,100,1000,10000] [--backends json,sqlite]
+                             [--midi 32x4,128x8,512x16] [--api] [--render] [--quick]
+                             [--output results.json]
+    python -m benchmarks compare baseline.json results.json [--threshold 0.1]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+RESULTS_VERSION = 1
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def _midi_specs(value: str) -> List[Tuple[int, int]]:
+    """'32x4,128x8' -> [(32, 4), (128, 8)] (measures x voice tracks)"""
+    specs = []
+    for item in value.split(","):
+        measures, _, tracks = item.strip().partition("x")
+        specs.append((int(measures), int(tracks)))
+    return specs
+
+
+def run(args: argparse.Namespace) -> int:
+    with tempfile.TemporaryDirectory(prefix="choirloop-bench-") as scratch:
+        root = Path(scratch)
+        # The app reads its configuration at import time
+        os.environ["DATA_DIR"] = str(root / "data")
+        os.environ["METRICS_ENABLED"] = "false"
+        from benchmarks import suites
+
+        results: List[Dict[str, Any]] = []
+        started = time.perf_counter()
+        # App log output goes to stderr so stdout stays valid JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            for backend in args.backends.split(","):
+                for songs in args.sizes:
+                    print(f"[Benchmark] storage: {backend}, {songs} songs", file=sys.stderr)
+                    results += suites.storage_suite(root, backend, songs, args.sections, args.repeat, args.seed)
+                    if args.api:
+                        print(f"[Benchmark] API: {backend}, {songs} songs", file=sys.stderr)
+                        results += suites.api_suite(root, backend, songs, args.api_sections, args.repeat, args.seed)
+            for measures, tracks in args.midi:
+                print(f"[Benchmark] MIDI analysis: {measures} measures x {tracks} tracks", file=sys.stderr)
+                results += suites.midi_suite(root, measures, tracks, args.repeat, args.seed)
+                if args.render:
+                    print(f"[Benchmark] rendering: {measures} measures x {tracks} tracks", file=sys.stderr)
+                    results += suites.render_suite(root, measures, tracks, args.render_repeat, args.seed)
+
+    document = {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "commit": _git("rev-parse", "HEAD"),
+            "dirty": bool(_git("status", "--porcelain", "--", ".")),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "duration_seconds": round(time.perf_counter() - started, 1),
+            "args": {key: value for key, value in vars(args).items() if key not in ("func", "output")}
+        },
+        "results": results
+    }
+    text = json.dumps(document, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+        print(f"[Benchmark] Wrote {len(results)} results to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    from benchmarks.compare import compare as compare_files
+
+    lines, regressions = compare_files(args.baseline, args.current, args.threshold, args.metric)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{regressions} case(s) slower by more than {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="ChoirLoop backend benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and emit JSON results")
+    run_parser.add_argument("--sizes", type=_ints, default=[10, 100, 1000, 10000], help="Library sizes (songs)")
+    run_parser.add_argument("--backends", default="json,sqlite", help="Storage backends to measure")
+    run_parser.add_argument("--sections", type=int, default=6, help="Practice sections per song")
+    run_parser.add_argument("--midi", type=_midi_specs, default=[(32, 4), (128, 8), (512, 16)],
+                            help="MIDI files as measures x tracks")
+    run_parser.add_argument("--repeat", type=int, default=20, help="Timed runs per case")
+    run_parser.add_argument("--api", action="store_true", help="Also measure song list/detail requests (needs httpx)")
+    run_parser.add_argument("--api-sections", type=int, default=50, help="Practice sections per song in the API cases")
+    run_parser.add_argument("--render", action="store_true", help="Also measure audio rendering")
+    run_parser.add_argument("--render-repeat", type=int, default=3, help="Timed runs per render case")
+    run_parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+    run_parser.add_argument("--quick", action="store_true", help="Small sizes and few runs (smoke test)")
+    run_parser.add_argument("--output", type=Path, help="Write results here instead of stdout")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown to flag")
+    compare_parser.add_argument("--metric", default="median", choices=["min", "median", "p95", "mean"])
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    if args.command == "run" and args.quick:
+        args.sizes = [size for size in args.sizes if size <= 100] or [10]
+        args.midi = args.midi[:1]
+        args.repeat = min(args.repeat, 5)
+        args.render_repeat = 1
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
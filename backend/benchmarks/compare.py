@@ -0,0 +1,39 @@
+"""Compare two benchmark result files"""
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+
+def case_key(result: Dict[str, Any]) -> Tuple[str, str]:
+    """Identity of a case across runs: its name and parameters"""
+    params = ", ".join(f"{key}={value}" for key, value in sorted(result["params"].items()) if key != "bytes")
+    return result["name"], params
+
+
+def compare(baseline: Path, current: Path, threshold: float, metric: str = "median") -> Tuple[List[str], int]:
+    """
+    Table of the cases both files contain and the number of regressions,
+    i.e. cases whose metric grew by more than threshold (0.1 = 10%)
+    """
+    old = {case_key(r): r for r in json.loads(baseline.read_text())["results"]}
+    new = {case_key(r): r for r in json.loads(current.read_text())["results"]}
+
+    lines = [f"{'case':<60} {'baseline':>10} {'current':>10} {'change':>8}"]
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key][metric], new[key][metric]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  faster"
+        name = f"{key[0]} [{key[1]}]"
+        lines.append(f"{name:<60} {before:>10.3f} {after:>10.3f} {change:>+8.1%}{flag}")
+
+    for key in sorted(old.keys() - new.keys()):
+        lines.append(f"{key[0]} [{key[1]}]: only in baseline")
+    for key in sorted(new.keys() - old.keys()):
+        lines.append(f"{key[0]} [{key[1]}]: new")
+    return lines, regressions
@@ -0,0 +1,221 @@
+"""
+Benchmark cases for storage, the song API, MIDI analysis and rendering
+
+Import only after DATA_DIR points to a scratch directory (see
+benchmarks/__main__.py): the app's configuration is read at import time.
+"""
+import hashlib
+import random
+import shutil
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.midi_analysis import ANALYSIS_FILENAME, analyze_to_sidecar, read_sidecar
+from app.storage import StorageService, set_backend
+from app.storage.json_backend import JsonStorageBackend
+from app.storage.migrate import migrate
+from app.storage.sqlite_backend import SqliteStorageBackend
+from benchmarks.synthetic import make_midi, write_json_library
+
+Result = Dict[str, Any]
+
+
+def measure(
+    name: str,
+    params: Dict[str, Any],
+    func: Callable[[], Any],
+    repeat: int,
+    setup: Optional[Callable[[], Any]] = None,
+    warmup: int = 1
+) -> Result:
+    """Time func repeat times (setup runs untimed before each call) in milliseconds"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+
+    samples: List[float] = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return {
+        "name": name,
+        "params": params,
+        "unit": "ms",
+        "runs": len(samples),
+        "min": round(samples[0], 4),
+        "median": round(statistics.median(samples), 4),
+        "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "mean": round(statistics.fmean(samples), 4)
+    }
+
+
+def _open_backend(kind: str, data_dir: Path):
+    if kind == "json":
+        return JsonStorageBackend(data_dir)
+    return SqliteStorageBackend(data_dir / "choirloop.db", data_dir / "songs")
+
+
+def storage_suite(root: Path, kind: str, songs: int, sections: int, repeat: int, seed: int) -> List[Result]:
+    """list_songs, load_song, search and section CRUD through StorageService on a synthetic library"""
+    data_dir = root / f"{kind}-{songs}"
+    song_ids = write_json_library(data_dir, songs, sections, seed)
+    if kind == "sqlite":
+        migrate(data_dir, data_dir / "choirloop.db")
+    params = {"backend": kind, "songs": songs, "sections": sections}
+    rng = random.Random(seed)
+    results = []
+
+    # Cold: a fresh backend per call, so nothing is cached in-process
+    results.append(measure(
+        "list_songs.cold", params, StorageService.list_songs, repeat,
+        setup=lambda: set_backend(_open_backend(kind, data_dir))
+    ))
+    backend = _open_backend(kind, data_dir)
+    set_backend(backend)
+    results.append(measure("list_songs.warm", params, StorageService.list_songs, repeat))
+
+    picks = [rng.choice(song_ids) for _ in range(repeat + 1)]
+    results.append(measure(
+        "load_song.cold", params, lambda: StorageService.load_song(picks.pop()), repeat,
+        setup=lambda: set_backend(_open_backend(kind, data_dir))
+    ))
+    set_backend(backend)
+    for song_id in song_ids[:min(len(song_ids), 256)]:
+        StorageService.load_song(song_id)
+    warm_ids = song_ids[:256]
+    results.append(measure(
+        "load_song.warm", params, lambda: StorageService.load_song(rng.choice(warm_ids)), repeat
+    ))
+
+    # Paginated listing and search (the index is built by the warmup run)
+    results.append(measure(
+        "search.page", params, lambda: StorageService.search_songs(sort="title", limit=50), repeat
+    ))
+    results.append(measure(
+        "search.query", params, lambda: StorageService.search_songs(query="song 001", limit=50), repeat
+    ))
+
+    # Section CRUD: each call is a locked read-modify-write of one song
+    created = []
+
+    def add():
+        song_id = rng.choice(song_ids)
+        write = StorageService.add_practice_section(song_id, {
+            "label": "Benchmark", "start_measure": 1, "start_beat": 1, "end_measure": 5, "end_beat": 1
+        })
+        created.append((song_id, write.section.id))
+
+    results.append(measure("section.create", params, add, repeat))
+    targets = list(created)
+    results.append(measure(
+        "section.update", params,
+        lambda: StorageService.update_practice_section(*rng.choice(targets), {"label": "Renamed", "end_measure": 9}),
+        repeat
+    ))
+    results.append(measure(
+        "section.delete", params, lambda: StorageService.delete_practice_section(*created.pop()),
+        min(repeat, len(created) - 1), warmup=1
+    ))
+
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def api_suite(root: Path, kind: str, songs: int, sections: int, repeat: int, seed: int) -> List[Result]:
+    """Song list and song detail requests through the ASGI app, including serialization"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.serialization import response_cache
+
+    data_dir = root / f"api-{kind}-{songs}"
+    song_ids = write_json_library(data_dir, songs, sections, seed)
+    if kind == "sqlite":
+        migrate(data_dir, data_dir / "choirloop.db")
+    set_backend(_open_backend(kind, data_dir))
+    response_cache.clear()
+    params = {"backend": kind, "songs": songs, "sections": sections}
+    rng = random.Random(seed)
+    # Without the context manager, so the render queue and pre-renderer stay stopped
+    client = TestClient(app)
+
+    def get(url: str):
+        response = client.get(url)
+        assert response.status_code == 200, response.text
+
+    results = [
+        measure("api.list.cold", params, lambda: get("/api/songs"), repeat, setup=response_cache.clear),
+        measure("api.list.warm", params, lambda: get("/api/songs"), repeat),
+        measure("api.list.page", params, lambda: get("/api/songs?sort=title&limit=50"), repeat),
+        measure(
+            "api.song.cold", params, lambda: get(f"/api/songs/{rng.choice(song_ids)}"), repeat,
+            setup=lambda: (response_cache.clear(), set_backend(_open_backend(kind, data_dir)))
+        )
+    ]
+    warm_ids = song_ids[:64]
+    for song_id in warm_ids:
+        get(f"/api/songs/{song_id}")
+    results.append(measure("api.song.warm", params, lambda: get(f"/api/songs/{rng.choice(warm_ids)}"), repeat))
+
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def midi_suite(root: Path, measures: int, tracks: int, repeat: int, seed: int) -> List[Result]:
+    """The analysis upload_midi runs in the worker pool, and reading its sidecar back"""
+    song_dir = root / f"midi-{measures}x{tracks}"
+    midi_path = song_dir / "song.mid"
+    make_midi(midi_path, measures, tracks, seed)
+    sha256 = hashlib.sha256(midi_path.read_bytes()).hexdigest()
+    sidecar = song_dir / ANALYSIS_FILENAME
+    params = {"measures": measures, "tracks": tracks, "bytes": midi_path.stat().st_size}
+
+    return [
+        measure("midi.analyze", params, lambda: analyze_to_sidecar(str(midi_path), str(sidecar), sha256), repeat),
+        measure("midi.read_sidecar", params, lambda: read_sidecar(sidecar), repeat)
+    ]
+
+
+def render_suite(root: Path, measures: int, tracks: int, repeat: int, seed: int) -> List[Result]:
+    """Built-in synthesizer render of a whole song, with and without cached stems"""
+    from app.mp3_generator import STEM_SUFFIX, render_wav
+    from app.render_cache import render_cache
+
+    song_dir = root / f"midi-{measures}x{tracks}"
+    midi_path = song_dir / "song.mid"
+    if not midi_path.exists():
+        make_midi(midi_path, measures, tracks, seed)
+    sha256 = hashlib.sha256(midi_path.read_bytes()).hexdigest()
+    analyze_to_sidecar(str(midi_path), str(song_dir / ANALYSIS_FILENAME), sha256)
+    render_cache.directory.mkdir(parents=True, exist_ok=True)
+    params = {"measures": measures, "tracks": tracks}
+
+    def settings(gain: float) -> Dict[str, Any]:
+        return {
+            "settings_hash": f"bench-{measures}x{tracks}",
+            "song_dir": str(song_dir),
+            "midi_sha256": sha256,
+            "start_tick": 0,
+            "end_tick": None,
+            "tracks": list(range(1, tracks + 1)),
+            "gains": {track: gain if track == 1 else 0.3 for track in range(1, tracks + 1)},
+            "tempo": 100,
+            "count_in": 0
+        }
+
+    def drop_stems():
+        for path in render_cache.directory.glob(f"*{STEM_SUFFIX}"):
+            path.unlink()
+
+    gains = iter([0.5 + i / 1000 for i in range(2 * repeat + 4)])
+    return [
+        measure("render.cold", params, lambda: render_wav(settings(0.5)), repeat, setup=drop_stems),
+        measure("render.cached_stems", params, lambda: render_wav(settings(next(gains))), repeat)
+    ]
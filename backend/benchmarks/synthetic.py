@@ -0,0 +1,128 @@
+"""
+Synthetic song libraries and MIDI files for the benchmarks
+
+Everything is derived from a seeded random generator, so the same
+arguments produce byte-identical data on every machine and commit.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+from uuid import UUID
+
+import mido
+
+from app.models import PracticeSection, Song, SongSummary, Voice
+from app.storage.base import summarize
+
+VOICE_NAMES = ["Soprano", "Alto", "Tenor", "Bass", "Soprano 2", "Alto 2", "Tenor 2", "Bass 2"]
+SECTION_LABELS = ["Intro", "Verse 1", "Chorus", "Verse 2", "Bridge", "Coda"]
+
+BASE_TIME = datetime(2025, 1, 1)
+TICKS_PER_BEAT = 480
+
+# Lowest pitch of each voice's range (soprano down to bass)
+VOICE_RANGES = [60, 55, 48, 40]
+
+
+def _uuid(rng: random.Random) -> UUID:
+    return UUID(int=rng.getrandbits(128), version=4)
+
+
+def make_song(rng: random.Random, number: int, voices: int = 4, sections: int = 6, measures: int = 64) -> Song:
+    """A song document with voices and practice sections spread over its measures"""
+    created = BASE_TIME + timedelta(minutes=number)
+    span = max(1, measures // max(1, sections))
+    return Song(
+        id=_uuid(rng),
+        title=f"Song {number:05d}",
+        description=f"Synthetic song {number} for benchmarks",
+        midi_file="song.mid",
+        midi_sha256=f"{rng.getrandbits(256):064x}",
+        voices=[
+            Voice(track_number=track + 1, names=[VOICE_NAMES[track % len(VOICE_NAMES)]],
+                  channel=track, note_count=rng.randint(100, 800))
+            for track in range(voices)
+        ],
+        practice_sections=[
+            PracticeSection(
+                id=_uuid(rng),
+                label=SECTION_LABELS[i % len(SECTION_LABELS)],
+                start_measure=i * span + 1,
+                start_beat=1,
+                end_measure=(i + 1) * span + 1,
+                end_beat=1,
+                relevant_voices=rng.sample(range(1, voices + 1), k=rng.randint(1, voices)),
+                created_at=created
+            )
+            for i in range(sections)
+        ],
+        created_at=created,
+        updated_at=created
+    )
+
+
+def write_json_library(data_dir: Path, songs: int, sections: int = 6, seed: int = 0) -> List[UUID]:
+    """
+    Write a library in the JSON backend layout and return the song IDs.
+
+    The files are written directly instead of through save_song, which
+    rewrites index.json once per song.
+    """
+    rng = random.Random(seed)
+    songs_dir = data_dir / "songs"
+    songs_dir.mkdir(parents=True, exist_ok=True)
+    (data_dir / "locks").mkdir(exist_ok=True)
+
+    summaries: List[SongSummary] = []
+    for number in range(songs):
+        song = make_song(rng, number, sections=sections)
+        song_dir = songs_dir / str(song.id)
+        song_dir.mkdir(exist_ok=True)
+        (song_dir / "config.json").write_text(json.dumps(song.model_dump(mode="json"), indent=2))
+        summaries.append(summarize(song))
+
+    index = [summary.model_dump(mode="json") for summary in summaries]
+    (data_dir / "index.json").write_text(json.dumps(index, indent=2))
+    return [summary.id for summary in summaries]
+
+
+def make_midi(path: Path, measures: int, tracks: int, seed: int = 0):
+    """
+    Write a type 1 MIDI file: a tempo/meter track plus one voice track per
+    part, 4/4, with a mix of quarter and eighth notes and some rests
+    """
+    rng = random.Random(seed)
+    midi = mido.MidiFile(type=1, ticks_per_beat=TICKS_PER_BEAT)
+
+    conductor = mido.MidiTrack()
+    conductor.append(mido.MetaMessage("track_name", name="Conductor", time=0))
+    conductor.append(mido.MetaMessage("set_tempo", tempo=mido.bpm2tempo(96), time=0))
+    conductor.append(mido.MetaMessage("time_signature", numerator=4, denominator=4, time=0))
+    conductor.append(mido.MetaMessage("end_of_track", time=measures * 4 * TICKS_PER_BEAT))
+    midi.tracks.append(conductor)
+
+    for part in range(tracks):
+        channel = part % 16
+        low = VOICE_RANGES[part % len(VOICE_RANGES)]
+        track = mido.MidiTrack()
+        track.append(mido.MetaMessage("track_name", name=VOICE_NAMES[part % len(VOICE_NAMES)], time=0))
+        track.append(mido.Message("program_change", program=52, channel=channel, time=0))
+        delta = 0
+        remaining = measures * 4 * TICKS_PER_BEAT
+        while remaining > 0:
+            length = min(remaining, rng.choice((TICKS_PER_BEAT, TICKS_PER_BEAT, TICKS_PER_BEAT // 2)))
+            remaining -= length
+            if rng.random() < 0.1:
+                delta += length  # Rest
+                continue
+            note = low + rng.randint(0, 12)
+            track.append(mido.Message("note_on", note=note, velocity=rng.randint(60, 100), channel=channel, time=delta))
+            track.append(mido.Message("note_off", note=note, velocity=0, channel=channel, time=length))
+            delta = 0
+        track.append(mido.MetaMessage("end_of_track", time=delta))
+        midi.tracks.append(track)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    midi.save(str(path))
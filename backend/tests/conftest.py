@@ -0,0 +1,66 @@
+"""
+Shared fixtures
+
+The app reads its configuration at import time, so the tests point
+DATA_DIR to a scratch directory before anything from app is imported.
+"""
+import os
+import shutil
+import tempfile
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="choirloop-tests-")
+os.environ["PRERENDER_ENABLED"] = "false"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import DATA_DIR, SQLITE_PATH
+from app.main import app
+from app.serialization import response_cache
+from app.storage import SONGS_DIR, set_backend
+from app.storage.json_backend import JsonStorageBackend
+from app.storage.sqlite_backend import SqliteStorageBackend
+from benchmarks.synthetic import make_midi
+
+
+@pytest.fixture(scope="session", autouse=True)
+def data_dir():
+    yield DATA_DIR
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request):
+    """Run a test against each storage backend"""
+    if request.param == "json":
+        storage = JsonStorageBackend(DATA_DIR)
+    else:
+        storage = SqliteStorageBackend(SQLITE_PATH, SONGS_DIR)
+    storage.ensure_directories()
+    set_backend(storage)
+    response_cache.clear()
+    yield request.param
+    set_backend(None)
+
+
+@pytest.fixture
+def client(backend):
+    # Without the context manager, so the render queue and pre-renderer stay stopped
+    return TestClient(app)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def midi_files(tmp_path_factory):
+    """Two different small MIDI files"""
+    directory = tmp_path_factory.mktemp("midi")
+    paths = []
+    for seed in (1, 2):
+        path = directory / f"song-{seed}.mid"
+        make_midi(path, 8, 3, seed)
+        paths.append(path)
+    return paths
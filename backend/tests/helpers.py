@@ -0,0 +1,16 @@
+"""Request helpers shared by the API tests"""
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+
+def create_song(client: TestClient, title: str = "Test song") -> dict:
+    response = client.post("/api/songs", json={"title": title})
+    assert response.status_code == 201, response.text
+    return response.json()["song"]
+
+
+def upload_midi(client: TestClient, song_id: str, path: Path):
+    with open(path, "rb") as f:
+        response = client.post(f"/api/songs/{song_id}/upload/midi", files={"midi_file": ("song.mid", f)})
+    assert response.status_code == 200, response.text
@@ -0,0 +1,74 @@
+"""Uploads are stored once per content hash and released with their last song"""
+import hashlib
+
+from app.storage import StorageService, blob_store
+from tests.helpers import create_song, upload_midi
+
+
+def _sha256(path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_duplicate_uploads_share_one_blob(client, midi_files):
+    first, second = create_song(client), create_song(client)
+    upload_midi(client, first["id"], midi_files[0])
+    upload_midi(client, second["id"], midi_files[0])
+    sha256 = _sha256(midi_files[0])
+
+    assert blob_store.refcount(sha256) == 2
+    paths = [StorageService.get_song_dir(song["id"]) / "song.mid" for song in (first, second)]
+    assert paths[0].samefile(paths[1])
+    assert paths[0].samefile(blob_store.path(sha256))
+    # The duplicate reuses the stored analysis
+    voices = [client.get(f"/api/songs/{song['id']}").json()["song"]["voices"] for song in (first, second)]
+    assert voices[0] and voices[0] == voices[1]
+
+    client.delete(f"/api/songs/{first['id']}")
+    assert blob_store.refcount(sha256) == 1
+    client.delete(f"/api/songs/{second['id']}")
+    assert not blob_store.contains(sha256)
+
+
+def test_reupload_releases_the_previous_blob(client, midi_files):
+    song = create_song(client)
+    upload_midi(client, song["id"], midi_files[0])
+    old, new = _sha256(midi_files[0]), _sha256(midi_files[1])
+    assert blob_store.refcount(old) == 1
+
+    upload_midi(client, song["id"], midi_files[1])
+
+    assert not blob_store.contains(old)
+    assert blob_store.refcount(new) == 1
+    assert client.get(f"/api/songs/{song['id']}/midi").content == midi_files[1].read_bytes()
+    client.delete(f"/api/songs/{song['id']}")
+    assert not blob_store.contains(new)
+
+
+def test_reuploading_the_same_file_keeps_the_blob(client, midi_files):
+    song = create_song(client)
+    upload_midi(client, song["id"], midi_files[0])
+    upload_midi(client, song["id"], midi_files[0])
+    sha256 = _sha256(midi_files[0])
+
+    assert blob_store.refcount(sha256) == 1
+    client.delete(f"/api/songs/{song['id']}")
+    assert not blob_store.contains(sha256)
+
+
+def test_sync_adopts_files_uploaded_before_the_store(client, midi_files):
+    song = create_song(client)
+    upload_midi(client, song["id"], midi_files[0])
+    sha256 = _sha256(midi_files[0])
+    midi_path = StorageService.get_song_dir(song["id"]) / "song.mid"
+    # Turn the song file into an independent copy, as uploads were stored before
+    data = midi_path.read_bytes()
+    midi_path.unlink()
+    midi_path.write_bytes(data)
+    assert blob_store.release(sha256)
+
+    assert StorageService.sync_blobs()["adopted"] >= 1
+
+    assert blob_store.refcount(sha256) == 1
+    assert midi_path.samefile(blob_store.path(sha256))
+    client.delete(f"/api/songs/{song['id']}")
+    assert not blob_store.contains(sha256)
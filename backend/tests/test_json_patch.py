@@ -0,0 +1,116 @@
+"""JSON Patch (RFC 6902) operations and PATCH /api/songs/{id}"""
+import pytest
+
+from app.json_patch import JsonPatchError, JsonPatchTestFailed, apply_patch, touched_fields
+from app.storage.base import READ_ONLY_FIELDS
+from tests.helpers import create_song
+
+DOCUMENT = {"title": "Song", "tags": ["a", "b"], "meta": {"key": "C"}}
+
+
+@pytest.mark.parametrize("operation, expected", [
+    ({"op": "add", "path": "/tags/1", "value": "x"}, {**DOCUMENT, "tags": ["a", "x", "b"]}),
+    ({"op": "add", "path": "/tags/-", "value": "c"}, {**DOCUMENT, "tags": ["a", "b", "c"]}),
+    ({"op": "add", "path": "/meta/mode", "value": "major"}, {**DOCUMENT, "meta": {"key": "C", "mode": "major"}}),
+    ({"op": "remove", "path": "/tags/0"}, {**DOCUMENT, "tags": ["b"]}),
+    ({"op": "replace", "path": "/title", "value": "New"}, {**DOCUMENT, "title": "New"}),
+    ({"op": "move", "from": "/meta/key", "path": "/key"}, {**DOCUMENT, "meta": {}, "key": "C"}),
+    ({"op": "copy", "from": "/tags/0", "path": "/tags/-"}, {**DOCUMENT, "tags": ["a", "b", "a"]}),
+    ({"op": "test", "path": "/meta/key", "value": "C"}, DOCUMENT),
+])
+def test_operations(operation, expected):
+    assert apply_patch(DOCUMENT, [operation]) == expected
+
+
+def test_escaped_pointer_tokens():
+    document = {"a/b": 1, "m~n": 2}
+    assert apply_patch(document, [{"op": "replace", "path": "/a~1b", "value": 3}])["a/b"] == 3
+    assert apply_patch(document, [{"op": "remove", "path": "/m~0n"}]) == {"a/b": 1}
+
+
+@pytest.mark.parametrize("operation", [
+    {"op": "remove", "path": "/missing"},
+    {"op": "replace", "path": "/tags/5", "value": 1},
+    {"op": "add", "path": "/tags/01", "value": 1},
+    {"op": "add", "path": "title", "value": 1},
+    {"op": "add", "path": "/title"},
+    {"op": "move", "from": "/meta", "path": "/meta/inner"},
+    {"op": "frobnicate", "path": "/title"},
+])
+def test_invalid_operations(operation):
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOCUMENT, [operation])
+
+
+def test_failed_test_leaves_document_untouched():
+    document = {"title": "Song", "tags": ["a"]}
+    with pytest.raises(JsonPatchTestFailed):
+        apply_patch(document, [
+            {"op": "replace", "path": "/title", "value": "Changed"},
+            {"op": "test", "path": "/tags/0", "value": "z"}
+        ])
+    assert document == {"title": "Song", "tags": ["a"]}
+
+
+def test_touched_fields_ignores_tests():
+    assert touched_fields([
+        {"op": "test", "path": "/id", "value": 1},
+        {"op": "move", "from": "/description", "path": "/title"}
+    ]) == {"description", "title"}
+
+
+def test_patch_song(client):
+    song = create_song(client)
+    section = {"label": "A", "start_measure": 1, "start_beat": 1, "end_measure": 2, "end_beat": 1}
+
+    response = client.patch(f"/api/songs/{song['id']}", json=[
+        {"op": "test", "path": "/title", "value": song["title"]},
+        {"op": "replace", "path": "/title", "value": "Patched"},
+        {"op": "add", "path": "/practice_sections/-", "value": section}
+    ])
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["song"]["title"] == "Patched"
+    assert [s["label"] for s in body["song"]["practice_sections"]] == ["A"]
+    assert response.headers["ETag"] == client.get(f"/api/songs/{song['id']}").headers["ETag"]
+
+
+def test_patch_song_failed_test_is_conflict(client):
+    song = create_song(client)
+    response = client.patch(f"/api/songs/{song['id']}", json=[
+        {"op": "replace", "path": "/title", "value": "Patched"},
+        {"op": "test", "path": "/title", "value": "Something else"}
+    ])
+    assert response.status_code == 409
+    assert client.get(f"/api/songs/{song['id']}").json()["song"]["title"] == song["title"]
+
+
+@pytest.mark.parametrize("field", READ_ONLY_FIELDS)
+def test_patch_song_rejects_read_only_fields(client, field):
+    song = create_song(client)
+    value = {
+        "id": "00000000-0000-0000-0000-000000000000",
+        "created_at": "2000-01-01T00:00:00",
+        "updated_at": "2000-01-01T00:00:00",
+        "midi_sha256": "0" * 64,
+        "score_sha256": "0" * 64
+    }.get(field, "song.mid")
+
+    response = client.patch(f"/api/songs/{song['id']}", json=[{"op": "add", "path": f"/{field}", "value": value}])
+
+    assert response.status_code == 422, response.text
+    assert client.get(f"/api/songs/{song['id']}").json()["song"] == song
+
+
+def test_patch_song_invalid_result_is_unprocessable(client):
+    song = create_song(client)
+    response = client.patch(f"/api/songs/{song['id']}", json=[{"op": "replace", "path": "/practice_sections", "value": 5}])
+    assert response.status_code == 422
+
+
+def test_patch_missing_song(client):
+    response = client.patch("/api/songs/00000000-0000-0000-0000-000000000000", json=[
+        {"op": "replace", "path": "/title", "value": "x"}
+    ])
+    assert response.status_code == 404
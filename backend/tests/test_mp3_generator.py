@@ -0,0 +1,30 @@
+"""Stem caching of the builtin render engine"""
+import numpy as np
+
+from app import mp3_generator
+from app.mp3_generator import StemStats, _cached_stem
+
+
+def test_stored_stem_is_reused(tmp_path):
+    path = tmp_path / "stem.npy"
+    stem, rendered = _cached_stem(path, lambda: np.ones(8, dtype=np.float32))
+    assert rendered and path.exists()
+
+    stem, rendered = _cached_stem(path, lambda: np.zeros(8, dtype=np.float32))
+    assert not rendered
+    assert np.array_equal(stem, np.ones(8))
+
+
+def test_stem_that_could_not_be_stored_counts_as_rendered(tmp_path, monkeypatch):
+    def failing_save(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(mp3_generator.np, "save", failing_save)
+    path = tmp_path / "stem.npy"
+    stem, rendered = _cached_stem(path, lambda: np.ones(8, dtype=np.float32))
+
+    assert rendered and not path.exists()
+    assert list(tmp_path.iterdir()) == []
+    stats = StemStats()
+    stats.record([{"key": "stem", "path": str(path), "rendered": rendered}])
+    assert stats.stats()["stems_reused"] == 0
@@ -0,0 +1,55 @@
+"""The event loop keeps serving requests while a large MIDI file is uploaded and parsed"""
+import asyncio
+import statistics
+import time
+
+import httpx
+import pytest
+
+from app.main import app
+from benchmarks.synthetic import make_midi
+
+# About 0.5 MB; analysis takes around a second
+LARGE_MIDI = (1500, 8)
+
+
+async def _health_latency(client: httpx.AsyncClient) -> float:
+    start = time.perf_counter()
+    response = await client.get("/api/health")
+    assert response.status_code == 200
+    return time.perf_counter() - start
+
+
+@pytest.mark.anyio
+async def test_health_latency_stays_flat_during_large_upload(tmp_path):
+    midi_path = tmp_path / "large.mid"
+    make_midi(midi_path, *LARGE_MIDI)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+        song_id = (await client.post("/api/songs", json={"title": "Large"})).json()["song"]["id"]
+        # Warm up the worker pool so process start-up is not part of the measurement
+        baseline = [await _health_latency(client) for _ in range(20)]
+
+        async def upload():
+            start = time.perf_counter()
+            response = await client.post(
+                f"/api/songs/{song_id}/upload/midi",
+                files={"midi_file": ("large.mid", midi_path.read_bytes(), "audio/midi")}
+            )
+            assert response.status_code == 200, response.text
+            return time.perf_counter() - start
+
+        upload_task = asyncio.create_task(upload())
+        during = []
+        while not upload_task.done():
+            during.append(await _health_latency(client))
+            await asyncio.sleep(0.01)
+        upload_seconds = await upload_task
+
+    # The loop was free the whole time: many health checks completed while
+    # the upload ran, and none waited for the parse
+    assert upload_seconds > 0.3
+    assert len(during) >= 10
+    assert max(during) < max(0.1, upload_seconds / 5)
+    assert statistics.median(during) < 10 * statistics.median(baseline) + 0.02
@@ -0,0 +1,52 @@
+"""Size bound of the ad-hoc range caches"""
+import os
+import time
+
+from app.range_cache import touch_range, trim_ranges
+
+
+def write_range(directory, name, size, age):
+    path = directory / name
+    path.write_bytes(b"\0" * size)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+
+def test_least_recently_used_ranges_go_first(tmp_path):
+    oldest = write_range(tmp_path, "range-a.mid", 100, age=3000)
+    older = write_range(tmp_path, "range-b.mid", 100, age=2000)
+    newer = write_range(tmp_path, "range-c.mid", 100, age=1000)
+    touch_range(oldest)
+
+    assert trim_ranges(tmp_path, "range-*.mid", max_bytes=200) == 1
+    assert oldest.exists() and newer.exists()
+    assert not older.exists()
+
+
+def test_only_matching_files_are_trimmed(tmp_path):
+    section = write_range(tmp_path, "section-a.mid", 500, age=5000)
+    write_range(tmp_path, "range-a.mid", 100, age=1000)
+
+    assert trim_ranges(tmp_path, "range-*.mid", max_bytes=100) == 0
+    assert section.exists()
+
+
+def test_kept_and_recently_used_ranges_survive(tmp_path):
+    kept = write_range(tmp_path, "range-a.mid", 100, age=3000)
+    recent = write_range(tmp_path, "range-b.mid", 100, age=0)
+
+    assert trim_ranges(tmp_path, "range-*.mid", max_bytes=0, keep=kept) == 0
+    assert kept.exists() and recent.exists()
+
+
+def test_precompressed_variants_go_with_their_range(tmp_path):
+    old = write_range(tmp_path, "score-a.xml", 100, age=3000)
+    for suffix in (".gz", ".br"):
+        write_range(tmp_path, old.name + suffix, 50, age=3000)
+    new = write_range(tmp_path, "score-b.xml", 100, age=1000)
+    write_range(tmp_path, new.name + ".gz", 50, age=1000)
+
+    # 350 bytes against a budget of 200: the older range goes, with both variants
+    assert trim_ranges(tmp_path, "*.xml", (".gz", ".br"), max_bytes=200) == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["score-b.xml", "score-b.xml.gz"]
@@ -0,0 +1,123 @@
+"""Render cache index shared by several API processes"""
+import json
+import threading
+from uuid import uuid4
+
+from app.render_cache import INDEX_FILENAME, RenderCache
+
+
+def write_render(directory, name, size):
+    path = directory / name
+    path.write_bytes(b"\0" * size)
+    return path
+
+
+def indexed_keys(directory):
+    data = json.loads((directory / INDEX_FILENAME).read_text())
+    return {entry["key"] for entry in data["entries"]}
+
+
+def test_writes_keep_entries_of_other_processes(tmp_path):
+    first = RenderCache(tmp_path, max_bytes=10_000)
+    second = RenderCache(tmp_path, max_bytes=10_000)
+    first.load()
+    second.load()
+
+    first.put("a", write_render(tmp_path, "a.mp3", 100))
+    second.put("b", write_render(tmp_path, "b.mp3", 100))
+
+    assert indexed_keys(tmp_path) == {"a", "b"}
+    assert first.get("b") == tmp_path / "b.mp3"
+
+
+def test_budget_covers_renders_of_all_processes(tmp_path):
+    first = RenderCache(tmp_path, max_bytes=250)
+    second = RenderCache(tmp_path, max_bytes=250)
+    first.load()
+    second.load()
+
+    first.put("a", write_render(tmp_path, "a.mp3", 100))
+    second.put("b", write_render(tmp_path, "b.mp3", 100))
+    first.put("c", write_render(tmp_path, "c.mp3", 100))
+
+    assert not (tmp_path / "a.mp3").exists()
+    assert indexed_keys(tmp_path) == {"b", "c"}
+    assert first.total_bytes <= 250
+
+
+def test_invalidation_removes_renders_registered_elsewhere(tmp_path):
+    first = RenderCache(tmp_path, max_bytes=10_000)
+    second = RenderCache(tmp_path, max_bytes=10_000)
+    first.load()
+    second.load()
+
+    first.put("a", write_render(tmp_path, "a.mp3", 100), "song-1")
+
+    assert second.invalidate_song("song-1") == 1
+    assert not (tmp_path / "a.mp3").exists()
+    assert first.get("a") is None
+
+
+def test_unregistered_stems_count_towards_the_budget(tmp_path):
+    cache = RenderCache(tmp_path, max_bytes=250)
+    cache.load()
+    # A render job wrote its stems, then failed before registering anything
+    write_render(tmp_path, "stem1.npy", 100)
+    write_render(tmp_path, "stem2.npy", 100)
+
+    cache.put("a", write_render(tmp_path, "a.mp3", 100))
+
+    assert cache.total_bytes <= 250
+    assert (tmp_path / "a.mp3").exists()
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+
+
+def test_misses_reread_the_index_only_after_it_changed(tmp_path, monkeypatch):
+    first = RenderCache(tmp_path, max_bytes=10_000)
+    second = RenderCache(tmp_path, max_bytes=10_000)
+    first.load()
+    second.load()
+    reads = []
+    read_index = RenderCache._read_index
+    monkeypatch.setattr(first, "_read_index", lambda: reads.append(1) or read_index(first))
+
+    # The first miss picks up the index second wrote when it loaded, later ones read nothing
+    assert first.get("a") is None
+    assert first.get("a") is None
+    assert first.get("a") is None
+    assert len(reads) == 1
+
+    second.put("a", write_render(tmp_path, "a.mp3", 100))
+    assert first.get("a") == tmp_path / "a.mp3"
+    assert len(reads) == 2
+
+
+def test_stats_do_not_wait_for_a_locked_write(tmp_path):
+    cache = RenderCache(tmp_path, max_bytes=10_000)
+    cache.load()
+    cache.put("a", write_render(tmp_path, "a.mp3", 100))
+    stats = []
+
+    # Another thread is in the middle of a write holding the cache's lock
+    with cache._lock:
+        reader = threading.Thread(target=lambda: stats.append(cache.stats()))
+        reader.start()
+        reader.join(timeout=1)
+        assert not reader.is_alive()
+
+    assert stats[0]["entries"] == 1 and stats[0]["bytes"] == 100
+
+
+def test_lookup_for_a_song_ignores_renders_of_other_songs(tmp_path):
+    cache = RenderCache(tmp_path, max_bytes=10_000)
+    cache.load()
+    song_id, other_id = uuid4(), uuid4()
+    cache.put("a", write_render(tmp_path, "a.mp3", 100), song_id=song_id)
+    # Adopted from disk, so no song is recorded for it
+    write_render(tmp_path, "b.mp3", 100)
+    cache.load()
+
+    assert cache.get("a", song_id=song_id) == tmp_path / "a.mp3"
+    assert cache.get("a", song_id=other_id) is None
+    assert cache.get("b", song_id=song_id) is None
+    assert cache.get("b") == tmp_path / "b.mp3"
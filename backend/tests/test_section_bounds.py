@@ -0,0 +1,50 @@
+"""Section bounds are checked inside the locked write"""
+from uuid import UUID
+
+import pytest
+
+from app.storage import StorageService
+from tests.helpers import create_song, upload_midi
+
+SECTION = {"label": "Verse", "start_measure": 1, "start_beat": 1, "end_measure": 4, "end_beat": 1}
+
+
+def test_out_of_range_sections_are_rejected(client, midi_files):
+    song = create_song(client)
+    upload_midi(client, song["id"], midi_files[0])
+    url = f"/api/songs/{song['id']}/sections"
+
+    assert client.post(url, json={**SECTION, "end_measure": 40}).status_code == 400
+    section_id = client.post(url, json=SECTION).json()["section"]["id"]
+    assert client.put(f"{url}/{section_id}", json={"end_measure": 40}).status_code == 400
+
+    sections = client.get(url).json()["sections"]
+    assert [(s["id"], s["end_measure"]) for s in sections] == [(section_id, 4)]
+
+
+def test_update_check_sees_the_saved_section_merged_with_the_changes(client):
+    song_id = UUID(create_song(client)["id"])
+    section = StorageService.add_practice_section(song_id, SECTION).section
+    # A concurrent edit moved the start after this request was made
+    StorageService.update_practice_section(song_id, section.id, {"start_measure": 3})
+    checked = []
+
+    def check(candidate):
+        checked.append((candidate.start_measure, candidate.end_measure))
+        return "Range end must be after range start" if candidate.end_measure <= candidate.start_measure else None
+
+    with pytest.raises(ValueError):
+        StorageService.update_practice_section(song_id, section.id, {"end_measure": 2}, check=check)
+
+    assert checked == [(3, 2)]
+    saved = StorageService.load_song(song_id).practice_sections[0]
+    assert (saved.start_measure, saved.end_measure) == (3, 4)
+
+
+def test_failed_add_check_saves_nothing(client):
+    song_id = UUID(create_song(client)["id"])
+
+    with pytest.raises(ValueError):
+        StorageService.add_practice_section(song_id, SECTION, check=lambda section: "Out of range")
+
+    assert StorageService.load_song(song_id).practice_sections == []
@@ -0,0 +1,81 @@
+"""SQLite schema migration and timestamp handling"""
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from app.models import Song
+from app.storage.sqlite_backend import SqliteStorageBackend
+
+# A songs table from before the upload hash columns existed
+OLD_SCHEMA = """
+CREATE TABLE songs (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    midi_file TEXT,
+    score_file TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+def make_song(updated_at, title="Song"):
+    return Song(id=uuid4(), title=title, created_at=updated_at, updated_at=updated_at)
+
+
+def test_concurrent_migrations_do_not_collide(tmp_path):
+    db_path = tmp_path / "choirloop.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(OLD_SCHEMA)
+
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def open_backend():
+        backend = SqliteStorageBackend(db_path, tmp_path / "songs")
+        barrier.wait()
+        try:
+            backend.ensure_directories()
+        except sqlite3.Error as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_backend) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with sqlite3.connect(db_path) as conn:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(songs)")}
+    assert {"midi_sha256", "score_sha256"} <= columns
+
+
+def test_timestamps_compare_in_time_order(tmp_path):
+    backend = SqliteStorageBackend(tmp_path / "choirloop.db", tmp_path / "songs")
+    base = datetime(2024, 5, 1, 12, 0, 0)
+    # 13:30+02:00 is 11:30 UTC, before base although its text sorts after it
+    earlier = make_song(datetime(2024, 5, 1, 13, 30, tzinfo=timezone(timedelta(hours=2))), "earlier")
+    on_the_second = make_song(base, "on the second")
+    later = make_song(base + timedelta(microseconds=500), "later")
+    backend.save_songs([earlier, on_the_second, later])
+
+    assert [song.title for song in backend.summaries_since(base)] == ["on the second", "later"]
+    assert backend.catalog_version() == (3, "2024-05-01T12:00:00.000500")
+
+
+def test_legacy_timestamps_are_normalized(tmp_path):
+    db_path = tmp_path / "choirloop.db"
+    backend = SqliteStorageBackend(db_path, tmp_path / "songs")
+    song = make_song(datetime(2024, 5, 1, 12, 0, 0))
+    backend.save_song(song)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "UPDATE songs SET updated_at = ? WHERE id = ?", ("2024-05-01T14:00:00+02:00", str(song.id))
+        )
+
+    reopened = SqliteStorageBackend(db_path, tmp_path / "songs")
+    assert reopened.catalog_version() == (1, "2024-05-01T12:00:00.000000")
+    assert reopened.load_song(song.id).updated_at == datetime(2024, 5, 1, 12, 0, 0)
@@ -0,0 +1,92 @@
+"""Streaming renders shared by the listeners of one render job"""
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from app import mp3_generator
+from app.mp3_generator import MP3GeneratorService, render_wav
+from app.render_queue import RenderJob
+
+
+def make_job(settings_hash="a" * 64):
+    return RenderJob(
+        id=str(uuid4()),
+        settings_hash=settings_hash,
+        song_id=uuid4(),
+        priority=0,
+        func=render_wav,
+        args=({"settings_hash": settings_hash},)
+    )
+
+
+@pytest.fixture
+def synthesis(monkeypatch):
+    """Replace the synthesizer with one that yields a chunk each time it is released"""
+    state = {"started": 0, "running": 0, "peak": 0, "release": asyncio.Queue()}
+
+    async def fake_stream_wav(settings):
+        state["started"] += 1
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        try:
+            while True:
+                chunk = await state["release"].get()
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            state["running"] -= 1
+
+    monkeypatch.setattr(mp3_generator, "stream_wav", fake_stream_wav)
+    yield state
+    mp3_generator._broadcasts.clear()
+
+
+async def collect(stream):
+    return b"".join([chunk async for chunk in stream])
+
+
+@pytest.mark.anyio
+async def test_listeners_share_one_synthesis(synthesis):
+    job = make_job()
+    first = asyncio.create_task(collect(MP3GeneratorService.stream_job(job)))
+    await synthesis["release"].put(b"one ")
+    await asyncio.sleep(0.01)
+
+    # A late listener still gets the whole stream from the start
+    second = asyncio.create_task(collect(MP3GeneratorService.stream_job(job)))
+    await synthesis["release"].put(b"two")
+    await synthesis["release"].put(None)
+
+    assert await first == b"one two"
+    assert await second == b"one two"
+    assert synthesis["started"] == 1
+    job.done.set()
+
+
+@pytest.mark.anyio
+async def test_synthesis_stops_without_listeners(synthesis):
+    job = make_job()
+    stream = MP3GeneratorService.stream_job(job)
+    await synthesis["release"].put(b"one")
+    assert await stream.__anext__() == b"one"
+
+    await stream.aclose()
+    await asyncio.sleep(0.01)
+    assert synthesis["running"] == 0
+    assert job.settings_hash not in mp3_generator._broadcasts
+
+
+@pytest.mark.anyio
+async def test_concurrent_syntheses_are_bounded(synthesis, monkeypatch):
+    monkeypatch.setattr(mp3_generator, "_stream_slots", asyncio.Semaphore(1))
+    streams = [MP3GeneratorService.stream_job(make_job(c * 64)) for c in "ab"]
+    tasks = [asyncio.create_task(collect(stream)) for stream in streams]
+    for _ in range(2):
+        await asyncio.sleep(0.01)
+        assert synthesis["running"] == 1
+        await synthesis["release"].put(None)
+
+    await asyncio.gather(*tasks)
+    assert synthesis["peak"] == 1
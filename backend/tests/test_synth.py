@@ -0,0 +1,37 @@
+"""Note cache of the built-in synthesizer"""
+import numpy as np
+
+from app.synth import _NoteCache, note_samples
+
+
+def test_note_cache_is_bounded_by_size():
+    cache = _NoteCache(max_bytes=3 * 400)
+    for pitch in range(5):
+        cache.put((pitch, 100, 22050), np.zeros(100, dtype=np.float32))
+
+    assert cache.bytes == 3 * 400
+    assert cache.get((0, 100, 22050)) is None
+    assert cache.get((4, 100, 22050)) is not None
+
+
+def test_least_recently_used_notes_go_first():
+    cache = _NoteCache(max_bytes=2 * 400)
+    cache.put((60, 100, 22050), np.zeros(100, dtype=np.float32))
+    cache.put((62, 100, 22050), np.zeros(100, dtype=np.float32))
+    cache.get((60, 100, 22050))
+    cache.put((64, 100, 22050), np.zeros(100, dtype=np.float32))
+
+    assert cache.get((60, 100, 22050)) is not None
+    assert cache.get((62, 100, 22050)) is None
+
+
+def test_notes_larger_than_the_budget_are_not_cached():
+    cache = _NoteCache(max_bytes=100)
+    cache.put((60, 100, 22050), np.zeros(100, dtype=np.float32))
+    assert cache.bytes == 0
+
+
+def test_cached_notes_are_shared_and_read_only():
+    first = note_samples(60, 2205)
+    assert note_samples(60, 2205) is first
+    assert not first.flags.writeable
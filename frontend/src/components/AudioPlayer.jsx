@@ -153,10 +153,10 @@ function AudioPlayer({ songId, songDetails, selectedSection, onSectionChange, my
     let startTime = 0;
     let endTime = midi.duration;
     
-    // Calculate section times if provided
+    // Section times come from the sections API (computed from the MIDI tempo and meter map)
     if (section) {
-      startTime = calculateSectionTime(section.start_measure, section.start_beat);
-      endTime = calculateSectionTime(section.end_measure, section.end_beat);
+      startTime = section.start_time ?? 0;
+      endTime = section.end_time ?? midi.duration;
       console.log('[AudioPlayer] Section times:', startTime, 'to', endTime, 'seconds');
     }
 
@@ -201,22 +201,17 @@ function AudioPlayer({ songId, songDetails, selectedSection, onSectionChange, my
     console.log('[AudioPlayer] Total setupAudio took:', (performance.now() - setupStart).toFixed(2), 'ms');
   };
 
-  const calculateSectionTime = (measure, beat) => {
-    // Calculate time in seconds based on measure and beat
-    // Assumes 4/4 time signature by default
-    const beatsPerMeasure = timeSignature.current.beatsPerMeasure;
-    const secondsPerBeat = 60 / (baseTempo.current * (tempo / 100));
-    
-    const totalBeats = ((measure - 1) * beatsPerMeasure) + (beat - 1);
-    return totalBeats * secondsPerBeat;
+  const getSectionDuration = () => {
+    // Section times are at the original tempo; playback runs at tempo %
+    if (!selectedSection) return midiData.duration;
+    const startTime = selectedSection.start_time ?? 0;
+    const endTime = selectedSection.end_time ?? midiData.duration;
+    return (endTime - startTime) / (tempo / 100);
   };
 
   const scheduleLoop = (loopNumber, startOffset) => {
     // Calculate durations
-    let sectionDuration = selectedSection 
-      ? calculateSectionTime(selectedSection.end_measure, selectedSection.end_beat) - 
-        calculateSectionTime(selectedSection.start_measure, selectedSection.start_beat)
-      : midiData.duration;
+    let sectionDuration = getSectionDuration();
     
     const beatDuration = 60 / Tone.Transport.bpm.value;
     const countInDuration = beatDuration * timeSignature.current.beatsPerMeasure;
@@ -291,10 +286,7 @@ function AudioPlayer({ songId, songDetails, selectedSection, onSectionChange, my
           const beatDuration = 60 / Tone.Transport.bpm.value;
           const countInDuration = beatDuration * timeSignature.current.beatsPerMeasure;
           
-          let sectionDuration = selectedSection 
-            ? calculateSectionTime(selectedSection.end_measure, selectedSection.end_beat) - 
-              calculateSectionTime(selectedSection.start_measure, selectedSection.start_beat)
-            : midiData.duration;
+          let sectionDuration = getSectionDuration();
           
           // Schedule count-in clicks for first iteration only
           for (let i = 0; i < timeSignature.current.beatsPerMeasure; i++) {
@@ -415,7 +407,16 @@ function AudioPlayer({ songId, songDetails, selectedSection, onSectionChange, my
         end_beat: selectedSection?.end_beat || null
       });
       
-      setMp3Hash(response.data.settings_hash);
+      // Rendering runs as a background job; wait for it to finish
+      let job = response.data;
+      while (job.status === 'queued' || job.status === 'running') {
+        job = (await apiClient.get(`/songs/${songId}/render-jobs/${job.job_id}`, { params: { wait: 30 } })).data;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Rendering failed');
+      }
+      
+      setMp3Hash(job.settings_hash);
       alert(response.data.cached ? 'MP3 already exists!' : 'MP3 generated successfully!');
     } catch (err) {
       setError('Failed to generate MP3: ' + (err.response?.data?.detail || err.message));
@@ -432,6 +433,19 @@ function AudioPlayer({ songId, songDetails, selectedSection, onSectionChange, my
     }
   };
 
+  const applyDeeplinkSection = async (sectionId) => {
+    try {
+      const apiClient = (await import('../api/client')).default;
+      const response = await apiClient.get(`/songs/${songId}/sections`);
+      const section = response.data.sections.find(s => s.id === sectionId);
+      if (section) {
+        onSectionChange(section);
+      }
+    } catch (err) {
+      console.error('[AudioPlayer] Failed to load deeplink section:', err);
+    }
+  };
+
   const applyDeeplinkSettings = () => {
     console.log('Applying deeplink settings:', deeplinkSettings);
     
@@ -463,12 +477,9 @@ function AudioPlayer({ songId, songDetails, selectedSection, onSectionChange, my
       }));
     }
     
-    // Apply section if specified
-    if (deeplinkSettings.sectionId && songDetails?.practice_sections) {
-      const section = songDetails.practice_sections.find(s => s.id === deeplinkSettings.sectionId);
-      if (section && onSectionChange) {
-        onSectionChange(section);
-      }
+    // Apply section if specified (from the sections API, which includes its times)
+    if (deeplinkSettings.sectionId && onSectionChange) {
+      applyDeeplinkSection(deeplinkSettings.sectionId);
     }
     
     // If in guided mode with a step, apply it
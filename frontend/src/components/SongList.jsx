@@ -1,22 +1,33 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import apiClient from '../api/client';
 import FileUpload from './FileUpload';
 import PracticeSections from './PracticeSections';
 import AudioPlayer from './AudioPlayer';
 import VoiceConfiguration from './VoiceConfiguration';
 
+const PAGE_SIZE = 50;
+
 function SongList() {
   const [songs, setSongs] = useState([]);
+  const [total, setTotal] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [search, setSearch] = useState('');
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [newSong, setNewSong] = useState({ title: '', description: '' });
   const [selectedSong, setSelectedSong] = useState(null);
   const [songDetails, setSongDetails] = useState(null);
   const [selectedPracticeSection, setSelectedPracticeSection] = useState(null);
+  // Controller of the song list request in flight; a newer request aborts it
+  const listRequest = useRef(null);
 
+  // Search on the server, debounced while typing
   useEffect(() => {
-    fetchSongs();
-  }, []);
+    const timer = setTimeout(() => fetchSongs(), search ? 250 : 0);
+    return () => clearTimeout(timer);
+  }, [search]);
+
+  useEffect(() => () => listRequest.current?.abort(), []);
 
   useEffect(() => {
     if (selectedSong) {
@@ -24,17 +35,30 @@ function SongList() {
     }
   }, [selectedSong]);
 
-  const fetchSongs = async () => {
+  const fetchSongs = async (cursor = null) => {
+    listRequest.current?.abort();
+    const controller = new AbortController();
+    listRequest.current = controller;
     try {
       setLoading(true);
-      const response = await apiClient.get('/songs');
-      setSongs(response.data.songs);
+      const response = await apiClient.get('/songs', {
+        params: { q: search || undefined, sort: 'title', limit: PAGE_SIZE, cursor: cursor || undefined },
+        signal: controller.signal
+      });
+      setSongs(previous => cursor ? [...previous, ...response.data.songs] : response.data.songs);
+      setTotal(response.data.total);
+      setNextCursor(response.data.next_cursor);
       setError(null);
     } catch (err) {
+      if (controller.signal.aborted) return;
       setError('Failed to fetch songs: ' + err.message);
       console.error('Error fetching songs:', err);
     } finally {
-      setLoading(false);
+      // A newer request owns the loading state
+      if (listRequest.current === controller) {
+        listRequest.current = null;
+        setLoading(false);
+      }
     }
   };
 
@@ -90,7 +114,8 @@ function SongList() {
     setSelectedPracticeSection(section);
   };
 
-  if (loading) return <div style={{ padding: '20px' }}>Loading songs...</div>;
+  // Only the first load replaces the page; later ones keep the search field mounted
+  if (loading && songs.length === 0 && !search) return <div style={{ padding: '20px' }}>Loading songs...</div>;
 
   // Detail view
   if (selectedSong && songDetails) {
@@ -200,10 +225,21 @@ function SongList() {
         </form>
       </div>
 
-      <h2>Songs ({songs.length})</h2>
+      <h2>
+        Songs ({total})
+        {loading && <span style={{ fontSize: '14px', fontWeight: 'normal', color: '#999', marginLeft: '10px' }}>Loading...</span>}
+      </h2>
+
+      <input
+        type="search"
+        placeholder="Search title, description or voice"
+        value={search}
+        onChange={(e) => setSearch(e.target.value)}
+        style={{ width: '100%', padding: '8px', fontSize: '16px', marginBottom: '15px', borderRadius: '4px', border: '1px solid #ddd' }}
+      />
       
       {songs.length === 0 ? (
-        <p>No songs yet. Create one above!</p>
+        <p>{search ? 'No songs match your search.' : 'No songs yet. Create one above!'}</p>
       ) : (
         <div style={{ display: 'grid', gap: '15px' }}>
           {songs.map(song => (
@@ -253,6 +289,16 @@ function SongList() {
           ))}
         </div>
       )}
+
+      {nextCursor && (
+        <button
+          onClick={() => fetchSongs(nextCursor)}
+          disabled={loading}
+          style={{ marginTop: '15px', padding: '8px 16px', background: '#6c757d', color: 'white', border: 'none', borderRadius: '4px', cursor: 'pointer' }}
+        >
+          Load more
+        </button>
+      )}
     </div>
   );
 }